@@ -139,3 +139,94 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Event engine
+
+# 为True时每个用户的事件引擎使用AsyncEventBus，标签触发器可以是async def函数并发执行
+EVENTBUS_ASYNC = False
+
+# 大于0时所有用户的事件引擎共享一个该大小的线程池，注册为independent的立即触发器会在其中并行执行
+EVENTBUS_DISPATCH_WORKERS = 0
+
+# 事件引擎逐事件日志的最低级别，生产环境可设为'WARNING'，此时逐事件日志不产生格式化开销
+EVENTBUS_LOG_LEVEL = 'INFO'
+
+# 逐事件日志的采样率，每N个事件记录1个
+EVENTBUS_LOG_SAMPLE_RATE = 1
+
+# 开启完整追踪的用户id，这些用户的事件引擎忽略日志级别与采样率
+EVENTBUS_TRACE_USERS = []
+
+# 安装事件引擎时发现触发器之间存在事件循环（事件风暴）的处理方式：
+# 'reject'拒绝安装，'budget'为每个循环设置预算，'ignore'只记录日志
+EVENTBUS_CYCLE_POLICY = 'budget'
+
+# 'budget'策略下每个事件循环在一次触发请求中最多处理的事件数
+EVENTBUS_CYCLE_BUDGET = 1000
+
+# 为每个用户的事件引擎收集每个事件、每个触发器的调用次数与耗时，通过GET /api/event-metrics拉取
+EVENTBUS_METRICS = True
+
+# 指标中按事件名统计的事件数上限，超过后新的事件名（如大量不同的主题）合并记录到'<other>'中
+EVENTBUS_METRICS_MAX_EVENTS = 4096
+
+# 事件日志的根目录，每个用户的事件引擎将发布和处理的事件追加写入<根目录>/<用户id>/，重启后启动事件引擎时重放以恢复状态
+# 为None时不记录事件日志
+EVENTBUS_JOURNAL_DIR = None
+
+# 单个日志段文件的大小上限（字节）
+EVENTBUS_JOURNAL_SEGMENT_SIZE = 64 * 1024 * 1024
+
+# 两次fsync的最短间隔（秒），日志在每次处理结束时写入文件，但只有超过该间隔才fsync
+EVENTBUS_JOURNAL_FSYNC_INTERVAL = 0.1
+
+# 优先级车道的防饿死阈值：非空车道最多连续被跳过的次数，达到后先处理该车道的一个事件
+EVENTBUS_STARVATION_LIMIT = 64
+
+# 事件总线快照目录，每个用户的快照为<用户id>.snapshot，为None时不使用快照
+# POST /api/event-snapshot保存快照，之后GET /api/start-event-engine优先从快照恢复
+EVENTBUS_SNAPSHOT_DIR = None
+
+# 安装标签后是否冻结事件总线的监听器结构（见EventBus.freeze()），冻结后仍可以增量安装、卸载标签
+EVENTBUS_FREEZE = True
+
+# 主题监听器（EventBus.TOPIC）按事件名缓存匹配结果，缓存的事件名数超过该值时清空缓存
+EVENTBUS_TOPIC_CACHE_SIZE = 65536
+
+# 事件引擎的运行方式：'inline'在触发请求中调用触发器并处理事件直到队列为空；
+# 'worker'为每个用户的事件引擎启动一个后台线程持续处理事件，触发请求只提交任务并立即返回202（不能与EVENTBUS_ASYNC同时使用）；
+# 'scheduler'与'worker'相同，但所有用户的事件引擎由一个后台线程按加权时间片轮流处理，并限制每个用户的用量
+EVENTBUS_ENGINE_MODE = 'inline'
+
+# 'worker'与'scheduler'模式下触发请求带wait=true参数时最多等待的秒数，超时返回202，事件仍在后台继续处理
+EVENTBUS_WORKER_WAIT_TIMEOUT = 30
+
+# 'worker'与'scheduler'模式下后台线程每次处理的步数上限与批次大小，见EventBus.process()
+EVENTBUS_WORKER_MAX_STEP = 10000
+EVENTBUS_WORKER_BATCH_SIZE = 1
+
+# 'scheduler'模式下每个时间片的基准步数与毫秒数（先到者为准），用户的时间片为基准值乘以权重
+EVENTBUS_SCHEDULER_SLICE_STEPS = 100
+EVENTBUS_SCHEDULER_SLICE_MS = 5
+
+# 'scheduler'模式下配额窗口的秒数，以及每个用户在窗口内默认的步数与毫秒配额（None为不限制），超过配额的用户直到窗口结束前不再被调度
+EVENTBUS_SCHEDULER_QUOTA_WINDOW = 1.0
+EVENTBUS_SCHEDULER_STEP_QUOTA = None
+EVENTBUS_SCHEDULER_TIME_QUOTA_MS = None
+
+# 'scheduler'模式下单独设置的用户权重与配额，{<用户id>: <权重>}、{<用户id>: (<步数配额>, <毫秒配额>)}
+EVENTBUS_TENANT_WEIGHTS = {}
+EVENTBUS_TENANT_QUOTAS = {}
+
+# 事件引擎分片进程数，为0时事件引擎运行在处理请求的进程中；大于0时由`python manage.py run_eventbus_shards`启动的分片进程
+# 按用户id的一致性哈希各自持有一部分用户的事件引擎，所有Django进程将事件引擎相关的请求转发到用户所在的分片
+EVENTBUS_SHARDS = 0
+
+# 分片i监听EVENTBUS_SHARD_HOST:EVENTBUS_SHARD_BASE_PORT + i，连接的认证密钥为None时由SECRET_KEY派生
+EVENTBUS_SHARD_HOST = '127.0.0.1'
+EVENTBUS_SHARD_BASE_PORT = 6300
+EVENTBUS_SHARD_AUTHKEY = None
+
+# 转发请求时等待分片响应的最长秒数，超时返回504
+EVENTBUS_SHARD_TIMEOUT = 60
@@ -1,7 +1,22 @@
+import functools
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
 from django.apps import AppConfig
+from django.conf import settings
 from loguru import logger
 
+from api.event.async_event_engine import AsyncEventBus
+from api.event.event_engine import EventBus
+from api.event.event_logger import EventLogger
+from api.event.event_metrics import EventBusMetrics
+from api.event.event_queue import EventQueue
+from api.event.eventbus_object_pool import EventBusObjectPool
+from api.event.eventbus_scheduler import EventBusScheduler
+from api.event.eventbus_shard import EventBusShardRouter
+from api.event.eventbus_worker import EventBusWorker
 from api.models.register import ModelRegister
+from labels.models.trigger_graph_analyzer import TriggerGraphAnalyzer
 
 
 class ApiConfig(AppConfig):
@@ -10,6 +25,66 @@ class ApiConfig(AppConfig):
     verbose_name = "Main"
 
     def ready(self):
+        # 标签模型需要在应用注册表加载后导入
+        from labels.models.label_trigger_manager import LabelTriggerManager
+
         ModelRegister.load_all_characters()
         ModelRegister.check_registered()
+
+        EventLogger.configure(
+            level=getattr(settings, 'EVENTBUS_LOG_LEVEL', 'INFO'),
+            sample_rate=getattr(settings, 'EVENTBUS_LOG_SAMPLE_RATE', 1)
+        )
+        cycle_policy = getattr(settings, 'EVENTBUS_CYCLE_POLICY', TriggerGraphAnalyzer.BUDGET)
+        if cycle_policy not in TriggerGraphAnalyzer.POLICIES:
+            raise ValueError(f"EVENTBUS_CYCLE_POLICY must be one of {TriggerGraphAnalyzer.POLICIES}, got <{cycle_policy}>")
+        TriggerGraphAnalyzer.policy = cycle_policy
+        TriggerGraphAnalyzer.cycle_budget = getattr(settings, 'EVENTBUS_CYCLE_BUDGET', 1000)
+        EventBus.topic_cache_size = getattr(settings, 'EVENTBUS_TOPIC_CACHE_SIZE', 65536)
+        EventQueue.starvation_limit = getattr(settings, 'EVENTBUS_STARVATION_LIMIT', 64)
+        EventBusObjectPool.metrics_enabled = getattr(settings, 'EVENTBUS_METRICS', True)
+        EventBusMetrics.max_events = getattr(settings, 'EVENTBUS_METRICS_MAX_EVENTS', 4096)
+        EventBusObjectPool.journal_dir = getattr(settings, 'EVENTBUS_JOURNAL_DIR', None)
+        EventBusObjectPool.journal_options = {
+            'segment_size': getattr(settings, 'EVENTBUS_JOURNAL_SEGMENT_SIZE', 64 * 1024 * 1024),
+            'fsync_interval': getattr(settings, 'EVENTBUS_JOURNAL_FSYNC_INTERVAL', 0.1),
+        }
+        EventBusObjectPool.snapshot_dir = getattr(settings, 'EVENTBUS_SNAPSHOT_DIR', None)
+        LabelTriggerManager.freeze_installed = getattr(settings, 'EVENTBUS_FREEZE', True)
+        EventBusObjectPool.trace_users = {str(user_id) for user_id in getattr(settings, 'EVENTBUS_TRACE_USERS', [])}
+
+        engine_mode = getattr(settings, 'EVENTBUS_ENGINE_MODE', EventBusObjectPool.INLINE)
+        if engine_mode not in EventBusObjectPool.ENGINE_MODES:
+            raise ValueError(f"EVENTBUS_ENGINE_MODE must be one of {EventBusObjectPool.ENGINE_MODES}, got <{engine_mode}>")
+        if engine_mode != EventBusObjectPool.INLINE and getattr(settings, 'EVENTBUS_ASYNC', False):
+            raise ValueError(f"EVENTBUS_ENGINE_MODE '{engine_mode}' cannot be used with EVENTBUS_ASYNC")
+        EventBusObjectPool.engine_mode = engine_mode
+        EventBusWorker.wait_timeout = getattr(settings, 'EVENTBUS_WORKER_WAIT_TIMEOUT', 30)
+        EventBusWorker.max_step = EventBusScheduler.max_step = getattr(settings, 'EVENTBUS_WORKER_MAX_STEP', 10000)
+        EventBusWorker.batch_size = EventBusScheduler.batch_size = getattr(settings, 'EVENTBUS_WORKER_BATCH_SIZE', 1)
+        EventBusScheduler.slice_steps = getattr(settings, 'EVENTBUS_SCHEDULER_SLICE_STEPS', 100)
+        EventBusScheduler.slice_ms = getattr(settings, 'EVENTBUS_SCHEDULER_SLICE_MS', 5)
+        EventBusScheduler.quota_window = getattr(settings, 'EVENTBUS_SCHEDULER_QUOTA_WINDOW', 1.0)
+        EventBusScheduler.step_quota = getattr(settings, 'EVENTBUS_SCHEDULER_STEP_QUOTA', None)
+        EventBusScheduler.time_quota_ms = getattr(settings, 'EVENTBUS_SCHEDULER_TIME_QUOTA_MS', None)
+        EventBusObjectPool.tenant_weights = {str(user_id): weight for user_id, weight
+                                             in getattr(settings, 'EVENTBUS_TENANT_WEIGHTS', {}).items()}
+        EventBusObjectPool.tenant_quotas = {str(user_id): tuple(quota) for user_id, quota
+                                            in getattr(settings, 'EVENTBUS_TENANT_QUOTAS', {}).items()}
+
+        authkey = getattr(settings, 'EVENTBUS_SHARD_AUTHKEY', None)
+        EventBusShardRouter.configure(
+            getattr(settings, 'EVENTBUS_SHARDS', 0),
+            host=getattr(settings, 'EVENTBUS_SHARD_HOST', '127.0.0.1'),
+            base_port=getattr(settings, 'EVENTBUS_SHARD_BASE_PORT', 6300),
+            authkey=authkey.encode('utf-8') if authkey is not None else hashlib.sha256(settings.SECRET_KEY.encode('utf-8')).digest(),
+            timeout=getattr(settings, 'EVENTBUS_SHARD_TIMEOUT', 60)
+        )
+
+        dispatch_workers = getattr(settings, 'EVENTBUS_DISPATCH_WORKERS', 0)
+        if getattr(settings, 'EVENTBUS_ASYNC', False):
+            EventBusObjectPool.event_bus_factory = AsyncEventBus
+        elif dispatch_workers > 0:
+            dispatch_executor = ThreadPoolExecutor(max_workers=dispatch_workers, thread_name_prefix='eventbus-dispatch')
+            EventBusObjectPool.event_bus_factory = functools.partial(EventBus, dispatch_executor=dispatch_executor)
         logger.success(f'Admin page url: http://127.0.0.1:8000/admin/, admin account: root, Rootpassword')
\ No newline at end of file
@@ -0,0 +1,153 @@
+import asyncio
+import functools
+import inspect
+from typing import Callable, List, Optional, Set
+
+from loguru import logger
+
+from api.event.event_engine import EventBus
+from api.event.event_queue import EventQueue
+
+
+class AsyncEventBus(EventBus):
+    """
+    基于asyncio的事件总线，监听器类型（IMMEDIATE, DELAY, JOINT, PATTERN, TOPIC）与装饰器接口与EventBus相同\n
+    1. 回调可以是普通函数，也可以返回一个可等待对象（如async def触发器），可等待对象会被包装为asyncio.Task并发执行，不会阻塞后续事件的处理
+    2. 普通函数回调仍在事件循环中同步执行，与EventBus的处理顺序一致
+    3. process()是一个协程，直到队列为空且所有由回调产生的任务结束才返回
+    4. 事件队列只会在事件循环所在线程中被访问，因此使用不加锁的EventQueue
+    """
+
+    def __init__(self, maxsize: int = 1000, overflow_policy: str = None, spill_maxsize: int = 0,
+                 max_concurrency: Optional[int] = None):
+        """
+        :param max_concurrency: 同时运行的异步回调数量上限，None为不限制
+        """
+        super().__init__(threaded=False, maxsize=maxsize, overflow_policy=overflow_policy, spill_maxsize=spill_maxsize)
+        self.max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        #尚未结束的异步回调任务
+        self.pending_tasks: Set[asyncio.Task] = set()
+
+        #本次process()中失败的异步回调的异常
+        self.task_errors: List[BaseException] = []
+
+    async def process(self, maxStep=10000, batch_size: int = 1):
+        """
+        循环处理事件，直到队列为空且所有异步回调结束\n
+        异步回调运行期间，队列中的其它事件照常处理；队列为空时等待任意一个异步回调结束（它可能发布新的事件）
+        :param maxStep: 最多处理的事件数（按取出的事件计步，与EventBus.process()一致，合并的事件不计入），防止无限事件循环
+        :param batch_size: 大于1时使用process_batch()批量处理
+        """
+        self._bind_loop()
+        # 与EventBus.process()使用相同的一轮处理开始与结束时的工作
+        self.start_processing()
+        self.task_errors = []
+        steps = 0
+
+        try:
+            while True:
+                while steps < maxStep:
+                    is_done, taken = self.process_steps(min(batch_size, maxStep - steps), batch_size)
+                    steps += taken
+                    if is_done:
+                        break
+                    # 让出事件循环，使异步回调可以推进
+                    await asyncio.sleep(0)
+                else:
+                    logger.critical(f"EVENTBUS: reach step limit {maxStep}, check infinite event loop")
+                    await self._cancel_pending_tasks()
+                    break
+
+                if not self.pending_tasks:
+                    break
+                await asyncio.wait(self.pending_tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.finish_processing()
+
+        if self.task_errors:
+            raise self.task_errors[0]
+
+    def add_immediate_listener(self, source: str, callback: Callable, independent: bool = False,
+                               with_payload: bool = False):
+        # 异步回调本身就是并发执行的，independent只对EventBus的线程池分发有意义
+        return super().add_immediate_listener(source, self._as_task_starter(callback), with_payload=with_payload)
+
+    def add_delayed_listener(self, source: str, delay: int, callback: Callable, with_payload: bool = False):
+        return super().add_delayed_listener(source, delay, self._as_task_starter(callback), with_payload=with_payload)
+
+    def add_timed_listener(self, source: str, delay_ms: int, callback: Callable, with_payload: bool = False):
+        return super().add_timed_listener(source, delay_ms, self._as_task_starter(callback), with_payload=with_payload)
+
+    def add_joint_listener(self, sources: List[str], callback: Callable, with_payload: bool = False,
+                           window_events: Optional[int] = None, window_ms: Optional[int] = None):
+        return super().add_joint_listener(sources, self._as_task_starter(callback), with_payload=with_payload,
+                                          window_events=window_events, window_ms=window_ms)
+
+    def add_pattern_listener(self, pattern: List[str], callback: Callable, with_payload: bool = False):
+        return super().add_pattern_listener(pattern, self._as_task_starter(callback), with_payload=with_payload)
+
+    def add_topic_listener(self, topic: str, callback: Callable, with_payload: bool = False):
+        return super().add_topic_listener(topic, self._as_task_starter(callback), with_payload=with_payload)
+
+    def publish_event(self, event: str, priority: int = EventQueue.NORMAL):
+        """
+        事件发布的装饰器版本，支持async def函数：在协程执行结束后再发布事件\n
+        该装饰器须在监听器装饰器@listen_xxx之前调用（该装饰器在@listen_xx下方）
+        """
+        def decorator(func: Callable):
+            if not inspect.iscoroutinefunction(func):
+                return EventBus.publish_event(self, event, priority)(func)
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                await func(*args, **kwargs)
+                self.publish(event, priority=priority)
+            return wrapper
+        return decorator
+
+    def bind_callback(self, func: Callable, *args, publish: Optional[str] = None,
+                      priority: int = EventQueue.NORMAL) -> Callable:
+        # async def函数需要在协程结束后再发布事件，使用publish_event()的包装
+        if publish is not None and inspect.iscoroutinefunction(func):
+            return functools.partial(self.publish_event(publish, priority)(func), *args)
+        return super().bind_callback(func, *args, publish=publish, priority=priority)
+
+    def _as_task_starter(self, callback: Callable) -> Callable:
+        """将回调包装为一个同步函数：调用回调（with_payload为True时带负载参数），如果返回可等待对象则将其作为任务调度"""
+        @functools.wraps(callback)
+        def task_starter(*args):
+            result = callback(*args)
+            if inspect.isawaitable(result):
+                task = asyncio.ensure_future(self._run_limited(result))
+                task.set_name(callback.__name__)
+                self.pending_tasks.add(task)
+                task.add_done_callback(self._on_task_done)
+        return task_starter
+
+    async def _run_limited(self, awaitable):
+        if self._semaphore is None:
+            return await awaitable
+        async with self._semaphore:
+            return await awaitable
+
+    def _on_task_done(self, task: asyncio.Task):
+        self.pending_tasks.discard(task)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            logger.opt(exception=error).error(f"EVENTBUS: async callback <func: {task.get_name()}> failed")
+            self.task_errors.append(error)
+
+    def _bind_loop(self):
+        # asyncio.Semaphore会绑定到第一次使用它的事件循环，每次process()都可能运行在新的事件循环中（如async_to_sync）
+        if self.max_concurrency is not None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def _cancel_pending_tasks(self):
+        for task in self.pending_tasks:
+            task.cancel()
+        if self.pending_tasks:
+            await asyncio.wait(self.pending_tasks)
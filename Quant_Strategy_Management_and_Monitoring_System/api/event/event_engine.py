@@ -1,11 +1,22 @@
 import functools
-import heapq
-from collections import defaultdict
-from typing import Callable, List, Dict, Set, Deque, Optional
-import queue
+import threading
+import time
+import types
+from collections import deque
+from time import perf_counter_ns
+from concurrent.futures import Executor, wait
+from typing import Callable, List, Dict, Set, Deque, Optional, Iterable, Iterator, Any, Tuple
 
 from loguru import logger
 
+from api.event.event_logger import EventLogger
+from api.event.event_payload import PayloadEvent, CoalescedEvent
+from api.event.event_queue import EventQueue, LockedEventQueue
+from api.event.event_symbol_table import EventSymbolTable
+from api.event.pattern_automaton import PatternAutomaton
+from api.event.timing_wheel import TimingWheel, TimerHandle
+from api.event.topic_trie import TopicTrie
+
 
 class EventBus:
 
@@ -15,154 +26,1182 @@ class EventBus:
     DELAY = 2
     JOINT = 3
     PATTERN = 4
+    TOPIC = 5
+
+    #主题匹配结果缓存的事件名数上限，超过后清空缓存，由api.apps.ApiConfig.ready()根据settings.EVENTBUS_TOPIC_CACHE_SIZE设置
+    topic_cache_size: int = 65536
 
-    def __init__(self):
+    def __init__(self, threaded: bool = True, maxsize: int = 1000, overflow_policy: str = None,
+                 block_timeout: Optional[float] = None, spill_maxsize: int = 0,
+                 dispatch_executor: Optional[Executor] = None, clock: Callable[[], float] = time.monotonic):
+        """
+        :param threaded: 为True时使用加锁的LockedEventQueue；为False时使用不加锁的EventQueue（collections.deque），只能在单线程中使用
+        :param maxsize: 事件队列容量
+        :param overflow_policy: 队列满时的处理策略，见EventQueue，默认多线程模式为BLOCK，单线程模式为DROP_NEWEST
+        :param block_timeout: BLOCK策略下的最长等待秒数，None为一直等待（处理该事件总线的线程在回调中发布事件时不等待，见LockedEventQueue）
+        :param spill_maxsize: SPILL策略下溢出缓冲区的容量
+        :param dispatch_executor: 不为None时启用并行分发，注册为independent的立即触发监听器会被提交到该线程池中并行执行，
+                                  可以在多个事件总线之间共享以限制总线程数，只能在多线程模式下使用
+        :param clock: 定时触发使用的时钟，返回秒数，默认为time.monotonic
+        """
         self.is_install = False #该事件引擎是否被加载过
         self.event_count = 0  # 全局事件计数器
-        self.event_bus = queue.Queue(maxsize=1000)
-
-        #立即触发监听器表，{<监听事件名>:[<可调用对象 1>, <可调用对象 2>, ... }
-        self.immediate_listeners: Dict[str, List[Callable]] = defaultdict(list)
 
-        #延迟触发表，[(触发事件计数, 回调)，(触发事件计数, 回调)，...】
-        self.delayed_tasks: List[tuple] = []  # 最小堆: (触发事件计数, 回调)
+        #逐事件日志，受全局级别、采样率和该事件总线的追踪开关控制
+        self.event_logger = EventLogger()
+
+        if dispatch_executor is not None and not threaded:
+            raise ValueError("EVENTBUS: parallel dispatch requires a threaded event bus")
+        self.dispatch_executor = dispatch_executor
+
+        if threaded:
+            self.event_bus = LockedEventQueue(
+                maxsize=maxsize,
+                overflow_policy=overflow_policy or EventQueue.BLOCK,
+                spill_maxsize=spill_maxsize,
+                block_timeout=block_timeout
+            )
+        else:
+            self.event_bus = EventQueue(
+                maxsize=maxsize,
+                overflow_policy=overflow_policy or EventQueue.DROP_NEWEST,
+                spill_maxsize=spill_maxsize
+            )
+
+        #事件名符号表，注册监听器时为事件名分配编号，各触发表按编号下标访问
+        self.symbols = EventSymbolTable()
+
+        #立即触发监听器表，下标为事件编号，[[<可调用对象 1>, <可调用对象 2>, ...], ...]
+        self.immediate_table: List[List[Callable]] = []
+        #与立即触发监听器表一一对应的订阅句柄，已取消的订阅为None
+        self.immediate_subscriptions: List[List[Optional['Subscription']]] = []
+
+        #注册与取消订阅使用的锁，取消订阅可能发生在处理事件的线程之外（如请求线程卸载标签）
+        self.listener_lock = threading.RLock()
+        #有已取消订阅的监听器等待压缩的事件编号，见compact_listeners()
+        self.removed_ids: Set[int] = set()
+        self.joint_removed = False
+
+        #监听器结构是否已冻结，冻结后每个事件的立即触发监听器、订阅句柄与联合条件为元组，见freeze()
+        self.frozen = False
+        #冻结后的立即触发分发表，与immediate_table一一对应，回调经过_compile_callback()，没有逐个回调的日志与指标时使用
+        self.dispatch_table: List[Tuple[Callable, ...]] = []
+        #冻结后有立即触发监听器被取消订阅的事件编号，非空时正在分发的循环改为逐个检查剩余的监听器，见_subscribed()
+        self.frozen_removed: List[int] = []
+
+        #可以与同一事件的其它立即触发监听器并行执行的监听器
+        self.independent_listeners: Set[Callable] = set()
+
+        #延迟触发表，以事件计数为时间单位的时间轮
+        self.delayed_tasks = TimingWheel(start=self.event_count)
+
+        #定时触发表，以毫秒为时间单位的时间轮
+        self.clock = clock
+        self.timed_tasks = TimingWheel(start=self._now_ms())
 
         #联合触发表
         self.joint_conditions: List['JointCondition'] = []
 
-        #模式触发表
+        #模式触发表，下标即该模式在pattern_automaton中的模式编号
         self.pattern_matchers: List['PatternMatcher'] = []
 
-    def publish(self,event: str):
-        """发布事件，将事件放入队列末尾"""
-        self.event_bus.put(event)
-        logger.info(f"EVENTBUS: event <{event}> is published")
+        #联合触发倒排索引，下标为事件编号，[[<关心该事件的JointCondition 1>, ...], ...]
+        self.joint_table: List[List['JointCondition']] = []
+
+        #事件风暴预算表，下标为事件编号，None表示该事件不属于任何受限的事件循环
+        self.cycle_budget_table: List[Optional['CycleBudget']] = []
+        self.cycle_budgets: List['CycleBudget'] = []
+
+        #正在处理的事件携带的负载，没有负载时为None，见publish()
+        self.current_payload: Any = None
+
+        #上一次process_batch()从队列中取出并处理的事件数（合并的事件只算一个），用于process()按步数限制循环
+        self.batch_steps = 0
+
+        #指标收集器，由enable_metrics()挂载，见api.event.event_metrics.EventBusMetrics
+        self.metrics = None
+
+        #事件日志，由enable_journal()挂载，见api.event.event_journal.EventJournal
+        self.journal = None
+
+        #只负责添加延迟任务的立即触发监听器（add_delayed_listener()的包装函数），重放事件日志时只执行这些监听器
+        self.scheduling_listeners: Set[Callable] = set()
+
+        #安装到该事件总线的标签实例，{<class_name>: <BaseLabel>}，由LabelTriggerManager.install_to_eventbus()设置，用于保存快照
+        self.installed_labels: Dict[str, object] = {}
+        #每个标签实例注册的监听器的订阅句柄，{<class_name>: [<Subscription>, ...]}，用于增量卸载标签
+        self.label_subscriptions: Dict[str, List['Subscription']] = {}
+
+        #所有模式监听器编译成的共享自动机，注册新的模式监听器后需要重新编译
+        self.pattern_automaton: Optional[PatternAutomaton] = None
+        self.pattern_automaton_dirty = False
+
+        #层级主题监听器的订阅表，没有主题监听器时为None，见add_topic_listener()
+        self.topic_trie: Optional[TopicTrie] = None
+        #{<事件名>: (<匹配该事件的主题订阅句柄>, ...)}，每个事件名只在第一次被处理时查找订阅表，订阅变化时清空
+        self.topic_cache: Dict[str, Tuple['Subscription', ...]] = {}
+
+    @property
+    def immediate_listeners(self) -> Dict[str, List[Callable]]:
+        """立即触发监听器表的事件名视图，{<监听事件名>:[<可调用对象 1>, <可调用对象 2>, ... }"""
+        return {name: self.immediate_table[event_id] for name, event_id in self.symbols.ids.items()
+                if self.immediate_table[event_id]}
+
+    @property
+    def joint_index(self) -> Dict[str, List['JointCondition']]:
+        """联合触发倒排索引的事件名视图，{<事件名>:[<关心该事件的JointCondition 1>, ...]}"""
+        return {name: self.joint_table[event_id] for name, event_id in self.symbols.ids.items()
+                if self.joint_table[event_id]}
+
+    def _intern(self, event: str) -> int:
+        """为事件名分配编号，并为新编号扩展各触发表"""
+        event_id = self.symbols.intern(event)
+        if event_id == len(self.immediate_table):
+            if self.frozen:
+                self.immediate_table.append(())
+                self.immediate_subscriptions.append(())
+                self.joint_table.append(())
+                self.dispatch_table.append(())
+            else:
+                self.immediate_table.append([])
+                self.immediate_subscriptions.append([])
+                self.joint_table.append([])
+            self.cycle_budget_table.append(None)
+        return event_id
+
+    def publish(self,event: str, payload: Any = None, priority: int = EventQueue.NORMAL):
+        """
+        发布事件，将事件放入所在优先级车道的末尾
+        :param payload: 事件携带的负载（如行情、成交回报、K线数组），只传递引用不复制，处理该事件时可以通过current_payload读取，
+                        注册时with_payload为True的监听器会收到该负载作为参数
+        :param priority: EventQueue.CRITICAL、HIGH、NORMAL或LOW，高优先级车道中的事件先被处理（如风控事件），见EventQueue
+        :raise ValueError: priority不是以上车道之一
+        """
+        if priority not in EventQueue.PRIORITIES:
+            raise EventQueue.invalid_priority(priority)
+        if payload is not None:
+            event = PayloadEvent(event, payload)
+        self.event_bus.put(event, priority)
+        if self.journal is not None:
+            self.journal.append(self.journal.PUBLISH, event)
+        if self.event_logger.active:
+            self.event_logger.event("event <{event}> is published", event=event)
+
+    def publish_many(self, events: Iterable[str], priority: int = EventQueue.NORMAL):
+        """批量发布同一优先级的事件，按顺序放入车道末尾，只记录一条日志"""
+        if priority not in EventQueue.PRIORITIES:
+            raise EventQueue.invalid_priority(priority)
+        count = 0
+        journal = self.journal
+        for event in events:
+            self.event_bus.put(event, priority)
+            if journal is not None:
+                journal.append(journal.PUBLISH, event)
+            count += 1
+        self.event_logger.info("{count} events are published", count=count)
 
     def process_one_step(self):
         """从队列头开始处理事件"""
         if self.event_bus.empty():
-            logger.success("EVENTBUS: process done !")
+            self.current_payload = None
+            # 队列为空时仍需检查到期的定时任务，它们可能发布新的事件
+            if self.timed_tasks and self._fire_timed():
+                return False
+            self.event_logger.success("process done !")
             return True
 
-        if self.event_bus.full():
-            logger.critical(f"EVENTBUS: Event bus full!")
-            return False
-
-        self.event_count += 1
-        event = self.event_bus.get()
-        logger.info(f"EVENTBUS: event <{event}> is processing")
+        event = self.event_bus.get_nowait()
+        if event.__class__ is str:
+            self.current_payload = None
+            merged = 0
+        else:
+            self.current_payload = event.payload
+            # 合并规则下被合并的同名事件数，它们仍计入事件计数，使按事件数延迟的任务在原来的计数到期
+            merged = event.merged if event.__class__ is CoalescedEvent else 0
+
+        # 没有被任何监听器关心的事件没有编号，只需检查延迟、定时任务和含通配符的模式
+        event_id = self.symbols.lookup(event)
+
+        # 事件风暴预算耗尽的循环事件直接丢弃，不计入事件计数
+        if event_id is not None:
+            cycle_budget = self.cycle_budget_table[event_id]
+            if cycle_budget is not None and not cycle_budget.consume(event):
+                return False
+
+        if self.journal is not None:
+            if merged:
+                self.journal.append(self.journal.MERGED, event, merged)
+            self.journal.append(self.journal.DISPATCH, event)
+
+        self.event_count += 1 + merged
+        event_logger = self.event_logger
+        event_logger.begin_event()
+        if event_logger.active:
+            event_logger.event("event <{event}> is processing", event=event)
+
+        metrics = self.metrics
+        if metrics is not None:
+            start_ns = perf_counter_ns()
+            start_calls = metrics.calls
 
         # 立即触发
-        for callback in self.immediate_listeners[event]:
-            logger.info(f"EVENTBUS: event callback <func: {callback.__name__}> is triggered")
-            callback()
+        if event_id is not None:
+            callbacks = self.immediate_table[event_id]
+            if self.dispatch_executor is not None and self.independent_listeners:
+                self._dispatch_parallel(event_id, callbacks)
+            elif not self.frozen:
+                for callback in callbacks:
+                    if event_logger.active:
+                        event_logger.event("event callback <func: {callback}> is triggered", callback=callback.__name__)
+                    if metrics is None:
+                        callback()
+                    else:
+                        metrics.call(callback, EventBus.IMMEDIATE)
+            elif metrics is None and not event_logger.active:
+                # 冻结的分发表不会被原地修改，逐个回调的日志与指标检查提到循环外，只检查是否有监听器在分发过程中被取消订阅
+                frozen_removed = self.frozen_removed
+                remaining = iter(self.dispatch_table[event_id])
+                for callback in remaining:
+                    callback()
+                    if frozen_removed:
+                        for callback in self._subscribed(self.dispatch_table, event_id, remaining):
+                            callback()
+                        break
+            else:
+                self._dispatch_remaining(event_id, callbacks)
+
+        # 主题触发，没有主题监听器时只有这一次判断
+        if self.topic_trie is not None:
+            self._dispatch_topics(event)
+
+        # 检查延迟触发与定时触发任务
+        self._fire_delayed()
+        if self.timed_tasks:
+            self._fire_timed()
+
+        # 联合触发，只检查关心该事件的联合条件
+        if event_id is not None:
+            for condition in self.joint_table[event_id]:
+                if condition.on_event(event_id):
+                    self._run_callback(condition.callback, EventBus.JOINT)
+
+        # 模式触发，一次状态转移同时推进所有模式
+        self._dispatch_patterns(event_id)
+
+        if metrics is not None:
+            metrics.record_event(event, perf_counter_ns() - start_ns, metrics.calls - start_calls)
 
-        # 检查延迟触发任务
-        while self.delayed_tasks and self.delayed_tasks[0][0] <= self.event_count:
-            _, callback = heapq.heappop(self.delayed_tasks)
-            logger.info(f"EVENTBUS: event callback <func: {callback.__name__}> is triggered")
+        if event_logger.active:
+            event_logger.event("event <{event}> processing is end", event=event)
+
+        return False
+
+    def _dispatch_parallel(self, event_id: int, callbacks: Iterable[Callable]):
+        """
+        并行分发立即触发监听器\n
+        1. independent监听器按注册顺序提交到dispatch_executor中执行，其余监听器仍在当前线程中按顺序执行
+        2. 屏障：等待所有并行监听器结束后才返回，保证延迟、联合、模式触发阶段在所有立即触发监听器结束后才开始
+        3. 如果有并行监听器抛出异常，在屏障之后重新抛出第一个异常
+        """
+        futures = []
+        independent_listeners = self.independent_listeners
+        event_logger = self.event_logger
+        metrics = self.metrics
+        for callback in self._subscribed(self.immediate_table, event_id, callbacks) if self.frozen else callbacks:
+            if event_logger.active:
+                event_logger.event("event callback <func: {callback}> is triggered", callback=callback.__name__)
+            if callback in independent_listeners:
+                futures.append((callback, self.dispatch_executor.submit(self._run_independent, callback, metrics)))
+            elif metrics is None:
+                callback()
+            else:
+                metrics.call(callback, EventBus.IMMEDIATE)
+
+        if not futures:
+            return
+        wait([future for _, future in futures])
+        for callback, future in futures:
+            result = future.result()
+            # 指标只在分发线程中记录，不需要加锁
+            if metrics is not None:
+                metrics.record_listener(callback, EventBus.IMMEDIATE, result)
+
+    def _run_independent(self, callback: Callable, metrics) -> Optional[int]:
+        """在dispatch_executor的线程中执行一个independent监听器，分发线程在屏障处等待它，因此它发布事件时同样不能等待队列空位"""
+        consumers = self.event_bus.consumers
+        ident = threading.get_ident()
+        consumers.add(ident)
+        try:
+            if metrics is None:
+                return callback()
+            return metrics.timed_call(callback)
+        finally:
+            consumers.discard(ident)
+
+    def _dispatch_remaining(self, event_id: int, callbacks: Tuple[Callable, ...]):
+        """逐个执行冻结的事件总线上一个事件的立即触发监听器，记录日志与指标"""
+        event_logger = self.event_logger
+        metrics = self.metrics
+        for callback in self._subscribed(self.immediate_table, event_id, callbacks):
+            if event_logger.active:
+                event_logger.event("event callback <func: {callback}> is triggered", callback=callback.__name__)
+            if metrics is None:
+                callback()
+            else:
+                metrics.call(callback, EventBus.IMMEDIATE)
+
+    def _subscribed(self, table: List[Tuple[Callable, ...]], event_id: int,
+                    callbacks: Iterable[Callable]) -> Iterator[Callable]:
+        """
+        冻结后取消订阅会重建所在事件的回调元组，正在分发的循环使用的仍是旧元组\n
+        有监听器被取消订阅后（frozen_removed非空）只产出仍在table中该事件当前元组里的回调，按对象判断：
+        同一可调用对象在同一事件上重复注册时，取消其中一个不影响本次分发中剩余的同一对象
+        :param table: callbacks所属的表，immediate_table或dispatch_table
+        """
+        frozen_removed = self.frozen_removed
+        current = None
+        for callback in callbacks:
+            if frozen_removed:
+                frozen_removed.clear()
+                current = table[event_id]
+            if current is None or any(kept is callback for kept in current):
+                yield callback
+
+    def _run_callback(self, callback: Callable, listener_type: int):
+        """触发延迟、联合、模式监听器的回调，挂载了指标收集器时记录耗时"""
+        if self.event_logger.active:
+            self.event_logger.event("event callback <func: {callback}> is triggered", callback=callback.__name__)
+        if self.metrics is None:
             callback()
+        else:
+            self.metrics.call(callback, listener_type)
 
-        # 联合触发
-        for condition in self.joint_conditions:
-            condition.on_event(event)
+    def _fire_delayed(self):
+        for handle in self.delayed_tasks.advance(self.event_count):
+            self._run_callback(handle.callback, EventBus.DELAY)
 
-        # 模式触发
-        for matcher in self.pattern_matchers:
-            matcher.on_event(event)
+    def _fire_timed(self) -> bool:
+        """
+        触发所有已到期的定时任务
+        :return: 是否有任务被触发
+        """
+        fired = self.timed_tasks.advance(self._now_ms())
+        for handle in fired:
+            if self.event_logger.active:
+                self.event_logger.event("timed callback <func: {callback}> is triggered", callback=handle.callback.__name__)
+            if self.metrics is None:
+                handle.callback()
+            else:
+                self.metrics.call(handle.callback, EventBus.DELAY)
+        return bool(fired)
+
+    def _now_ms(self) -> int:
+        return int(self.clock() * 1000)
 
-        logger.info(f"EVENTBUS: event <{event}> processing is end")
+    def _dispatch_patterns(self, event_id: Optional[int]):
+        if self.pattern_automaton_dirty:
+            self.compile_patterns()
+
+        if self.pattern_automaton is None:
+            return
+
+        for pattern_id in self.pattern_automaton.feed(event_id):
+            self._run_callback(self.pattern_matchers[pattern_id].callback, EventBus.PATTERN)
+
+    def compile_patterns(self, positions: Optional[Iterable] = None):
+        """
+        将所有模式监听器编译为一个共享自动机\n
+        LabelTriggerManager.install_to_eventbus()在安装结束时调用，之后注册的模式监听器会在下一次处理事件前自动重新编译，
+        已有模式进行中的部分匹配会被保留
+        :param positions: 不为None时使用给定的部分匹配状态，(<模式编号>, <已匹配长度>)，用于从快照恢复
+        """
+        if positions is None:
+            positions = self.pattern_automaton.positions if self.pattern_automaton is not None else ()
+
+        # 移除已取消订阅的模式监听器，其它模式的部分匹配按新的模式编号保留
+        if not all(matcher.active for matcher in self.pattern_matchers):
+            with self.listener_lock:
+                renumber = {}
+                matchers = []
+                for pattern_id, matcher in enumerate(self.pattern_matchers):
+                    if matcher.active:
+                        renumber[pattern_id] = len(matchers)
+                        matchers.append(matcher)
+                self.pattern_matchers = matchers
+            positions = [(renumber[pattern_id], length) for pattern_id, length in positions if pattern_id in renumber]
+
+        # 自动机的字母表为事件编号，'*'保持不变
+        self.pattern_automaton = PatternAutomaton(
+            [[event if event == '*' else self._intern(event) for event in matcher.pattern]
+             for matcher in self.pattern_matchers],
+            positions=positions
+        )
+        self.pattern_automaton_dirty = False
+        self.event_logger.info("{count} pattern listeners compiled", count=len(self.pattern_matchers))
+
+        # 新注册的模式监听器可能使已有的合并规则失效
+        for event in list(self.event_bus.coalesce_events):
+            reason = self._coalesce_conflict(event)
+            if reason is not None:
+                self.event_bus.coalesce_events.discard(event)
+                logger.warning(f"EVENTBUS: coalesce rule of event <{event}> is removed, {reason}")
+
+    def process_batch(self, n: int = 100):
+        """
+        从队列头开始批量处理至多n个事件，结果与连续调用n次process_one_step()一致\n
+        1. 一次性从同一个优先级车道中取出至多n个事件（处理过程中新发布的同一车道或更低车道的事件只会进入车道末尾，因此不影响处理顺序）
+        2. 处理过程中有更高优先级的事件被发布时，剩余事件按原顺序放回车道头部，本批次提前结束
+        3. 属性查找提到循环外，日志按批次记录
+        4. 处理批次中的每个事件前按逐个取出时的规则选择车道（见EventQueue.continue_batch()），防饿死的跳过计数与逐个处理一致
+        :param n: 批次大小
+        :return: 队列为空时返回True
+        """
+        events = self.event_bus.get_many(n)
+        self.batch_steps = 0
+
+        if not events:
+            self.current_payload = None
+            if self.timed_tasks and self._fire_timed():
+                self.batch_steps = 1
+                return False
+            self.event_logger.success("process done !")
+            return True
+
+        event_logger = self.event_logger
+        event_logger.info("{count} events are processing", count=len(events))
+
+        event_queue = self.event_bus
+        lane = event_queue.last_lane
+        lookup = self.symbols.lookup
+        # 批次内为新事件分配编号会扩展这两个列表，使用引用而不是副本（冻结时也只替换列表中的元素）
+        immediate_table = self.immediate_table
+        joint_table = self.joint_table
+        parallel = self.dispatch_executor is not None and bool(self.independent_listeners)
+        timed_tasks = self.timed_tasks
+        cycle_budget_table = self.cycle_budget_table
+        metrics = self.metrics
+        journal = self.journal
+        frozen_removed = self.frozen_removed
+
+        processed = 0
+        for event in events:
+            # 有更高优先级的事件等待处理，或低优先级车道将要饿死时让出，由下一次取出时选择车道
+            if processed and not event_queue.continue_batch(lane):
+                event_queue.push_front(events[processed:], lane)
+                break
+            processed += 1
+
+            if event.__class__ is str:
+                self.current_payload = None
+                merged = 0
+            else:
+                if event.__class__ is CoalescedEvent:
+                    event_queue.release(event)
+                    merged = event.merged
+                else:
+                    merged = 0
+                self.current_payload = event.payload
+            event_id = lookup(event)
+            if event_id is not None:
+                cycle_budget = cycle_budget_table[event_id]
+                if cycle_budget is not None and not cycle_budget.consume(event):
+                    continue
+
+            if journal is not None:
+                if merged:
+                    journal.append(journal.MERGED, event, merged)
+                journal.append(journal.DISPATCH, event)
+
+            self.event_count += 1 + merged
+            event_logger.begin_event()
+
+            if metrics is not None:
+                start_ns = perf_counter_ns()
+                start_calls = metrics.calls
+
+            # 立即触发
+            if event_id is not None:
+                callbacks = immediate_table[event_id]
+                if parallel:
+                    self._dispatch_parallel(event_id, callbacks)
+                elif not self.frozen:
+                    for callback in callbacks:
+                        if event_logger.active:
+                            event_logger.event("event callback <func: {callback}> is triggered", callback=callback.__name__)
+                        if metrics is None:
+                            callback()
+                        else:
+                            metrics.call(callback, EventBus.IMMEDIATE)
+                elif metrics is None and not event_logger.active:
+                    remaining = iter(self.dispatch_table[event_id])
+                    for callback in remaining:
+                        callback()
+                        if frozen_removed:
+                            for callback in self._subscribed(self.dispatch_table, event_id, remaining):
+                                callback()
+                            break
+                else:
+                    self._dispatch_remaining(event_id, callbacks)
+
+            # 主题触发
+            if self.topic_trie is not None:
+                self._dispatch_topics(event)
+
+            # 检查延迟触发与定时触发任务
+            self._fire_delayed()
+            if timed_tasks:
+                self._fire_timed()
+
+            # 联合触发
+            if event_id is not None:
+                for condition in joint_table[event_id]:
+                    if condition.on_event(event_id):
+                        self._run_callback(condition.callback, EventBus.JOINT)
+
+            # 模式触发
+            self._dispatch_patterns(event_id)
+
+            if metrics is not None:
+                metrics.record_event(event, perf_counter_ns() - start_ns, metrics.calls - start_calls)
+
+        event_logger.info("{count} events processing is end", count=processed)
+        self.batch_steps = processed
 
         return False
 
-    def process(self,maxStep=10000):
-        for i in range(maxStep):
-            is_done = self.process_one_step()
-            if is_done:
-                return
+    def process(self,maxStep=10000, batch_size: int = 1) -> bool:
+        """
+        循环处理事件直到队列为空
+        :param maxStep: 最多处理的事件数，防止无限事件循环
+        :param batch_size: 大于1时使用process_batch()批量处理
+        :return: 队列已处理完时返回True，达到步数上限时返回False
+        """
+        self.start_processing()
+        try:
+            is_done, _ = self.process_steps(maxStep, batch_size)
+            if not is_done:
+                logger.critical(f"EVENTBUS: reach step limit {maxStep}, check infinite event loop")
+            return is_done
+        finally:
+            self.finish_processing()
+
+    def start_processing(self):
+        """
+        一轮处理（从开始处理到队列为空）开始时调用：压缩已取消订阅的监听器、重置事件风暴预算、采样指标\n
+        process()会自动调用，分时间片处理一轮事件的调用方（如EventBusScheduler）需要自行调用，
+        且一轮处理须在同一个线程中开始、处理与结束（该线程在回调中发布事件时不会在BLOCK策略下等待，见LockedEventQueue）
+        """
+        self.event_bus.consumers.add(threading.get_ident())
+        self.compact_listeners()
+        self.reset_cycle_budgets()
+        if self.metrics is not None:
+            self.metrics.sample(self)
+
+    def finish_processing(self):
+        """一轮处理结束时调用，见start_processing()"""
+        self.event_bus.consumers.discard(threading.get_ident())
+        # 不再持有最后一个事件的负载
+        self.current_payload = None
+        # 每次处理结束时将事件日志写入文件（是否fsync由EventJournal的批量fsync策略决定）
+        if self.journal is not None:
+            self.journal.flush()
+
+    def process_steps(self, max_steps: int, batch_size: int = 1, deadline_ns: Optional[int] = None) -> Tuple[bool, int]:
+        """
+        处理至多max_steps步，不做一轮处理开始与结束时的工作（见start_processing()）
+        :param batch_size: 大于1时使用process_batch()批量处理
+        :param deadline_ns: 不为None时，perf_counter_ns()超过该值后不再开始新的一步（或新的批次）
+        :return: (<队列是否已处理完>, <处理的步数>)
+        """
+        steps = 0
+        if batch_size > 1:
+            # 按取出的事件数计步，与逐个处理一致（事件计数还包括合并的事件，被事件风暴预算丢弃的事件不计入事件计数）
+            while steps < max_steps:
+                if deadline_ns is not None and perf_counter_ns() >= deadline_ns:
+                    break
+                if self.process_batch(min(batch_size, max_steps - steps)):
+                    return True, steps
+                steps += self.batch_steps
+        else:
+            while steps < max_steps:
+                if deadline_ns is not None and perf_counter_ns() >= deadline_ns:
+                    break
+                if self.process_one_step():
+                    return True, steps
+                steps += 1
+        return False, steps
+
+    def replay_event(self, event: str, merged: int = 0):
+        """
+        只恢复状态地处理一个事件，由EventJournal.replay()调用\n
+        推进事件计数、执行添加延迟任务的包装函数、丢弃到期的延迟任务、推进联合触发与模式匹配的状态，不执行任何触发器回调，也不写入事件日志
+        :param merged: 处理该事件时合并在其中的同名事件数
+        """
+        event_id = self.symbols.lookup(event)
+        self.event_count += 1 + merged
+
+        if event_id is not None:
+            scheduling_listeners = self.scheduling_listeners
+            for callback in self.immediate_table[event_id]:
+                if callback in scheduling_listeners:
+                    callback()
 
-        logger.critical(f"EVENTBUS: reach step limit {maxStep}, check infinite event loop")
+        # 这些延迟任务在原来的运行中已经触发过，只执行联合条件的窗口过期（恢复状态，不是触发器）
+        for handle in self.delayed_tasks.advance(self.event_count):
+            if handle.callback.__class__ is JointExpiry:
+                handle.callback()
 
+        if event_id is not None:
+            for condition in self.joint_table[event_id]:
+                condition.on_event(event_id)
 
+        if self.pattern_automaton_dirty:
+            self.compile_patterns()
+        if self.pattern_automaton is not None:
+            self.pattern_automaton.feed(event_id)
 
-    def add_immediate_listener(self, source: str, callback: Callable):
-        self.immediate_listeners[source].append(callback)
 
-    def add_delayed_listener(self, source: str, delay: int, callback: Callable):
+
+    def enable_metrics(self, metrics):
+        """
+        挂载指标收集器，之后每个事件和回调的耗时都会被记录
+        :param metrics: api.event.event_metrics.EventBusMetrics实例，为None时关闭指标收集
+        """
+        self.metrics = metrics
+
+    def enable_journal(self, journal):
+        """
+        挂载事件日志，之后每个被发布和被处理的事件都会写入日志
+        :param journal: api.event.event_journal.EventJournal实例，为None时关闭事件日志
+        """
+        self.journal = journal
+
+    def set_trace(self, enabled: bool = True):
+        """开启或关闭该事件总线的完整追踪，开启后忽略全局日志级别与采样率"""
+        self.event_logger.set_trace(enabled)
+
+    def queue_stats(self) -> Dict:
+        """事件队列当前深度、各优先级车道的深度与各溢出策略的计数器"""
+        stats = dict(self.event_bus.stats)
+        stats['depth'] = self.event_bus.qsize()
+        stats['lanes'] = self.event_bus.lane_depths()
+        stats['cycle_dropped'] = sum(budget.dropped for budget in self.cycle_budgets)
+        stats['merged_events'] = dict(self.event_bus.merged_counts)
+        return stats
+
+    def _with_payload(self, callback: Callable) -> Callable:
+        """将接收负载参数的回调包装为无参数回调，调用时传入正在处理的事件的负载"""
+        def payload_wrapper():
+            return callback(self.current_payload)
+
+        #使用原回调名，使其在日志、指标和快照中可见
+        payload_wrapper.__name__ = callback.__name__
+        return payload_wrapper
+
+    def add_immediate_listener(self, source: str, callback: Callable, independent: bool = False,
+                               with_payload: bool = False) -> 'Subscription':
+        """
+        :param independent: 为True时表示该监听器与同一事件的其它监听器相互独立（如执行阻塞的数据库或网络操作），启用并行分发时可以并行执行
+        :param with_payload: 为True时回调以事件的负载作为唯一参数被调用（没有负载时为None）
+        :return: 订阅句柄，见remove_listener()
+        """
+        if with_payload:
+            callback = self._with_payload(callback)
+        return self._add_to_immediate_table(source, callback, EventBus.IMMEDIATE, independent)
+
+    def _add_to_immediate_table(self, source: str, callback: Callable, listener_type: int,
+                                independent: bool = False) -> 'Subscription':
+        with self.listener_lock:
+            event_id = self._intern(source)
+            callbacks = self.immediate_table[event_id]
+            subscription = Subscription(self, listener_type, callback, event_id=event_id, index=len(callbacks))
+            if self.frozen:
+                # 重建该事件的元组，正在分发该事件的循环仍使用旧元组，新监听器从下一个事件开始触发
+                self.immediate_table[event_id] = callbacks + (callback,)
+                self.immediate_subscriptions[event_id] = self.immediate_subscriptions[event_id] + (subscription,)
+                self.dispatch_table[event_id] = self.dispatch_table[event_id] + (EventBus._compile_callback(callback),)
+            else:
+                callbacks.append(callback)
+                self.immediate_subscriptions[event_id].append(subscription)
+            if independent:
+                self.independent_listeners.add(callback)
+        return subscription
+
+    def _bind_payload(self, callback: Callable) -> Callable:
+        """将接收负载参数的回调与当前事件的负载绑定，用于延迟与定时任务（触发时source事件已经处理完毕）"""
+        payload = self.current_payload
+
+        def bound_callback():
+            return callback(payload)
+
+        bound_callback.__name__ = callback.__name__
+        #每次触发都是新的函数对象，指标按原回调记录
+        bound_callback.__wrapped__ = callback
+        return bound_callback
+
+    def add_delayed_listener(self, source: str, delay: int, callback: Callable,
+                             with_payload: bool = False) -> 'Subscription':
+        """
+        :param with_payload: 为True时回调以source事件的负载作为唯一参数被调用（没有负载时为None）
+        :return: 订阅句柄，取消订阅时该监听器尚未触发的延迟任务一并取消
+        """
         def delayed_callback_wrapper():
-            trigger_at = self.event_count + delay #delay的值等于add_delayed_listener中delay参数的值（闭包）
-            heapq.heappush(self.delayed_tasks, (trigger_at, callback))
+            #delay的值等于add_delayed_listener中delay参数的值（闭包）
+            EventBus.track_handle(delayed_callback_wrapper, self.schedule_delayed(
+                delay, self._bind_payload(callback) if with_payload else callback))
 
         #重命名该回调函数，使其在日志中可见
         delayed_callback_wrapper.__name__ = f"delayed_wrapper_{callback.__name__}"
+        #从快照恢复延迟任务时按名称找回原回调，负载不保存在快照中
+        delayed_callback_wrapper.scheduled_callback = self._bind_payload_none(callback) if with_payload else callback
+        #该监听器添加的尚未触发的任务，见track_handle()
+        delayed_callback_wrapper.scheduled_handles = deque()
+
+        self.scheduling_listeners.add(delayed_callback_wrapper)
+        return self._add_to_immediate_table(source, delayed_callback_wrapper, EventBus.DELAY)
 
-        self.add_immediate_listener(source, delayed_callback_wrapper)
+    def add_timed_listener(self, source: str, delay_ms: int, callback: Callable,
+                           with_payload: bool = False) -> 'Subscription':
+        """
+        定时触发：事件source发生delay_ms毫秒后触发回调\n
+        事件总线没有后台线程，到期的定时任务在之后的process()中（处理每个事件后或队列为空时）触发
+        :param with_payload: 为True时回调以source事件的负载作为唯一参数被调用（没有负载时为None）
+        :return: 订阅句柄，取消订阅时该监听器尚未触发的定时任务一并取消
+        """
+        def timed_callback_wrapper():
+            EventBus.track_handle(timed_callback_wrapper, self.schedule_timed(
+                delay_ms, self._bind_payload(callback) if with_payload else callback))
+
+        #重命名该回调函数，使其在日志中可见
+        timed_callback_wrapper.__name__ = f"timed_wrapper_{callback.__name__}"
+        timed_callback_wrapper.scheduled_callback = self._bind_payload_none(callback) if with_payload else callback
+        timed_callback_wrapper.scheduled_handles = deque()
 
-    def add_joint_listener(self, sources: List[str], callback: Callable):
-        condition = JointCondition(set(sources), callback)
-        self.joint_conditions.append(condition)
+        return self._add_to_immediate_table(source, timed_callback_wrapper, EventBus.DELAY)
 
-    def add_pattern_listener(self, pattern: List[str], callback: Callable):
-        matcher = PatternMatcher(pattern, callback)
-        self.pattern_matchers.append(matcher)
+    @staticmethod
+    def track_handle(wrapper: Callable, handle: TimerHandle):
+        """
+        记录延迟或定时监听器添加的任务，用于取消订阅时取消尚未触发的任务\n
+        同一个监听器的任务延迟相同，按添加顺序到期，因此只需从头部丢弃已触发的任务，均摊O(1)
+        """
+        handles: Deque[TimerHandle] = wrapper.scheduled_handles
+        while handles and not handles[0].pending:
+            handles.popleft()
+        handles.append(handle)
+
+    @staticmethod
+    def _bind_payload_none(callback: Callable) -> Callable:
+        def bound_callback():
+            return callback(None)
+
+        bound_callback.__name__ = callback.__name__
+        bound_callback.__wrapped__ = callback
+        return bound_callback
+
+    def schedule_delayed(self, delay: int, callback: Callable) -> TimerHandle:
+        """
+        在delay个事件之后触发回调
+        :return: 任务句柄，可调用cancel()取消尚未触发的任务
+        """
+        return self.delayed_tasks.schedule(self.event_count + delay, callback)
+
+    def schedule_timed(self, delay_ms: int, callback: Callable) -> TimerHandle:
+        """
+        在delay_ms毫秒之后触发回调
+        :return: 任务句柄，可调用cancel()取消尚未触发的任务
+        """
+        now = self._now_ms()
+        if not self.timed_tasks:
+            # 时间轮为空时直接推进到当前时刻，避免新任务因为时间轮的时刻过旧而被放到过高的层
+            self.timed_tasks.advance(now)
+        return self.timed_tasks.schedule(now + delay_ms, callback)
+
+    def add_joint_listener(self, sources: List[str], callback: Callable, with_payload: bool = False,
+                           window_events: Optional[int] = None, window_ms: Optional[int] = None) -> 'Subscription':
+        """
+        :param with_payload: 为True时回调以最后发生（使条件满足）的事件的负载作为唯一参数被调用
+        :param window_events: 不为None时每个已发生的事件只在之后的window_events个事件内有效（包括该事件本身），见WindowedJointCondition
+        :param window_ms: 不为None时每个已发生的事件只在之后的window_ms毫秒内有效，不能与window_events同时使用
+        :return: 订阅句柄，见remove_listener()
+        :raise ValueError: 同时设置了两种窗口，或窗口不是正数
+        """
+        if window_events is not None and window_ms is not None:
+            raise ValueError("EVENTBUS: joint listener accepts either window_events or window_ms, not both")
+        window = window_events if window_events is not None else window_ms
+        if window is not None and window <= 0:
+            raise ValueError(f"EVENTBUS: joint listener window must be positive, got {window}")
+
+        if with_payload:
+            callback = self._with_payload(callback)
+        with self.listener_lock:
+            required_ids = {source: self._intern(source) for source in sources}
+            if window is None:
+                condition = JointCondition(set(sources), callback, required_ids)
+            else:
+                condition = WindowedJointCondition(set(sources), callback, required_ids, window, self,
+                                                   timed=window_ms is not None)
+            self.joint_conditions.append(condition)
+            for event_id in required_ids.values():
+                if self.frozen:
+                    self.joint_table[event_id] = self.joint_table[event_id] + (condition,)
+                else:
+                    self.joint_table[event_id].append(condition)
+        return Subscription(self, EventBus.JOINT, callback, target=condition)
+
+    def add_cycle_budget(self, events: Iterable[str], budget: int) -> 'CycleBudget':
+        """
+        限制一个事件循环在一次process()中被处理的事件数，由TriggerGraphAnalyzer在安装时根据触发图设置
+        :param events: 循环中的事件名，同一事件只能属于一个循环
+        :param budget: 每次process()中该循环最多处理的事件数
+        """
+        cycle_budget = CycleBudget(set(events), budget)
+        for event in cycle_budget.events:
+            self.cycle_budget_table[self._intern(event)] = cycle_budget
+        self.cycle_budgets.append(cycle_budget)
+        return cycle_budget
+
+    def reset_cycle_budgets(self):
+        for cycle_budget in self.cycle_budgets:
+            cycle_budget.reset()
+
+    def add_coalesce_rule(self, event: str) -> bool:
+        """
+        合并规则：队列中至多只有一个待处理的event，该事件仍在队列中时新发布的同名事件被合并到其中（见EventQueue），用于减少突发的重复事件\n
+        1. 事件被处理时只触发一次监听器（包括以该事件为源的延迟触发与定时触发），负载为最后一次发布的负载
+        2. 被合并的事件仍计入事件计数，其它按事件数延迟的任务在原来的计数到期
+        3. 模式匹配依赖事件的先后顺序与个数，出现在模式中的事件、以及存在含'*'的模式时的所有事件，都不能设置合并规则
+        :return: 是否设置成功
+        """
+        reason = self._coalesce_conflict(event)
+        if reason is not None:
+            logger.warning(f"EVENTBUS: cannot coalesce event <{event}>, {reason}")
+            return False
+        self.event_bus.coalesce_events.add(event)
+        return True
+
+    def remove_coalesce_rule(self, event: str):
+        self.event_bus.coalesce_events.discard(event)
+
+    def _coalesce_conflict(self, event: str) -> Optional[str]:
+        """返回该事件不能设置合并规则的原因，可以设置时返回None"""
+        for matcher in self.pattern_matchers:
+            if not matcher.active:
+                continue
+            if '*' in matcher.pattern:
+                return f"pattern listener <{matcher.callback.__name__}> contains '*'"
+            if event in matcher.pattern:
+                return f"it is used by pattern listener <{matcher.callback.__name__}>"
+        return None
+
+    def add_pattern_listener(self, pattern: List[str], callback: Callable, with_payload: bool = False) -> 'Subscription':
+        """
+        :param with_payload: 为True时回调以模式最后一个事件的负载作为唯一参数被调用
+        :return: 订阅句柄，见remove_listener()
+        """
+        if with_payload:
+            callback = self._with_payload(callback)
+        with self.listener_lock:
+            for event in pattern:
+                if event != '*':
+                    self._intern(event)
+
+            matcher = PatternMatcher(pattern, callback)
+            self.pattern_matchers.append(matcher)
+            self.pattern_automaton_dirty = True
+        return Subscription(self, EventBus.PATTERN, callback, target=matcher)
+
+    def add_topic_listener(self, topic: str, callback: Callable, with_payload: bool = False) -> 'Subscription':
+        """
+        层级主题监听器：事件名是以'.'分隔的主题（如fill.AAPL.buy），订阅中的'*'匹配恰好一段，'#'匹配零段或多段，见TopicTrie\n
+        1. 如fill.*.buy监听任意品种的买入成交，fill.#监听fill与fill下的所有事件（前缀订阅），#监听所有事件
+        2. 与立即触发监听器在同一阶段触发（在监听该事件名的立即触发监听器之后），按注册顺序执行，不参与并行分发
+        3. 每个事件名第一次被处理时在前缀树中查找匹配的订阅并缓存结果，之后只需一次字典查找，与主题监听器的数量无关；
+           监听确定事件名的监听器应使用add_immediate_listener()，不经过主题匹配
+        :param with_payload: 为True时回调以事件的负载作为唯一参数被调用（没有负载时为None）
+        :return: 订阅句柄，见remove_listener()
+        :raise ValueError: 主题为空或包含空段
+        """
+        TopicTrie.split(topic)
+        if with_payload:
+            callback = self._with_payload(callback)
+        with self.listener_lock:
+            if self.topic_trie is None:
+                self.topic_trie = TopicTrie()
+            subscription = Subscription(self, EventBus.TOPIC, callback, target=topic)
+            subscription.index = self.topic_trie.add(topic, subscription)
+            self.topic_cache = {}
+        return subscription
+
+    def _dispatch_topics(self, event: str):
+        subscriptions = self.topic_cache.get(event)
+        if subscriptions is None:
+            subscriptions = self._match_topic(event)
+        event_logger = self.event_logger
+        metrics = self.metrics
+        for subscription in subscriptions:
+            # 在本次分发中被取消的订阅仍在缓存的元组中
+            if not subscription.active:
+                continue
+            callback = subscription.callback
+            if event_logger.active:
+                event_logger.event("event callback <func: {callback}> is triggered", callback=callback.__name__)
+            if metrics is None:
+                callback()
+            else:
+                metrics.call(callback, EventBus.TOPIC)
+
+    def _match_topic(self, event: str) -> Tuple['Subscription', ...]:
+        with self.listener_lock:
+            topic_trie = self.topic_trie
+            if topic_trie is None:
+                return ()
+            if len(self.topic_cache) >= EventBus.topic_cache_size:
+                logger.warning(f"EVENTBUS: topic cache reach limit {EventBus.topic_cache_size}, cache is flushed")
+                self.topic_cache = {}
+            # 事件可能是携带负载的PayloadEvent，缓存的键只保留事件名
+            name = str(event)
+            subscriptions = self.topic_cache[name] = tuple(topic_trie.match(name))
+        return subscriptions
+
+    def remove_listener(self, subscription: 'Subscription') -> bool:
+        """
+        取消订阅，O(1)，可以在process()运行时（包括在回调中）调用，正在处理的事件中尚未执行的该监听器不会再被执行\n
+        1. 立即、延迟、定时监听器：在监听器表中的位置被替换为空操作，在下一次process()开始时压缩（见compact_listeners()），
+           延迟与定时监听器尚未触发的任务被取消；冻结后（见freeze()）重建所在事件的元组，O(该事件的监听器数)
+        2. 联合监听器：条件不再接受任何事件，已发生的事件被丢弃，在下一次process()开始时从倒排索引中移除（冻结后立即重建）
+        3. 模式监听器：回调被替换为空操作，在下一次处理事件前重新编译自动机时移除，其它模式进行中的部分匹配保留
+        4. 主题监听器：从订阅表中移除并清空匹配结果缓存
+        :return: 该订阅已经取消过时返回False
+        """
+        with self.listener_lock:
+            if not subscription.active:
+                return False
+            subscription.active = False
+
+            if subscription.listener_type == EventBus.JOINT:
+                condition = subscription.target
+                condition.active = False
+                condition.event_bits = {}
+                condition.reset()
+                event_ids = {self.symbols.lookup(event) for event in condition.required}
+                if self.frozen:
+                    for event_id in event_ids:
+                        self.joint_table[event_id] = tuple(kept for kept in self.joint_table[event_id] if kept is not condition)
+                    self.joint_conditions = [kept for kept in self.joint_conditions if kept is not condition]
+                else:
+                    self.joint_removed = True
+                    self.removed_ids.update(event_ids)
+            elif subscription.listener_type == EventBus.PATTERN:
+                matcher = subscription.target
+                matcher.active = False
+                matcher.callback = _removed_listener
+                self.pattern_automaton_dirty = True
+            elif subscription.listener_type == EventBus.TOPIC:
+                self.topic_trie.remove(subscription.target, subscription.index)
+                if not self.topic_trie:
+                    self.topic_trie = None
+                self.topic_cache = {}
+            else:
+                event_id = subscription.event_id
+                index = subscription.index
+                if self.frozen:
+                    callbacks = self.immediate_table[event_id]
+                    subscriptions = self.immediate_subscriptions[event_id]
+                    compiled = self.dispatch_table[event_id]
+                    self.immediate_table[event_id] = callbacks[:index] + callbacks[index + 1:]
+                    self.immediate_subscriptions[event_id] = subscriptions[:index] + subscriptions[index + 1:]
+                    self.dispatch_table[event_id] = compiled[:index] + compiled[index + 1:]
+                    for later in subscriptions[index + 1:]:
+                        later.index -= 1
+                    self.frozen_removed.append(event_id)
+                else:
+                    self.immediate_table[event_id][index] = _removed_listener
+                    self.immediate_subscriptions[event_id][index] = None
+                    self.removed_ids.add(event_id)
+
+                callback = subscription.callback
+                self.independent_listeners.discard(callback)
+                self.scheduling_listeners.discard(callback)
+                for handle in getattr(callback, 'scheduled_handles', ()):
+                    handle.cancel()
+
+        if self.metrics is not None:
+            self.metrics.discard_listener(subscription.callback)
+        self.event_logger.info("listener <{callback}> is removed", callback=subscription.callback.__name__)
+        return True
+
+    def compact_listeners(self):
+        """
+        从立即触发表与联合触发表中移除已取消订阅的监听器，由process()在开始时调用，不能在分发过程中调用\n
+        只重建有监听器被取消的事件的列表，开销均摊到每次取消订阅上
+        """
+        if not self.removed_ids:
+            return
+
+        with self.listener_lock:
+            for event_id in self.removed_ids:
+                callbacks = self.immediate_table[event_id]
+                subscriptions = self.immediate_subscriptions[event_id]
+                kept = [index for index, subscription in enumerate(subscriptions) if subscription is not None]
+                if len(kept) != len(subscriptions):
+                    # 原地修改，已经取得列表引用的代码（如process_batch()）仍然有效
+                    callbacks[:] = [callbacks[index] for index in kept]
+                    subscriptions[:] = [subscriptions[index] for index in kept]
+                    for index, subscription in enumerate(subscriptions):
+                        subscription.index = index
+
+                if self.joint_removed:
+                    conditions = self.joint_table[event_id]
+                    conditions[:] = [condition for condition in conditions if condition.active]
+
+            if self.joint_removed:
+                self.joint_conditions = [condition for condition in self.joint_conditions if condition.active]
+                self.joint_removed = False
+            self.removed_ids.clear()
+
+    def freeze(self):
+        """
+        冻结监听器结构，由LabelTriggerManager.install_to_eventbus()在安装完成后调用\n
+        1. 压缩已取消订阅的监听器、编译模式自动机，每个事件的立即触发监听器、订阅句柄与联合条件固定为元组
+        2. 生成与立即触发表一一对应的分发表（见_compile_callback()），没有逐个回调的日志与指标时使用：
+           分发表不会被原地修改，立即触发循环只检查是否有监听器在分发过程中被取消订阅，被取消订阅的监听器不再以空操作占位
+        3. 之后注册或取消订阅监听器时重建所在事件的元组，不需要解冻；分发过程中注册的监听器从下一个事件开始触发，
+           被取消订阅的监听器在本次分发中不再执行
+        4. 没有编号的事件（没有监听器关心）只查找一次符号表，不会为其创建任何表项
+        """
+        with self.listener_lock:
+            if self.frozen:
+                return
+            self.compact_listeners()
+            if self.pattern_automaton_dirty:
+                self.compile_patterns()
+            # 原地替换列表中的元素，已经取得列表引用的代码（如process_batch()）仍然有效
+            self.immediate_table[:] = [tuple(callbacks) for callbacks in self.immediate_table]
+            self.immediate_subscriptions[:] = [tuple(subscriptions) for subscriptions in self.immediate_subscriptions]
+            self.joint_table[:] = [tuple(conditions) for conditions in self.joint_table]
+            self.dispatch_table[:] = [tuple(EventBus._compile_callback(callback) for callback in callbacks)
+                                      for callbacks in self.immediate_table]
+            self.frozen_removed.clear()
+            self.frozen = True
+        self.event_logger.info("event bus frozen, {count} events with listeners", count=len(self.symbols))
+
+    @staticmethod
+    def _compile_callback(callback: Callable) -> Callable:
+        """
+        分发表中使用的等价回调：bind_callback()绑定单个实例（如标签实例）的functools.partial被替换为绑定方法，调用开销约为一半\n
+        替换后的回调没有原回调的名称，只在不记录日志与指标时使用，其它回调保持不变
+        """
+        if (callback.__class__ is functools.partial and len(callback.args) == 1 and not callback.keywords
+                and callback.func.__class__ is types.FunctionType):
+            return types.MethodType(callback.func, callback.args[0])
+        return callback
+
+    def bind_callback(self, func: Callable, *args, publish: Optional[str] = None,
+                      priority: int = EventQueue.NORMAL) -> Callable:
+        """
+        将func与前置参数绑定为监听器回调，等价于lambda *rest: publish_event(publish, priority)(func)(*args, *rest)，
+        但没有中间的lambda与装饰器包装层：不发布事件时为functools.partial，发布事件时只多一层函数调用
+        :param publish: 不为None时在func执行结束后发布该事件
+        :raise ValueError: priority不是EventQueue的车道之一
+        """
+        if priority not in EventQueue.PRIORITIES:
+            raise EventQueue.invalid_priority(priority)
+        if publish is None:
+            return functools.partial(func, *args)
+
+        bus_publish = self.publish
+
+        def published_callback(*rest):
+            func(*args, *rest)
+            bus_publish(publish, None, priority)
+        return published_callback
 
     """以下是装饰器版本的实现，支持使用装饰器将一个函数绑定到一个监听器的回调"""
 
-    def publish_event(self, event: str):
+    def publish_event(self, event: str, priority: int = EventQueue.NORMAL):
         """
         事件发布的装饰器版本\n
         该装饰器须在监听器装饰器@listen_xxx之前调用（该装饰器在@listen_xx下方）
         :param event:
+        :param priority: 见publish()
         :return:
         """
+        if priority not in EventQueue.PRIORITIES:
+            raise EventQueue.invalid_priority(priority)
+
         def decorator(func: Callable):
             @functools.wraps(func) #保留原函数的元信息
             def wrapper(*args, **kwargs):
                 func(*args, **kwargs)
-                self.publish(event)
+                self.publish(event, priority=priority)
             return wrapper
         return decorator
 
-    def listen_immediately(self, source: str):
+    def listen_immediately(self, source: str, independent: bool = False, with_payload: bool = False):
         """
         添加监听器的装饰器版本\n
         该装饰器须在@publish_event之后调用（该装饰器在@publish_event上方）
         """
         def decorator(callback: Callable):
-            self.add_immediate_listener(source, callback)
+            self.add_immediate_listener(source, callback, independent, with_payload)
             return callback
 
         return decorator
 
-    def listen_delayed(self, source: str,delay: int):
+    def listen_delayed(self, source: str,delay: int, with_payload: bool = False):
         """
         添加监听器的装饰器版本\n
         该装饰器须在@publish_event之后调用（该装饰器在@publish_event上方）
         """
         def decorator(callback: Callable):
-            self.add_delayed_listener(source, delay, callback)
+            self.add_delayed_listener(source, delay, callback, with_payload=with_payload)
             return callback
 
         return decorator
 
-    def listen_jointly(self, sources: List[str]):
+    def listen_timed(self, source: str, delay_ms: int, with_payload: bool = False):
         """
         添加监听器的装饰器版本\n
         该装饰器须在@publish_event之后调用（该装饰器在@publish_event上方）
         """
         def decorator(callback: Callable):
-            self.add_joint_listener(sources, callback)
+            self.add_timed_listener(source, delay_ms, callback, with_payload=with_payload)
             return callback
 
         return decorator
 
-    def listen_pattern_matcher(self, pattern: List[str]):
+    def listen_jointly(self, sources: List[str], with_payload: bool = False,
+                       window_events: Optional[int] = None, window_ms: Optional[int] = None):
         """
         添加监听器的装饰器版本\n
         该装饰器须在@publish_event之后调用（该装饰器在@publish_event上方）
         """
         def decorator(callback: Callable):
-            self.add_pattern_listener(pattern,callback)
+            self.add_joint_listener(sources, callback, with_payload=with_payload,
+                                    window_events=window_events, window_ms=window_ms)
+            return callback
+
+        return decorator
+
+    def listen_pattern_matcher(self, pattern: List[str], with_payload: bool = False):
+        """
+        添加监听器的装饰器版本\n
+        该装饰器须在@publish_event之后调用（该装饰器在@publish_event上方）
+        """
+        def decorator(callback: Callable):
+            self.add_pattern_listener(pattern,callback, with_payload=with_payload)
+            return callback
+
+        return decorator
+
+    def listen_topic(self, topic: str, with_payload: bool = False):
+        """
+        添加监听器的装饰器版本\n
+        该装饰器须在@publish_event之后调用（该装饰器在@publish_event上方）
+        """
+        def decorator(callback: Callable):
+            self.add_topic_listener(topic, callback, with_payload=with_payload)
             return callback
 
         return decorator
@@ -172,48 +1211,197 @@ class EventBus:
 
 
 class JointCondition:
-    def __init__(self, required_events: Set[str], callback: Callable):
+    """
+    联合监听器，已发生的事件记录在位掩码中，每个需要的事件在条件内按顺序分配一位，第i位为1表示第i个事件已发生\n
+    位掩码的宽度只取决于条件需要的事件数，与事件总线的符号表大小无关
+    """
+    def __init__(self, required_events: Set[str], callback: Callable, required_ids: Dict[str, int]):
+        """
+        :param required_ids: {<事件名>: <事件编号>}，事件编号由EventBus的符号表分配
+        """
         self.required = required_events
-        self.occurred: Set[str] = set()
         self.callback = callback
 
+        #{<事件名>: <该事件对应的位>}
+        self.bits: Dict[str, int] = {event: 1 << index for index, event in enumerate(required_ids)}
+        #{<事件编号>: <该事件对应的位>}，分发时按事件编号查找
+        self.event_bits: Dict[int, int] = {event_id: self.bits[event] for event, event_id in required_ids.items()}
+        self.required_mask = (1 << len(self.bits)) - 1
+        self.occurred_mask = 0
+        self.active = True  # 取消订阅后为False，见EventBus.remove_listener()
+
+    @property
+    def occurred(self) -> Set[str]:
+        """已发生的事件名"""
+        return {event for event, bit in self.bits.items() if self.occurred_mask & bit}
+
     def reset(self):
-        self.occurred = set()
-
-    def on_event(self, event: str):
-        if event in self.required and event not in self.occurred:
-            self.occurred.add(event)
-            if self.occurred == self.required:
-                logger.info(f"EVENTBUS: event callback <func: {self.callback.__name__}> is triggered")
-                self.callback()
+        self.occurred_mask = 0
+
+    def on_event(self, event_id: int) -> bool:
+        """
+        :return: 所有事件都已发生时返回True，由EventBus触发回调
+        """
+        bit = self.event_bits.get(event_id)
+        if bit is not None and not self.occurred_mask & bit:
+            self.occurred_mask |= bit
+            if self.occurred_mask == self.required_mask:
                 self.reset()  # 触发后重置
+                return True
+        return False
+
+
+class WindowedJointCondition(JointCondition):
+    """
+    带窗口的联合监听器，已发生的事件过期后从已发生的事件中移除，避免用很久之前的事件满足条件，也使部分匹配不会一直保留\n
+    1. 每个已发生的事件对应一个到期任务，放在事件总线的延迟触发（按事件数）或定时触发（按毫秒）时间轮中，O(1)
+    2. 同一事件再次发生时刷新其到期时间（取消原任务后重新添加），即条件只看每个事件最近一次发生的时刻
+    3. 条件满足、被重置或取消订阅时取消所有到期任务
+    """
+    def __init__(self, required_events: Set[str], callback: Callable, required_ids: Dict[str, int], window: int,
+                 event_bus: EventBus, timed: bool = False):
+        """
+        :param window: 窗口大小，事件数或毫秒数
+        :param event_bus: 添加到期任务的事件总线
+        :param timed: 为True时窗口按毫秒计算，否则按事件数计算
+        """
+        super().__init__(required_events, callback, required_ids)
+        self.window = window
+        self.event_bus = event_bus
+        self.timed = timed
+        self.schedule = event_bus.schedule_timed if timed else event_bus.schedule_delayed
+
+        #{<事件对应的位>: <到期任务>}
+        self.expiries: Dict[int, TimerHandle] = {}
+        #每个事件的过期回调，只创建一次
+        self.expire_callbacks: Dict[int, JointExpiry] = {
+            bit: JointExpiry(self, bit, event) for event, bit in self.bits.items()
+        }
+
+    def on_event(self, event_id: int) -> bool:
+        bit = self.event_bits.get(event_id)
+        if bit is None:
+            return False
+
+        handle = self.expiries.get(bit)
+        if handle is not None:
+            handle.cancel()
+        self.occurred_mask |= bit
+        if self.occurred_mask == self.required_mask:
+            self.reset()
+            return True
+        self.expiries[bit] = self.schedule(self.window, self.expire_callbacks[bit])
+        return False
+
+    def restore_event(self, event: str, remaining: int):
+        """从快照恢复一个已发生的事件及其剩余的窗口"""
+        bit = self.bits.get(event)
+        if bit is None or remaining <= 0:
+            return
+        self.occurred_mask |= bit
+        self.expiries[bit] = self.schedule(remaining, self.expire_callbacks[bit])
+
+    def remaining(self) -> Dict[str, int]:
+        """每个已发生的事件剩余的窗口，{<事件名>: <剩余事件数或毫秒数>}"""
+        now = self.event_bus._now_ms() if self.timed else self.event_bus.event_count
+        return {self.expire_callbacks[bit].event: max(handle.deadline - now, 1) for bit, handle in self.expiries.items()}
+
+    def reset(self):
+        for handle in self.expiries.values():
+            handle.cancel()
+        self.expiries.clear()
+        self.occurred_mask = 0
+
+
+class JointExpiry:
+    """
+    窗口联合监听器中一个事件的过期回调，作为到期任务的回调放在时间轮中
+    """
+    __slots__ = ('condition', 'bit', 'event', '__name__')
+
+    def __init__(self, condition: WindowedJointCondition, bit: int, event: str):
+        self.condition = condition
+        self.bit = bit
+        self.event = event
+        #在日志和指标中可见
+        self.__name__ = f"joint_expiry_{condition.callback.__name__}"
+
+    def __call__(self):
+        condition = self.condition
+        condition.expiries.pop(self.bit, None)
+        condition.occurred_mask &= ~self.bit
+
+
+class CycleBudget:
+    """
+    事件循环的预算，预算在每次process()开始时重置，耗尽后循环中的事件被丢弃直到下一次process()
+    """
+    def __init__(self, events: Set[str], budget: int):
+        self.events = events
+        self.budget = budget
+        self.remaining = budget
+        self.dropped = 0  # 累计丢弃的事件数
+        self.exhausted = False
+
+    def reset(self):
+        self.remaining = self.budget
+        self.exhausted = False
+
+    def consume(self, event: str) -> bool:
+        """
+        :return: 预算未耗尽时返回True
+        """
+        if self.remaining > 0:
+            self.remaining -= 1
+            return True
+
+        if not self.exhausted:
+            self.exhausted = True
+            logger.critical(f"EVENTBUS: event cycle {sorted(self.events)} exhaust budget {self.budget}, "
+                            f"event <{event}> and following events of this cycle are dropped")
+        self.dropped += 1
+        return False
 
 
 class PatternMatcher:
+    """
+    模式监听器，匹配状态由EventBus.pattern_automaton统一维护
+    """
     def __init__(self, pattern: List[str], callback: Callable):
         self.pattern = pattern
-        self.state = 0  # 当前匹配位置
         self.callback = callback
+        self.active = True  # 取消订阅后为False，见EventBus.remove_listener()
 
-    def reset(self):
-        self.state = 0
-
-    def on_event(self, event: str):
-        if self.state < len(self.pattern):
-            if self.pattern[self.state] == '*' or self.pattern[self.state] == event:
-                self.state += 1
-                if self.state == len(self.pattern):
-                    logger.info(f"EVENTBUS: event callback <func: {self.callback.__name__}> is triggered")
-                    self.callback()
-                    self.reset()  # 触发后重置
-            else:
-                self.reset()
-                if self.pattern[0] == '*' or self.pattern[0] == event:
-                    self.state = 1
-                    if self.state == len(self.pattern):
-                        logger.info(f"EVENTBUS: event callback <func: {self.callback.__name__}> is triggered")
-                        self.callback()
-                        self.reset()
+
+class Subscription:
+    """
+    监听器的订阅句柄，由EventBus.add_xxx_listener()返回，调用remove()取消订阅
+    """
+    __slots__ = ('event_bus', 'listener_type', 'callback', 'event_id', 'index', 'target', 'active')
+
+    def __init__(self, event_bus: EventBus, listener_type: int, callback: Callable, event_id: Optional[int] = None,
+                 index: Optional[int] = None, target: Optional[object] = None):
+        """
+        :param callback: 注册到事件总线中的回调（可能是负载、延迟或定时包装函数）
+        :param event_id: 只对立即、延迟、定时监听器有效，监听的事件编号
+        :param index: 对立即、延迟、定时监听器为回调在立即触发表中的位置，压缩时更新；对主题监听器为订阅在TopicTrie中的序号
+        :param target: 对联合、模式监听器为对应的JointCondition或PatternMatcher，对主题监听器为订阅的主题
+        """
+        self.event_bus = event_bus
+        self.listener_type = listener_type
+        self.callback = callback
+        self.event_id = event_id
+        self.index = index
+        self.target = target
+        self.active = True
+
+    def remove(self) -> bool:
+        """见EventBus.remove_listener()"""
+        return self.event_bus.remove_listener(self)
+
+
+def _removed_listener(*args):
+    """已取消订阅的监听器在表中的占位，压缩前被分发时什么也不做"""
 
 """
 示例1：
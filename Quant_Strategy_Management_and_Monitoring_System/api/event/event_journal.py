@@ -0,0 +1,287 @@
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterator, List, Tuple
+
+from loguru import logger
+
+
+class EventJournal:
+    """
+    事件总线的追加写日志，记录每个被发布与被处理的事件，用于重启后恢复事件总线的状态与查看历史\n
+    1. 日志由目录下的多个段文件组成（<序号>.journal），每次打开日志都从一个新的段开始写入，段文件超过segment_size后切换到下一个段；
+       新段以O_EXCL创建，多个进程误用同一个目录时各自写入不同的段，不会交错写入同一个文件
+    2. 记录为紧凑的二进制格式，事件名在每个段中第一次出现时写入一条SYMBOL记录，之后的记录只保存4字节的符号编号：
+       BASE:     <B kind><I 0><q 该段之前的DISPATCH记录数>  段的第一条记录，删除旧的段之后重放仍能得到每条记录的位置
+       SYMBOL:   <B kind><I 符号编号><H 名称长度><名称 utf-8>
+       PUBLISH:  <B kind><I 符号编号><q 毫秒时间戳>  事件被发布（包括因队列满被丢弃的事件）
+       DISPATCH: <B kind><I 符号编号><q 毫秒时间戳>  事件被取出处理（不包括被事件风暴预算丢弃的事件）
+       MERGED:   <B kind><I 符号编号><q 合并数>      紧接着的DISPATCH事件中合并了多少个同名事件（见EventBus.add_coalesce_rule）
+    3. 记录先写入内存缓冲区，缓冲区超过buffer_size或调用flush()时写入文件；距离上一次fsync超过fsync_interval秒时才执行fsync（批量fsync）
+    4. 重放时以只读方式内存映射每个段文件，按顺序解析DISPATCH记录，使用EventBus.replay_event()只恢复状态而不执行触发器：
+       事件计数、联合触发的已发生事件（包括按事件数的窗口过期）、模式匹配的进行中状态、尚未触发的延迟任务；
+       按毫秒延迟的定时任务不会被恢复，按毫秒窗口的联合条件从重放时开始重新计时
+    5. 段文件末尾不完整的记录（写入时崩溃）在重放时被忽略
+    6. 保存快照后调用retain()删除所有记录都已包含在快照中的段，日志目录的大小与重放耗时只取决于上一次快照之后的事件数
+    """
+
+    #record kind enum
+    SYMBOL = 1
+    PUBLISH = 2
+    DISPATCH = 3
+    MERGED = 4
+    BASE = 5
+
+    RECORD = struct.Struct('<BIq')
+    SYMBOL_HEADER = struct.Struct('<BIH')
+
+    SUFFIX = '.journal'
+
+    def __init__(self, directory: str, segment_size: int = 64 * 1024 * 1024, buffer_size: int = 64 * 1024,
+                 fsync_interval: float = 0.1):
+        """
+        :param directory: 段文件所在目录，不存在时自动创建
+        :param segment_size: 单个段文件的大小上限（字节）
+        :param buffer_size: 内存缓冲区超过该大小时写入文件
+        :param fsync_interval: 两次fsync的最短间隔秒数，为0时每次flush()都执行fsync
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self.buffer_size = buffer_size
+        self.fsync_interval = fsync_interval
+
+        os.makedirs(directory, exist_ok=True)
+
+        #发布事件的线程可能不是处理事件的线程（如并行分发中的independent监听器）
+        self.lock = threading.Lock()
+        self.buffer = bytearray()
+        self.last_fsync = time.monotonic()
+
+        #当前段中的符号表，{<事件名>: <符号编号>}
+        self.symbols: Dict[str, int] = {}
+
+        segments = self.segments()
+        #日志中的DISPATCH记录数（包括重放的记录），用于快照记录日志的位置；不重放时也要从已有的段继续计数，见_recorded_dispatch_count()
+        self.dispatch_count = self._recorded_dispatch_count(segments)
+        self.segment_index = self._segment_index(segments[-1]) + 1 if segments else 0
+        self.file = self._open_segment()
+
+    def segments(self) -> List[str]:
+        """按写入顺序排列的段文件路径"""
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(EventJournal.SUFFIX))
+        return [os.path.join(self.directory, name) for name in names]
+
+    @staticmethod
+    def _recorded_dispatch_count(segments: List[str]) -> int:
+        """
+        已有的段中的DISPATCH记录数：从最后一个段向前找到第一个有BASE记录的段，为该BASE记录的值加上它及之后各段的DISPATCH记录数\n
+        通常只需读取最后一个段；所有段都已被retain()删除时为0，之后由replay()的skip（快照的位置）修正
+        """
+        count = 0
+        for path in reversed(segments):
+            base = None
+            for kind, _, value in EventJournal._read_segment(path):
+                if kind == EventJournal.DISPATCH:
+                    count += 1
+                elif kind == EventJournal.BASE:
+                    base = value
+            if base is not None:
+                return base + count
+        return count
+
+    @staticmethod
+    def _segment_index(path: str) -> int:
+        return int(os.path.basename(path)[:-len(EventJournal.SUFFIX)])
+
+    def _open_segment(self):
+        while True:
+            path = os.path.join(self.directory, f"{self.segment_index:08d}{EventJournal.SUFFIX}")
+            try:
+                # 'x'即O_EXCL，同一个序号的段已被其它进程创建时使用下一个序号
+                file = open(path, 'xb', buffering=0)
+            except FileExistsError:
+                logger.warning(f"EVENTBUS: journal segment <{path}> already exists, another process may be writing to <{self.directory}>")
+                self.segment_index += 1
+                continue
+            self.symbols = {}
+            return file
+
+    def append(self, kind: int, event: str, value: int = None):
+        """
+        :param value: 记录的最后一个字段，默认为当前毫秒时间戳
+        """
+        with self.lock:
+            symbol = self.symbols.get(event)
+            if symbol is None:
+                if not self.symbols:
+                    # 段的第一条记录，dispatch_count在打开日志时（或重放后）已经包含之前所有段中的记录
+                    self.buffer += EventJournal.RECORD.pack(EventJournal.BASE, 0, self.dispatch_count)
+                symbol = self.symbols[str(event)] = len(self.symbols)
+                name = event.encode('utf-8')
+                self.buffer += EventJournal.SYMBOL_HEADER.pack(EventJournal.SYMBOL, symbol, len(name))
+                self.buffer += name
+            self.buffer += EventJournal.RECORD.pack(kind, symbol, int(time.time() * 1000) if value is None else value)
+            if kind == EventJournal.DISPATCH:
+                self.dispatch_count += 1
+
+            if len(self.buffer) >= self.buffer_size:
+                self._flush()
+
+    def flush(self, sync: bool = False):
+        """
+        将缓冲区写入文件
+        :param sync: 为True时无论距离上一次fsync多久都执行fsync
+        """
+        with self.lock:
+            self._flush(sync)
+
+    def _flush(self, sync: bool = False):
+        if self.buffer:
+            self.file.write(self.buffer)
+            self.buffer = bytearray()
+
+        now = time.monotonic()
+        if sync or now - self.last_fsync >= self.fsync_interval:
+            os.fsync(self.file.fileno())
+            self.last_fsync = now
+
+        if self.file.tell() >= self.segment_size:
+            os.fsync(self.file.fileno())
+            self.file.close()
+            self.segment_index += 1
+            self.file = self._open_segment()
+
+    def close(self):
+        with self.lock:
+            self._flush(sync=True)
+            self.file.close()
+
+    def read(self) -> Iterator[Tuple[int, str, int]]:
+        """
+        按顺序读取所有PUBLISH、DISPATCH、MERGED与BASE记录（不包括内存缓冲区中尚未写入的记录）
+        :return: (<kind>, <事件名>, <毫秒时间戳、合并数或段的起始位置>)，BASE记录的事件名为None
+        """
+        for path in self.segments():
+            for kind, event, timestamp in self._read_segment(path):
+                yield kind, event, timestamp
+
+    @staticmethod
+    def _read_segment(path: str) -> Iterator[Tuple[int, str, int]]:
+        if os.path.getsize(path) == 0:
+            return
+
+        record_size = EventJournal.RECORD.size
+        symbol_header_size = EventJournal.SYMBOL_HEADER.size
+        unpack_record = EventJournal.RECORD.unpack_from
+        unpack_symbol = EventJournal.SYMBOL_HEADER.unpack_from
+
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            size = len(data)
+            names: List[str] = []
+            offset = 0
+            while offset < size:
+                kind = data[offset]
+                if kind == EventJournal.SYMBOL:
+                    if offset + symbol_header_size > size:
+                        break
+                    _, symbol, length = unpack_symbol(data, offset)
+                    end = offset + symbol_header_size + length
+                    if end > size:
+                        break
+                    names.append(data[offset + symbol_header_size:end].decode('utf-8'))
+                    offset = end
+                    continue
+
+                if offset + record_size > size:
+                    break
+                kind, symbol, timestamp = unpack_record(data, offset)
+                offset += record_size
+                if kind == EventJournal.BASE:
+                    yield kind, None, timestamp
+                    continue
+                yield kind, names[symbol], timestamp
+
+    def replay(self, eventBus, skip: int = 0) -> int:
+        """
+        将日志中的DISPATCH记录按顺序重放到事件总线中，只恢复状态，不执行触发器，也不会写入新的记录\n
+        应在事件总线安装完成（所有监听器已注册）之后、处理新事件之前调用
+        :param skip: 跳过位置在skip之前的DISPATCH记录（已经包含在快照中的事件）
+        :return: 重放的事件数
+        """
+        with self.lock:
+            self._flush()
+
+        start = time.perf_counter()
+        replay_event = eventBus.replay_event
+        count = 0
+        merged = 0
+        # 打开日志时已经统计过已有的记录，重放时从头重新计数（旧版本写入的段没有BASE记录）
+        self.dispatch_count = 0
+        for kind, event, value in self.read():
+            if kind == EventJournal.MERGED:
+                merged = value
+            elif kind == EventJournal.DISPATCH:
+                self.dispatch_count += 1
+                if self.dispatch_count <= skip:
+                    merged = 0
+                    continue
+                replay_event(event, merged)
+                merged = 0
+                count += 1
+            elif kind == EventJournal.BASE:
+                self.dispatch_count = value
+        # 快照之前的段都已被删除时，之后的记录从快照的位置继续计数
+        self.dispatch_count = max(self.dispatch_count, skip)
+
+        logger.success(f"EVENTBUS: {count} events replayed from journal <{self.directory}> "
+                       f"in {time.perf_counter() - start:.3f}s")
+        return count
+
+    def retain(self, position: int) -> List[str]:
+        """
+        删除所有DISPATCH记录都在position之前的段，应在快照文件写入完成后调用\n
+        1. 当前写入的段与之后的段（其它进程创建的段）不会被删除
+        2. 只删除开头连续的段，且保留的第一个非空段必须以BASE记录开始（旧版本写入的段没有BASE记录），否则重放时无法得知记录的位置
+        :param position: 快照中记录的日志位置（见EventBusSnapshot.capture）
+        :return: 被删除的段文件路径
+        """
+        with self.lock:
+            self._flush()
+            current = self.file.name
+
+        # 当前段之前的段已经关闭，不再被写入，扫描时不需要持有锁
+        ranges: List[Tuple[str, bool, int]] = []
+        end = 0
+        for path in self.segments():
+            if path == current:
+                break
+            based = False
+            for kind, _, value in EventJournal._read_segment(path):
+                if kind == EventJournal.BASE:
+                    end = value
+                    based = True
+                elif kind == EventJournal.DISPATCH:
+                    end += 1
+            # 空段不影响位置，由之后的段决定
+            ranges.append((path, based if os.path.getsize(path) else None, end))
+
+        # 当前段的BASE记录在第一次写入时生成
+        based = True
+        removable: List[bool] = []
+        for path, segment_based, end in reversed(ranges):
+            removable.append(end <= position and based)
+            if segment_based is not None:
+                based = segment_based
+        removable.reverse()
+
+        removed = []
+        for (path, _, _), can_remove in zip(ranges, removable):
+            if not can_remove:
+                break
+            os.remove(path)
+            removed.append(path)
+        if removed:
+            logger.info(f"EVENTBUS: {len(removed)} journal segments before position {position} removed from <{self.directory}>")
+        return removed
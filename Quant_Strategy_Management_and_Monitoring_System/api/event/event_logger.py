@@ -0,0 +1,120 @@
+from loguru import logger
+
+
+class EventLogger:
+    """
+    事件总线热路径使用的日志层\n
+    1. 级别门控：低于EventLogger.level的记录在调用loguru之前就被丢弃，消息模板使用str.format风格的占位符，只有通过门控的记录才会被格式化
+    2. 采样：每处理sample_rate个事件只记录其中1个事件的逐事件日志（事件处理、回调触发、事件发布），sample_rate为1时记录全部事件
+    3. 追踪开关：trace为True的实例忽略级别与采样，记录全部日志，用于对单个用户的事件总线开启完整追踪；
+       set_events(False)关闭单个实例的逐事件日志（如离线回测），追踪开关仍然优先
+    4. 结构化：关键字参数既用于格式化消息，也会写入loguru记录的extra字段；bind()绑定的上下文（如user_id）写入该实例的所有记录
+    5. 级别与采样率是全局的，由api.apps.ApiConfig.ready()根据settings调用configure()设置
+    """
+
+    #loguru默认级别的数值
+    LEVELS = {
+        'TRACE': 5,
+        'DEBUG': 10,
+        'INFO': 20,
+        'SUCCESS': 25,
+        'WARNING': 30,
+        'ERROR': 40,
+        'CRITICAL': 50,
+    }
+
+    #全局最低级别
+    level: int = LEVELS['INFO']
+
+    #逐事件日志的采样率，每sample_rate个事件记录1个
+    sample_rate: int = 1
+
+    #逐事件日志（INFO）是否通过级别门控
+    events_enabled: bool = True
+
+    def __init__(self, prefix: str = 'EVENTBUS', trace: bool = False, **context):
+        """
+        :param prefix: 消息前缀，与原有日志保持一致，如"EVENTBUS: ..."
+        :param trace: 是否开启追踪
+        :param context: 写入所有记录extra字段的上下文
+        """
+        self.prefix = prefix
+        self.trace = trace
+        #该实例是否记录逐事件日志，见set_events()
+        self.events = True
+        self.context = context
+        self._bind_logger()
+
+        #当前事件的逐事件日志是否需要记录，由begin_event()更新；调用方在热路径中先检查该属性，避免构造参数的开销
+        self.active = trace or EventLogger.events_enabled
+        self._event_counter = 0
+
+    @staticmethod
+    def configure(level: str = 'INFO', sample_rate: int = 1):
+        """
+        设置全局级别与采样率，对已创建的实例同样生效（从下一个事件开始）
+        :param level: loguru级别名
+        :param sample_rate: 大于等于1的整数
+        """
+        if level not in EventLogger.LEVELS:
+            raise ValueError(f"EVENTBUS: unknown log level <{level}>, must be one of {tuple(EventLogger.LEVELS)}")
+        if sample_rate < 1:
+            raise ValueError(f"EVENTBUS: log sample rate must be a positive integer, got {sample_rate}")
+
+        EventLogger.level = EventLogger.LEVELS[level]
+        EventLogger.sample_rate = sample_rate
+        EventLogger.events_enabled = EventLogger.level <= EventLogger.LEVELS['INFO']
+
+    def bind(self, **context):
+        """向该实例的所有记录添加上下文"""
+        self.context.update(context)
+        self._bind_logger()
+
+    def _bind_logger(self):
+        # opt()和bind()每次调用都会创建新的Logger，因此只在上下文变化时创建一次；depth=1使记录的位置指向调用方
+        self._logger = logger.bind(**self.context).opt(depth=1)
+        self._info = self._logger.info
+
+    def set_trace(self, enabled: bool):
+        self.trace = enabled
+        self.active = enabled or (self.events and EventLogger.events_enabled)
+
+    def set_events(self, enabled: bool):
+        """开启或关闭该实例的逐事件日志，不影响全局级别与其它实例"""
+        self.events = enabled
+        self.active = self.trace or (enabled and EventLogger.events_enabled)
+
+    def begin_event(self):
+        """开始处理一个新事件，根据追踪开关、级别与采样率决定该事件的逐事件日志是否记录"""
+        if self.trace:
+            self.active = True
+        elif not EventLogger.events_enabled or not self.events:
+            self.active = False
+        else:
+            self._event_counter += 1
+            self.active = self._event_counter % EventLogger.sample_rate == 0
+
+    def event(self, message: str, **fields):
+        """逐事件日志，受级别门控、采样和追踪开关控制"""
+        if self.active:
+            self._info(f"{self.prefix}: {message}", **fields)
+
+    def enabled(self, level: str) -> bool:
+        return self.trace or EventLogger.LEVELS[level] >= EventLogger.level
+
+    def log(self, level: str, message: str, **fields):
+        """普通日志，只受级别门控和追踪开关控制"""
+        if self.trace or EventLogger.LEVELS[level] >= EventLogger.level:
+            self._logger.log(level, f"{self.prefix}: {message}", **fields)
+
+    def debug(self, message: str, **fields):
+        if self.trace or EventLogger.LEVELS['DEBUG'] >= EventLogger.level:
+            self._logger.debug(f"{self.prefix}: {message}", **fields)
+
+    def info(self, message: str, **fields):
+        if self.trace or EventLogger.LEVELS['INFO'] >= EventLogger.level:
+            self._logger.info(f"{self.prefix}: {message}", **fields)
+
+    def success(self, message: str, **fields):
+        if self.trace or EventLogger.LEVELS['SUCCESS'] >= EventLogger.level:
+            self._logger.success(f"{self.prefix}: {message}", **fields)
@@ -0,0 +1,234 @@
+from threading import Lock
+from time import perf_counter_ns
+from typing import Callable, Dict, List
+
+from api.event.event_engine import EventBus
+
+
+class LatencyHistogram:
+    """
+    以2为底的对数直方图，第i个桶记录耗时在[2^(i-1), 2^i)纳秒内的次数\n
+    记录一次只需要一次int.bit_length()和几次整数加法，分位数为所在桶的上界（误差不超过2倍）
+    """
+    __slots__ = ('count', 'total_ns', 'max_ns', 'buckets')
+
+    BUCKETS = 65  # int64纳秒的bit_length为0到64
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.buckets: List[int] = [0] * LatencyHistogram.BUCKETS
+
+    def record(self, elapsed_ns: int):
+        self.count += 1
+        self.total_ns += elapsed_ns
+        if elapsed_ns > self.max_ns:
+            self.max_ns = elapsed_ns
+        self.buckets[elapsed_ns.bit_length()] += 1
+
+    def merge(self, other: 'LatencyHistogram'):
+        self.count += other.count
+        self.total_ns += other.total_ns
+        self.max_ns = max(self.max_ns, other.max_ns)
+        for index, bucket in enumerate(other.buckets):
+            self.buckets[index] += bucket
+
+    def percentile(self, q: float) -> int:
+        """第q分位数（0到1）的上界，单位纳秒"""
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= rank:
+                return min(1 << index, self.max_ns)
+        return self.max_ns
+
+    def snapshot(self) -> Dict:
+        return {
+            'count': self.count,
+            'total_ms': self.total_ns / 1e6,
+            'mean_us': self.total_ns / self.count / 1e3 if self.count else 0.0,
+            'p50_us': self.percentile(0.5) / 1e3,
+            'p90_us': self.percentile(0.9) / 1e3,
+            'p99_us': self.percentile(0.99) / 1e3,
+            'max_us': self.max_ns / 1e3,
+        }
+
+
+class EventBusMetrics:
+    """
+    事件总线的计数器与耗时直方图，通过EventBus.enable_metrics()挂载到事件总线上\n
+    1. 事件：按事件名统计处理次数、处理耗时、触发的回调数（扇出）
+    2. 监听器：按回调统计调用次数与耗时，回调名使用__name__（LabelTriggerManager安装的回调名为"<class_name>.<trigger_name>"）
+    3. 监听器类型：IMMEDIATE、DELAY（包括定时触发）、JOINT、PATTERN、TOPIC各一个直方图
+    4. 队列深度、延迟任务与定时任务的数量在每次process()开始时采样，snapshot()中为当前值与最大值
+    5. 回调不会被包装，计时由事件总线的分发循环在调用前后完成；未挂载时分发循环只多一次None判断
+    6. 计数不加锁，并行分发时只在分发线程中汇总记录；新增与移除直方图时加锁，snapshot()在锁内复制各表后再汇总，
+       可以在处理事件的后台线程（WORKER与SCHEDULER模式）之外调用
+    7. 按事件名统计的事件数超过max_events后，新的事件名（如大量不同的主题）合并记录到OTHER_EVENTS中
+    8. 取消订阅时移除该回调的直方图（见discard_listener()），其调用仍计入所属监听器类型的直方图
+    """
+
+    LISTENER_TYPES = {
+        EventBus.IMMEDIATE: 'IMMEDIATE',
+        EventBus.DELAY: 'DELAY',
+        EventBus.JOINT: 'JOINT',
+        EventBus.PATTERN: 'PATTERN',
+        EventBus.TOPIC: 'TOPIC',
+    }
+
+    #按事件名统计的事件数上限，由settings.EVENTBUS_METRICS_MAX_EVENTS设置
+    max_events: int = 4096
+    #超过上限后新的事件名合并记录到该键下
+    OTHER_EVENTS = '<other>'
+
+    def __init__(self):
+        #{<事件名>: [<处理次数>, <触发的回调数>, <LatencyHistogram>]}
+        self.events: Dict[str, list] = {}
+
+        #{<监听器类型>: {<回调>: <LatencyHistogram>}}，同一个回调可以注册为多种监听器
+        self.listeners: Dict[int, Dict[Callable, LatencyHistogram]] = {
+            listener_type: {} for listener_type in EventBusMetrics.LISTENER_TYPES
+        }
+
+        #{<监听器类型>: <LatencyHistogram>}
+        self.listener_types: Dict[int, LatencyHistogram] = {
+            listener_type: LatencyHistogram() for listener_type in EventBusMetrics.LISTENER_TYPES
+        }
+
+        #所有回调的调用次数，用于计算单个事件的扇出
+        self.calls = 0
+
+        self.max_queue_depth = 0
+        self.max_delayed_tasks = 0
+        self.max_timed_tasks = 0
+
+        #保护events与listeners的新增、移除与snapshot()中的复制，记录已有的直方图不加锁
+        self.lock = Lock()
+
+    @staticmethod
+    def _key(callback: Callable) -> Callable:
+        # 绑定负载的延迟、定时任务每次触发都是新的函数对象，按原回调（__wrapped__）记录
+        return getattr(callback, '__wrapped__', callback)
+
+    def _listener_histogram(self, callback: Callable, listener_type: int) -> LatencyHistogram:
+        """按原回调查找直方图，只有新增时加锁；调用方已按callback本身查找过（普通回调的键就是其本身）"""
+        histograms = self.listeners[listener_type]
+        key = EventBusMetrics._key(callback)
+        histogram = histograms.get(key)
+        if histogram is not None:
+            return histogram
+        with self.lock:
+            histogram = histograms.get(key)
+            if histogram is None:
+                histogram = histograms[key] = LatencyHistogram()
+        return histogram
+
+    def call(self, callback: Callable, listener_type: int):
+        """调用回调并记录耗时，回调抛出异常时同样记录"""
+        start = perf_counter_ns()
+        try:
+            callback()
+        finally:
+            elapsed_ns = perf_counter_ns() - start
+            self.calls += 1
+            histogram = self.listeners[listener_type].get(callback)
+            if histogram is None:
+                histogram = self._listener_histogram(callback, listener_type)
+            histogram.record(elapsed_ns)
+            self.listener_types[listener_type].record(elapsed_ns)
+
+    @staticmethod
+    def timed_call(callback: Callable) -> int:
+        """在其它线程中调用回调，返回耗时，由调用方在分发线程中调用record_listener()"""
+        start = perf_counter_ns()
+        callback()
+        return perf_counter_ns() - start
+
+    def record_listener(self, callback: Callable, listener_type: int, elapsed_ns: int):
+        self.calls += 1
+        histogram = self.listeners[listener_type].get(callback)
+        if histogram is None:
+            histogram = self._listener_histogram(callback, listener_type)
+        histogram.record(elapsed_ns)
+        self.listener_types[listener_type].record(elapsed_ns)
+
+    def record_event(self, event: str, elapsed_ns: int, callbacks: int):
+        stats = self.events.get(event)
+        if stats is None:
+            stats = self._event_stats(event)
+        stats[0] += 1
+        stats[1] += callbacks
+        stats[2].record(elapsed_ns)
+
+    def _event_stats(self, event: str) -> list:
+        with self.lock:
+            # 携带负载的事件（PayloadEvent）转为普通字符串作为键，避免一直持有第一个负载
+            name = str(event) if len(self.events) < EventBusMetrics.max_events else EventBusMetrics.OTHER_EVENTS
+            stats = self.events.get(name)
+            if stats is None:
+                stats = self.events[name] = [0, 0, LatencyHistogram()]
+        return stats
+
+    def discard_listener(self, callback: Callable):
+        """
+        移除已取消订阅的回调的直方图，由EventBus.remove_listener()调用\n
+        延迟与定时监听器的包装函数与其触发的原回调一并移除；同一个回调仍有其它订阅时，之前的记录同样被移除
+        """
+        callbacks = [EventBusMetrics._key(callback)]
+        scheduled = getattr(callback, 'scheduled_callback', None)
+        if scheduled is not None:
+            callbacks.append(EventBusMetrics._key(scheduled))
+        with self.lock:
+            for histograms in self.listeners.values():
+                for key in callbacks:
+                    histograms.pop(key, None)
+
+    def sample(self, bus: EventBus):
+        """采样队列深度与延迟、定时任务数量"""
+        depth = bus.event_bus.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+        if len(bus.delayed_tasks) > self.max_delayed_tasks:
+            self.max_delayed_tasks = len(bus.delayed_tasks)
+        if len(bus.timed_tasks) > self.max_timed_tasks:
+            self.max_timed_tasks = len(bus.timed_tasks)
+
+    def snapshot(self, bus: EventBus) -> Dict:
+        """返回可以直接序列化为JSON的指标快照"""
+        # 同名回调（如同一个函数注册为多个监听器）合并显示，{"<监听器类型>:<回调名>": <LatencyHistogram>}
+        with self.lock:
+            events = list(self.events.items())
+            callbacks = [(listener_type, list(histograms.items())) for listener_type, histograms in self.listeners.items()]
+
+        listeners: Dict[str, LatencyHistogram] = {}
+        for listener_type, histograms in callbacks:
+            for callback, histogram in histograms:
+                name = f"{EventBusMetrics.LISTENER_TYPES[listener_type]}:{getattr(callback, '__name__', repr(callback))}"
+                merged = listeners.get(name)
+                if merged is None:
+                    merged = listeners[name] = LatencyHistogram()
+                merged.merge(histogram)
+
+        return {
+            'event_count': bus.event_count,
+            'events': {
+                event: {'processed': processed, 'callbacks': callbacks,
+                        'fan_out': callbacks / processed if processed else 0.0, **histogram.snapshot()}
+                for event, (processed, callbacks, histogram) in events
+            },
+            'listeners': {name: histogram.snapshot() for name, histogram in listeners.items()},
+            'listener_types': {
+                EventBusMetrics.LISTENER_TYPES[listener_type]: histogram.snapshot()
+                for listener_type, histogram in self.listener_types.items()
+            },
+            'queue': {
+                **bus.queue_stats(),
+                'max_depth': self.max_queue_depth,
+            },
+            'delayed_tasks': {'pending': len(bus.delayed_tasks), 'max_pending': self.max_delayed_tasks},
+            'timed_tasks': {'pending': len(bus.timed_tasks), 'max_pending': self.max_timed_tasks},
+        }
@@ -0,0 +1,33 @@
+from typing import Any
+
+
+class PayloadEvent(str):
+    """
+    携带负载的事件，由EventBus.publish(event, payload)创建\n
+    1. 是str的子类，与事件名相等且哈希值相同，因此事件队列（包括COALESCE策略）、符号表、事件日志都按事件名处理，不需要区分是否携带负载
+    2. 负载只保存引用，不会被复制或序列化：支持缓冲区协议的对象（如NumPy数组、共享内存上的memoryview）在监听器中拿到的是同一块内存
+    3. 负载不会写入事件日志与快照
+    """
+
+    def __new__(cls, event: str, payload: Any):
+        instance = super().__new__(cls, event)
+        instance.payload = payload
+        return instance
+
+    def __repr__(self):
+        return f"PayloadEvent({str.__repr__(self)}, payload={self.payload!r})"
+
+
+class CoalescedEvent(PayloadEvent):
+    """
+    设置了合并规则的事件在队列中的形式，由EventQueue创建\n
+    该事件仍在队列中时，之后发布的同名事件被合并到该事件中：merged加一，负载替换为最新的负载（如最新的行情）
+    """
+
+    def __new__(cls, event: str, payload: Any = None):
+        instance = super().__new__(cls, event, payload)
+        instance.merged = 0
+        return instance
+
+    def __repr__(self):
+        return f"CoalescedEvent({str.__repr__(self)}, merged={self.merged}, payload={self.payload!r})"
@@ -0,0 +1,414 @@
+import queue
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple, Set
+
+from loguru import logger
+
+from api.event.event_payload import CoalescedEvent
+
+
+class EventQueue:
+    """
+    EventBus使用的有界FIFO事件队列，底层为collections.deque，不加锁，只能在单线程中使用（process()总是在请求线程中执行）\n
+    队列满时的处理策略由overflow_policy决定，每种策略都有对应的计数器（见stats）：
+    1. DROP_OLDEST：丢弃队列头部最旧的事件，再将新事件放入队列
+    2. DROP_NEWEST：丢弃新事件
+    3. COALESCE：如果队列中已有相同的待处理事件，则将新事件合并到该事件中；否则丢弃新事件
+    4. SPILL：将新事件放入溢出缓冲区，队列有空位时按顺序移回队列（溢出缓冲区非空时新事件也进入缓冲区，保证FIFO）
+    5. BLOCK：阻塞直到队列有空位，只有多线程版本LockedEventQueue支持；正在处理该队列的线程发布事件时不阻塞，见LockedEventQueue
+    事件按优先级放入不同的车道（CRITICAL、HIGH、NORMAL、LOW），容量由所有车道共享：
+    1. 取出事件时优先取更高优先级车道中最早的事件，同一车道内为FIFO
+    2. 防饿死：每次取出时其余非空车道的跳过次数加一，被取出的车道清零；已被连续跳过starvation_limit次的车道先取出一个事件，
+       有多个这样的车道时取跳过次数最多的一个（相同时取优先级高的），被越过的更高优先级车道同样计入跳过，因此不会反过来饿死
+    3. DROP_OLDEST策略丢弃优先级最低的非空车道中最早的事件；如果新事件的优先级比队列中所有事件都低，则丢弃新事件
+    合并规则（与队列是否已满无关）：coalesce_events中的事件在队列中至多只有一个待处理，队列中已有该事件时新事件被合并到其中（见CoalescedEvent），
+    保持原事件的位置与车道，合并数记入stats['merged']与merged_counts
+    """
+
+    #overflow policy enum
+    BLOCK = 'block'
+    DROP_OLDEST = 'drop_oldest'
+    DROP_NEWEST = 'drop_newest'
+    COALESCE = 'coalesce'
+    SPILL = 'spill'
+
+    POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST, COALESCE, SPILL)
+
+    #priority lane enum，数值越小优先级越高，即lanes中的下标
+    CRITICAL = 0
+    HIGH = 1
+    NORMAL = 2
+    LOW = 3
+
+    LANE_NAMES = ('critical', 'high', 'normal', 'low')
+    PRIORITIES = frozenset((CRITICAL, HIGH, NORMAL, LOW))
+
+    #非空车道最多连续被跳过的次数（多个车道同时达到时轮流取出），由api.apps.ApiConfig.ready()根据settings.EVENTBUS_STARVATION_LIMIT设置
+    starvation_limit: int = 64
+
+    def __init__(self, maxsize: int = 1000, overflow_policy: str = DROP_NEWEST, spill_maxsize: int = 0):
+        """
+        :param maxsize: 队列容量，小于等于0时不限制容量
+        :param overflow_policy: 队列满时的处理策略
+        :param spill_maxsize: SPILL策略下溢出缓冲区的容量，小于等于0时不限制容量
+        """
+        if overflow_policy not in EventQueue.POLICIES:
+            raise ValueError(f"EVENTQUEUE: unknown overflow policy <{overflow_policy}>, must be one of {EventQueue.POLICIES}")
+        self._check_policy(overflow_policy)
+
+        self.maxsize = maxsize
+        self.overflow_policy = overflow_policy
+        self.spill_maxsize = spill_maxsize
+
+        #各优先级车道，下标为优先级
+        self.lanes: List[Deque[str]] = [deque() for _ in EventQueue.LANE_NAMES]
+        #所有车道中的事件数（不包括溢出缓冲区）
+        self.size = 0
+        #各车道连续被跳过的次数
+        self.skipped: List[int] = [0] * len(EventQueue.LANE_NAMES)
+        #最近一次get_many()取出的事件所在的车道
+        self.last_lane = EventQueue.NORMAL
+
+        #溢出缓冲区，[(<事件名>, <优先级>), ...]
+        self.spill: Deque[Tuple[str, int]] = deque()
+
+        #COALESCE策略下每个事件在队列中的待处理数量，{<事件名>: <数量>}
+        self.pending: Dict[str, int] = {}
+
+        #设置了合并规则的事件名，由EventBus.add_coalesce_rule()设置
+        self.coalesce_events: Set[str] = set()
+        #合并规则下队列中（包括溢出缓冲区）待处理的事件，{<事件名>: <CoalescedEvent>}
+        self.coalescing: Dict[str, CoalescedEvent] = {}
+        #按事件名统计被合并的事件数，{<事件名>: <数量>}
+        self.merged_counts: Dict[str, int] = {}
+
+        #正在处理该队列中事件的线程id，由EventBus.start_processing()等维护，见LockedEventQueue.put()
+        self.consumers: Set[int] = set()
+
+        self.stats = {
+            'dropped_oldest': 0,
+            'dropped_newest': 0,
+            'coalesced': 0,
+            'merged': 0,
+            'spilled': 0,
+            'blocked': 0,
+            'block_timeout': 0,
+            'overfilled': 0,
+        }
+
+    @staticmethod
+    def invalid_priority(priority) -> ValueError:
+        """发布事件时的优先级不是车道之一，由调用方在检查priority not in PRIORITIES后抛出"""
+        lanes = ', '.join(f"{name.upper()}={lane}" for lane, name in enumerate(EventQueue.LANE_NAMES))
+        return ValueError(f"EVENTQUEUE: unknown priority <{priority!r}>, must be one of EventQueue.{{{lanes}}}")
+
+    def _check_policy(self, overflow_policy: str):
+        if overflow_policy == EventQueue.BLOCK:
+            raise ValueError("EVENTQUEUE: a single threaded event queue cannot block, use LockedEventQueue instead")
+
+    def qsize(self) -> int:
+        return self.size + len(self.spill)
+
+    def lane_depths(self) -> Dict[str, int]:
+        """各优先级车道当前的事件数，{<车道名>: <事件数>}"""
+        return {name: len(lane) for name, lane in zip(EventQueue.LANE_NAMES, self.lanes)}
+
+    def empty(self) -> bool:
+        return not self.size
+
+    def full(self) -> bool:
+        return self._full()
+
+    def _full(self) -> bool:
+        return 0 < self.maxsize <= self.size
+
+    def put(self, event: str, priority: int = NORMAL):
+        self._put(event, priority)
+
+    def get(self) -> str:
+        return self.get_nowait()
+
+    def get_nowait(self) -> str:
+        if not self.size:
+            raise queue.Empty
+        return self._get()
+
+    def get_many(self, n: int) -> List[str]:
+        """
+        从同一个车道的头部一次取出至多n个事件，所在车道记录在last_lane中\n
+        1. 车道的选择与跳过次数只计入第一个事件，之后的每个事件由调用方在处理前调用continue_batch()计入，
+           使批量处理与逐个取出时选择的车道一致（包括处理过程中新发布到低优先级车道的事件）
+        2. 取出的合并规则事件在调用方调用release()之前仍可以合并新发布的同名事件，与逐个取出时的合并结果一致
+        """
+        if not self.size:
+            return []
+        lane = self._select()
+        self.last_lane = lane
+        events = []
+        while self.lanes[lane] and len(events) < n:
+            events.append(self._pop(lane, release=False))
+        return events
+
+    def release(self, event: CoalescedEvent):
+        """get_many()取出的合并规则事件开始处理，之后发布的同名事件不再合并到其中"""
+        if self.coalescing.get(event) is event:
+            del self.coalescing[event]
+
+    def continue_batch(self, lane: int) -> bool:
+        """
+        get_many()取出的批次中，处理lane车道的下一个事件前调用，相当于逐个取出时对该事件的一次车道选择\n
+        有更高优先级的待处理事件，或逐个取出时会因防饿死选择其它车道时返回False，
+        此时不修改跳过次数，调用方应将剩余事件放回车道头部（见push_front()），由下一次取出时选择车道；
+        否则与逐个取出时一样计入跳过次数并返回True
+        """
+        lanes = self.lanes
+        for higher in range(lane):
+            if lanes[higher]:
+                return False
+        # 批次中剩余的事件已经取出，lane车道可能为空，_starved()总是将其作为候选
+        if self._starved(lane) != lane:
+            return False
+        self._skip(lane)
+        return True
+
+    def push_front(self, events: List[str], priority: int):
+        """将已取出但尚未处理的事件按原顺序放回车道头部（不检查容量）"""
+        self.lanes[priority].extendleft(reversed(events))
+        self.size += len(events)
+        for event in events:
+            if self.overflow_policy == EventQueue.COALESCE:
+                self.pending[event] = self.pending.get(event, 0) + 1
+            # 取出后又发布的同名事件已经单独进入队列时，不再合并到放回的事件中
+            if event.__class__ is CoalescedEvent and event not in self.coalescing:
+                self.coalescing[event] = event
+
+    def _select(self) -> int:
+        """选择下一个取出事件的车道，调用方保证队列非空"""
+        lanes = self.lanes
+        first = 0
+        while not lanes[first]:
+            first += 1
+        if len(lanes[first]) == self.size:
+            # 只有一个非空车道
+            self.skipped[first] = 0
+            return first
+
+        lane = self._starved(first)
+        self._skip(lane)
+        return lane
+
+    def _starved(self, first: int) -> int:
+        """
+        已被连续跳过starvation_limit次的车道中跳过次数最多的一个（相同时取优先级高的），没有时为first
+        :param first: 最高优先级的非空车道
+        """
+        lanes = self.lanes
+        skipped = self.skipped
+        selected = first
+        most = max(EventQueue.starvation_limit - 1, skipped[first])
+        for lane in range(first + 1, len(lanes)):
+            if lanes[lane] and skipped[lane] > most:
+                selected = lane
+                most = skipped[lane]
+        return selected
+
+    def _skip(self, selected: int):
+        """从selected车道取出一个事件：其余非空车道各计一次跳过，selected车道清零"""
+        lanes = self.lanes
+        skipped = self.skipped
+        for lane in range(len(lanes)):
+            if lanes[lane]:
+                skipped[lane] += 1
+        skipped[selected] = 0
+
+    def _merge(self, event: str) -> bool:
+        """
+        将设置了合并规则的事件合并到队列中待处理的同名事件
+        :return: 是否已合并
+        """
+        pending = self.coalescing.get(event)
+        if pending is None:
+            return False
+        pending.merged += 1
+        if event.__class__ is not str:
+            pending.payload = event.payload
+        self.stats['merged'] += 1
+        self.merged_counts[str(event)] = self.merged_counts.get(event, 0) + 1
+        return True
+
+    def _put(self, event: str, priority: int = NORMAL, overfill: bool = False):
+        """
+        :param overfill: 为True时即使队列已满也放入队列
+        """
+        if self.coalesce_events and event in self.coalesce_events:
+            if self._merge(event):
+                return
+            event = CoalescedEvent(event, None if event.__class__ is str else event.payload)
+
+        if not overfill and (self.spill or self._full()):
+            self._overflow(event, priority)
+            return
+
+        self._append(event, priority)
+
+    def _append(self, event: str, priority: int):
+        self.lanes[priority].append(event)
+        self.size += 1
+        if self.overflow_policy == EventQueue.COALESCE:
+            self.pending[event] = self.pending.get(event, 0) + 1
+        if event.__class__ is CoalescedEvent:
+            self.coalescing[event] = event
+
+    def _get(self) -> str:
+        return self._pop(self._select())
+
+    def _pop(self, lane: int, release: bool = True) -> str:
+        event = self.lanes[lane].popleft()
+        self.size -= 1
+
+        if release and event.__class__ is CoalescedEvent and self.coalescing.get(event) is event:
+            del self.coalescing[event]
+
+        if self.overflow_policy == EventQueue.COALESCE:
+            count = self.pending[event] - 1
+            if count:
+                self.pending[event] = count
+            else:
+                del self.pending[event]
+
+        # 队列有空位，将溢出缓冲区中最早的事件移回队列
+        if self.spill:
+            spilled, priority = self.spill.popleft()
+            self.lanes[priority].append(spilled)
+            self.size += 1
+
+        return event
+
+    def _overflow(self, event: str, priority: int = NORMAL):
+        policy = self.overflow_policy
+
+        if policy == EventQueue.SPILL:
+            if 0 < self.spill_maxsize <= len(self.spill):
+                self.stats['dropped_newest'] += 1
+                logger.critical(f"EVENTQUEUE: spill buffer full, event <{event}> is dropped")
+                return
+            self.spill.append((event, priority))
+            if event.__class__ is CoalescedEvent:
+                self.coalescing[event] = event
+            self.stats['spilled'] += 1
+            return
+
+        if policy == EventQueue.DROP_OLDEST:
+            lowest = len(self.lanes) - 1
+            while not self.lanes[lowest]:
+                lowest -= 1
+            # 新事件的优先级比队列中所有事件都低时丢弃新事件
+            if priority <= lowest:
+                dropped = self._pop(lowest)
+                self._append(event, priority)
+                self.stats['dropped_oldest'] += 1
+                logger.warning(f"EVENTQUEUE: event bus full, oldest event <{dropped}> is dropped")
+                return
+
+        if policy == EventQueue.COALESCE and event in self.pending:
+            self.stats['coalesced'] += 1
+            return
+
+        self.stats['dropped_newest'] += 1
+        logger.warning(f"EVENTQUEUE: event bus full, event <{event}> is dropped")
+
+
+class LockedEventQueue(EventQueue):
+    """
+    线程安全版本的EventQueue，所有操作都在同一把锁下完成，支持BLOCK策略\n
+    1. BLOCK策略下如果等待超过block_timeout秒仍没有空位，则丢弃新事件并记入block_timeout计数器（block_timeout为None时一直等待）
+    2. consumers中的线程（正在处理该队列的线程，以及它等待的并行分发线程）在回调中发布事件时，等待空位会死锁：
+       这些事件不等待，超出容量放入队列（不丢弃），记入overfilled计数器
+    """
+
+    def __init__(self, maxsize: int = 1000, overflow_policy: str = EventQueue.BLOCK, spill_maxsize: int = 0,
+                 block_timeout: Optional[float] = None):
+        super().__init__(maxsize, overflow_policy, spill_maxsize)
+        self.block_timeout = block_timeout
+
+        self.mutex = threading.Lock()
+        self.not_empty = threading.Condition(self.mutex)
+        self.not_full = threading.Condition(self.mutex)
+
+    def _check_policy(self, overflow_policy: str):
+        pass
+
+    def qsize(self) -> int:
+        with self.mutex:
+            return super().qsize()
+
+    def empty(self) -> bool:
+        with self.mutex:
+            return super().empty()
+
+    def full(self) -> bool:
+        with self.mutex:
+            return self._full()
+
+    def put(self, event: str, priority: int = EventQueue.NORMAL):
+        with self.not_full:
+            # 可以合并的事件不占用容量，不需要等待
+            if self.coalesce_events and event in self.coalesce_events and self._merge(event):
+                return
+            overfill = False
+            if self.overflow_policy == EventQueue.BLOCK and self._full():
+                if threading.get_ident() in self.consumers:
+                    # 只有当前线程会取出事件
+                    overfill = True
+                    self.stats['overfilled'] += 1
+                    logger.warning(f"EVENTQUEUE: event bus full, event <{event}> published by the processing thread exceeds the capacity")
+                else:
+                    self.stats['blocked'] += 1
+                    if not self.not_full.wait_for(lambda: not self._full(), timeout=self.block_timeout):
+                        self.stats['block_timeout'] += 1
+                        logger.critical(f"EVENTQUEUE: event bus full for {self.block_timeout}s, event <{event}> is dropped")
+                        return
+            self._put(event, priority, overfill)
+            self.not_empty.notify()
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> str:
+        """
+        :param block: 为True时等待直到有事件可取
+        :param timeout: 等待的最长秒数，超时抛出queue.Empty
+        """
+        with self.not_empty:
+            if block and not self.size:
+                self.not_empty.wait_for(lambda: self.size, timeout=timeout)
+            if not self.size:
+                raise queue.Empty
+            event = self._get()
+            self.not_full.notify()
+            return event
+
+    def get_nowait(self) -> str:
+        return self.get(block=False)
+
+    def get_many(self, n: int) -> List[str]:
+        with self.mutex:
+            events = super().get_many(n)
+            if events:
+                self.not_full.notify(len(events))
+            return events
+
+    def lane_depths(self) -> Dict[str, int]:
+        with self.mutex:
+            return super().lane_depths()
+
+    def release(self, event: CoalescedEvent):
+        with self.mutex:
+            super().release(event)
+
+    def continue_batch(self, lane: int) -> bool:
+        with self.mutex:
+            return super().continue_batch(lane)
+
+    def push_front(self, events: List[str], priority: int):
+        with self.mutex:
+            super().push_front(events, priority)
+            self.not_empty.notify(len(events))
@@ -0,0 +1,237 @@
+import json
+import os
+import struct
+import time
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from api.event.event_engine import EventBus, JointExpiry, WindowedJointCondition
+from api.event.timing_wheel import TimingWheel
+
+
+class SnapshotError(Exception):
+    """快照文件无法识别或已损坏"""
+
+
+class EventBusSnapshot:
+    """
+    事件总线运行时状态的快照与恢复，用于重启后不经过完整安装流程、并保留进行中的触发条件地恢复一个用户的事件总线\n
+    1. 快照只保存状态，不保存监听器：恢复前事件总线必须已按相同的触发器配置安装好监听器（见LabelTriggerManager.restore_eventbus）
+    2. 保存的状态：事件计数、队列中尚未处理的事件及其优先级与合并数、尚未触发的延迟任务（剩余事件数）与定时任务（剩余毫秒数）、
+       联合触发的已发生事件（带窗口时包括每个事件剩余的窗口）、模式匹配的进行中状态、事件日志的位置；事件风暴预算与指标不保存
+    3. 回调按__name__引用（LabelTriggerManager安装的回调名为"<class_name>.<trigger_name>"），恢复时按名称找回回调，
+       找不到的任务和条件被跳过并记录日志；同名的联合监听器、同名且模式相同的模式监听器按注册顺序一一对应
+    4. 文件格式：<MAGIC><B 版本><I 数据长度><zlib压缩的JSON>，写入临时文件后原子替换
+    """
+
+    MAGIC = b'EBSNAP'
+    VERSION = 4
+    HEADER = struct.Struct('<BI')
+
+    @staticmethod
+    def capture(eventBus: EventBus, labels: Optional[Dict[str, str]] = None) -> Dict:
+        """
+        :param labels: 安装到该事件总线的标签，{<class_name>: <InstanceHashTable UUID>}
+        :return: 可以直接序列化为JSON的状态
+        """
+        now_ms = eventBus._now_ms()
+        # 联合条件窗口的到期任务随联合条件一起保存
+        delayed = sorted((handle for handle in eventBus.delayed_tasks.pending() if handle.callback.__class__ is not JointExpiry),
+                         key=lambda handle: (handle.deadline, handle.seq))
+        timed = sorted((handle for handle in eventBus.timed_tasks.pending() if handle.callback.__class__ is not JointExpiry),
+                       key=lambda handle: (handle.deadline, handle.seq))
+
+        return {
+            'event_count': eventBus.event_count,
+            # [[<事件名>, <优先级>, <合并数>], ...]，先按车道顺序，再是溢出缓冲区
+            'queue': [[event, priority, getattr(event, 'merged', 0)]
+                      for priority, lane in enumerate(eventBus.event_bus.lanes) for event in lane]
+                     + [[event, priority, getattr(event, 'merged', 0)] for event, priority in eventBus.event_bus.spill],
+            'delayed_tasks': [[handle.deadline - eventBus.event_count, handle.callback.__name__] for handle in delayed],
+            'timed_tasks': [[max(handle.deadline - now_ms, 0), handle.callback.__name__] for handle in timed],
+            # [[<回调名>, [<已发生的事件名>, ...], {<事件名>: <剩余窗口>}或None], ...]
+            'joint_conditions': [
+                [condition.callback.__name__, sorted(condition.occurred),
+                 condition.remaining() if isinstance(condition, WindowedJointCondition) else None]
+                for condition in eventBus.joint_conditions if condition.active
+            ],
+            'pattern_positions': EventBusSnapshot._capture_patterns(eventBus),
+            'journal_position': eventBus.journal.dispatch_count if eventBus.journal is not None else None,
+            'labels': labels or {},
+            'created_at': time.time(),
+        }
+
+    @staticmethod
+    def _pattern_keys(eventBus: EventBus) -> List[Tuple[str, Tuple[str, ...], int]]:
+        """每个模式监听器的(<回调名>, <模式>, <同名同模式监听器中的序号>)，下标为模式编号"""
+        keys = []
+        seen: Dict[Tuple[str, Tuple[str, ...]], int] = {}
+        for matcher in eventBus.pattern_matchers:
+            key = (matcher.callback.__name__, tuple(matcher.pattern))
+            ordinal = seen.get(key, 0)
+            seen[key] = ordinal + 1
+            keys.append((key[0], key[1], ordinal))
+        return keys
+
+    @staticmethod
+    def _capture_patterns(eventBus: EventBus) -> List:
+        if eventBus.pattern_automaton is None:
+            return []
+        keys = EventBusSnapshot._pattern_keys(eventBus)
+        return [[keys[pattern_id][0], list(keys[pattern_id][1]), keys[pattern_id][2], length]
+                for pattern_id, length in sorted(eventBus.pattern_automaton.positions)
+                if eventBus.pattern_matchers[pattern_id].active]
+
+    @staticmethod
+    def dumps(state: Dict) -> bytes:
+        data = zlib.compress(json.dumps(state, separators=(',', ':')).encode('utf-8'))
+        return EventBusSnapshot.MAGIC + EventBusSnapshot.HEADER.pack(EventBusSnapshot.VERSION, len(data)) + data
+
+    @staticmethod
+    def loads(raw: bytes) -> Dict:
+        """
+        :raise SnapshotError: 文件头不匹配、版本不支持或数据不完整
+        """
+        magic_size = len(EventBusSnapshot.MAGIC)
+        header_end = magic_size + EventBusSnapshot.HEADER.size
+        if len(raw) < header_end or raw[:magic_size] != EventBusSnapshot.MAGIC:
+            raise SnapshotError("not an event bus snapshot")
+
+        version, length = EventBusSnapshot.HEADER.unpack_from(raw, magic_size)
+        if version != EventBusSnapshot.VERSION:
+            raise SnapshotError(f"unsupported snapshot version {version}")
+        if len(raw) - header_end != length:
+            raise SnapshotError("truncated snapshot")
+
+        try:
+            return json.loads(zlib.decompress(raw[header_end:]).decode('utf-8'))
+        except (zlib.error, ValueError) as e:
+            raise SnapshotError(f"corrupted snapshot: {e}")
+
+    @staticmethod
+    def save(eventBus: EventBus, path: str, labels: Optional[Dict[str, str]] = None) -> int:
+        """
+        :return: 快照文件的字节数
+        """
+        raw = EventBusSnapshot.dumps(EventBusSnapshot.capture(eventBus, labels))
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        return len(raw)
+
+    @staticmethod
+    def load(path: str) -> Dict:
+        """
+        :raise SnapshotError: 见loads()
+        """
+        with open(path, 'rb') as f:
+            return EventBusSnapshot.loads(f.read())
+
+    @staticmethod
+    def _scheduling_wrappers(eventBus: EventBus) -> Dict[str, Callable]:
+        """延迟与定时监听器的包装函数，{<原回调名>: <包装函数>}，恢复的任务记录在包装函数上，使取消订阅时可以一并取消"""
+        wrappers: Dict[str, Callable] = {}
+        for table in eventBus.immediate_table:
+            for callback in table:
+                scheduled = getattr(callback, 'scheduled_callback', None)
+                if scheduled is not None:
+                    wrappers.setdefault(scheduled.__name__, callback)
+        return wrappers
+
+    @staticmethod
+    def _callbacks_by_name(eventBus: EventBus) -> Dict[str, Callable]:
+        """事件总线上所有可以按名称找回的回调，包括延迟与定时监听器包装的原回调"""
+        callbacks: Dict[str, Callable] = {}
+        for table in eventBus.immediate_table:
+            for callback in table:
+                callbacks.setdefault(callback.__name__, callback)
+                scheduled = getattr(callback, 'scheduled_callback', None)
+                if scheduled is not None:
+                    callbacks.setdefault(scheduled.__name__, scheduled)
+        for condition in eventBus.joint_conditions:
+            callbacks.setdefault(condition.callback.__name__, condition.callback)
+        for matcher in eventBus.pattern_matchers:
+            callbacks.setdefault(matcher.callback.__name__, matcher.callback)
+        return callbacks
+
+    @staticmethod
+    def restore(eventBus: EventBus, state: Dict):
+        """
+        将快照状态恢复到已安装好监听器、尚未处理过事件的事件总线上
+        """
+        start = time.perf_counter()
+        callbacks = EventBusSnapshot._callbacks_by_name(eventBus)
+        wrappers = EventBusSnapshot._scheduling_wrappers(eventBus)
+        skipped = 0
+
+        eventBus.event_count = state['event_count']
+        for event, priority, merged in state['queue']:
+            eventBus.event_bus.put(event, priority)
+            pending = eventBus.event_bus.coalescing.get(event)
+            if merged and pending is not None:
+                pending.merged += merged
+
+        eventBus.delayed_tasks = TimingWheel(start=eventBus.event_count)
+        for remaining, name in state['delayed_tasks']:
+            callback = callbacks.get(name)
+            if callback is None:
+                skipped += 1
+                continue
+            handle = eventBus.schedule_delayed(remaining, callback)
+            if name in wrappers:
+                EventBus.track_handle(wrappers[name], handle)
+
+        for remaining_ms, name in state['timed_tasks']:
+            callback = callbacks.get(name)
+            if callback is None:
+                skipped += 1
+                continue
+            handle = eventBus.schedule_timed(remaining_ms, callback)
+            if name in wrappers:
+                EventBus.track_handle(wrappers[name], handle)
+
+        # 同名的联合条件按注册顺序一一对应，{<回调名>: [<JointCondition>, ...]}
+        conditions: Dict[str, List] = {}
+        for condition in eventBus.joint_conditions:
+            condition.reset()
+            conditions.setdefault(condition.callback.__name__, []).append(condition)
+        for name, occurred, remaining in state['joint_conditions']:
+            candidates = conditions.get(name)
+            if not candidates:
+                skipped += 1
+                continue
+            condition = candidates.pop(0)
+            for event in occurred:
+                if isinstance(condition, WindowedJointCondition):
+                    # 快照中没有窗口的事件使用完整的窗口
+                    condition.restore_event(event, remaining.get(event, condition.window) if remaining else condition.window)
+                    continue
+                bit = condition.bits.get(event)
+                if bit is not None:
+                    condition.occurred_mask |= bit
+
+        # {(<回调名>, <模式>, <序号>): <模式编号>}
+        pattern_ids = {key: pattern_id for pattern_id, key in enumerate(EventBusSnapshot._pattern_keys(eventBus))}
+        positions = set()
+        for name, pattern, ordinal, length in state['pattern_positions']:
+            pattern_id = pattern_ids.get((name, tuple(pattern), ordinal))
+            if pattern_id is None or length >= len(pattern):
+                skipped += 1
+                continue
+            positions.add((pattern_id, length))
+        eventBus.compile_patterns(positions=positions)
+
+        if skipped:
+            logger.warning(f"EVENTBUS: {skipped} tasks or conditions in snapshot cannot be matched to a listener and are skipped")
+        logger.success(f"EVENTBUS: snapshot restored, event count {eventBus.event_count}, "
+                       f"{len(eventBus.delayed_tasks)} delayed tasks, {len(eventBus.timed_tasks)} timed tasks, "
+                       f"in {time.perf_counter() - start:.3f}s")
@@ -0,0 +1,38 @@
+from typing import Dict, List, Optional
+
+
+class EventSymbolTable:
+    """
+    事件名符号表，将事件名映射为从0开始连续的整数编号\n
+    1. 事件名在注册监听器时（即安装事件总线时）被分配编号，之后各触发表可以使用按编号下标访问的列表代替以事件名为键的字典
+    2. 处理事件时只需查找一次符号表，没有被任何监听器关心的事件不会被分配编号（lookup返回None）
+    3. 编号只在同一个事件总线内有效
+    """
+
+    def __init__(self):
+        #{<事件名>: <编号>}
+        self.ids: Dict[str, int] = {}
+        #下标即编号
+        self.names: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.ids
+
+    def intern(self, name: str) -> int:
+        """返回事件名的编号，事件名第一次出现时分配新编号"""
+        event_id = self.ids.get(name)
+        if event_id is None:
+            event_id = len(self.names)
+            self.ids[name] = event_id
+            self.names.append(name)
+        return event_id
+
+    def lookup(self, name: str) -> Optional[int]:
+        """返回事件名的编号，事件名没有编号时返回None"""
+        return self.ids.get(name)
+
+    def name_of(self, event_id: int) -> str:
+        return self.names[event_id]
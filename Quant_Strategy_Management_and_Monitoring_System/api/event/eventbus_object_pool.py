@@ -1,23 +1,75 @@
+import os
 import threading
 
-from loguru import logger
-
 from api.event.event_engine import EventBus
-from typing import Callable, Dict, Set
+from api.event.event_journal import EventJournal
+from api.event.event_logger import EventLogger
+from api.event.event_metrics import EventBusMetrics
+from api.event.eventbus_scheduler import EventBusScheduler, Tenant
+from api.event.eventbus_worker import EventBusWorker
+from typing import Callable, Dict, Set, Optional, Tuple, Union
 
 
 class EventBusObjectPool:
+    #engine mode enum
+    INLINE = 'inline'
+    WORKER = 'worker'
+    SCHEDULER = 'scheduler'
+    ENGINE_MODES = (INLINE, WORKER, SCHEDULER)
+
     #{"<用户id>": <EventBus实例>, ... }
     eventBusObjectPool: Dict[str, 'EventBus'] = dict()
     pool_lock = threading.RLock()  # 线程安全锁
 
+    #事件引擎的运行方式，由api.apps.ApiConfig.ready()根据settings.EVENTBUS_ENGINE_MODE设置
+    engine_mode: str = INLINE
+    #WORKER模式下每个用户事件总线的后台线程，{"<用户id>": <EventBusWorker实例>, ... }
+    #SCHEDULER模式下为用户在调度器中注册的Tenant（与EventBusWorker有相同的submit()接口）
+    workers: Dict[str, Union[EventBusWorker, Tenant]] = dict()
+
+    #SCHEDULER模式下所有用户共用的调度器，第一次启动用户的事件引擎时创建
+    scheduler: Optional[EventBusScheduler] = None
+    #SCHEDULER模式下用户的时间片权重与配额，{"<用户id>": <权重>}、{"<用户id>": (<步数配额>, <毫秒配额>)}，
+    #未列出的用户权重为1、使用默认配额，由api.apps.ApiConfig.ready()根据settings设置
+    tenant_weights: Dict[str, int] = {}
+    tenant_quotas: Dict[str, Tuple[Optional[int], Optional[float]]] = {}
+
+    #创建新事件总线的工厂，由api.apps.ApiConfig.ready()根据settings设置（如EVENTBUS_ASYNC为True时使用AsyncEventBus）
+    event_bus_factory: Callable[[], EventBus] = EventBus
+
+    #开启完整追踪的用户id，由api.apps.ApiConfig.ready()根据settings.EVENTBUS_TRACE_USERS设置
+    trace_users: Set[str] = set()
+
+    #是否为新创建的事件总线挂载指标收集器，由api.apps.ApiConfig.ready()根据settings.EVENTBUS_METRICS设置
+    metrics_enabled: bool = True
+
+    #事件日志的根目录，每个用户使用其中的<用户id>子目录，为None时不记录事件日志，由api.apps.ApiConfig.ready()根据settings.EVENTBUS_JOURNAL_DIR设置
+    journal_dir: Optional[str] = None
+    journal_options: Dict = {}
+
+    #事件总线快照的目录，为None时不使用快照，由api.apps.ApiConfig.ready()根据settings.EVENTBUS_SNAPSHOT_DIR设置
+    snapshot_dir: Optional[str] = None
+
+    event_logger = EventLogger('EVENTBUSPOOL')
+
     @staticmethod
     def get_for_user(user_id:int):
         user_id = str(user_id)
         with EventBusObjectPool.pool_lock:  # 获取锁
             if user_id not in EventBusObjectPool.eventBusObjectPool:
                 # 在锁保护下创建和插入
-                new_bus = EventBus()
+                new_bus = EventBusObjectPool.event_bus_factory()
+                new_bus.event_logger.bind(user_id=user_id)
+                if user_id in EventBusObjectPool.trace_users:
+                    new_bus.set_trace(True)
+                if EventBusObjectPool.metrics_enabled:
+                    new_bus.enable_metrics(EventBusMetrics())
+                if EventBusObjectPool.journal_dir is not None:
+                    # 日志在LabelTriggerManager.install_to_eventbus()安装完所有监听器后重放
+                    new_bus.enable_journal(EventJournal(
+                        os.path.join(EventBusObjectPool.journal_dir, user_id),
+                        **EventBusObjectPool.journal_options
+                    ))
                 EventBusObjectPool.eventBusObjectPool[user_id] = new_bus
             return EventBusObjectPool.eventBusObjectPool[user_id]
 
@@ -25,5 +77,71 @@ class EventBusObjectPool:
     @staticmethod
     def exist(user_id:int):
         user_id = str(user_id)
-        logger.debug(EventBusObjectPool.eventBusObjectPool)
-        return user_id in EventBusObjectPool.eventBusObjectPool
\ No newline at end of file
+        exist = user_id in EventBusObjectPool.eventBusObjectPool
+        EventBusObjectPool.event_logger.debug("user <{user_id}> event bus exist: {exist}, pool size: {size}",
+                                              user_id=user_id, exist=exist, size=len(EventBusObjectPool.eventBusObjectPool))
+        return exist
+
+    @staticmethod
+    def start_worker(user_id:int) -> Optional[Union[EventBusWorker, Tenant]]:
+        """
+        WORKER模式下为用户的事件总线启动后台线程，SCHEDULER模式下将用户的事件总线注册到调度器（已启动时直接返回），
+        应在事件总线安装完成后调用
+        :return: INLINE模式下返回None
+        """
+        if EventBusObjectPool.engine_mode == EventBusObjectPool.SCHEDULER:
+            return EventBusObjectPool._register_tenant(str(user_id))
+        if EventBusObjectPool.engine_mode != EventBusObjectPool.WORKER:
+            return None
+
+        user_id = str(user_id)
+        with EventBusObjectPool.pool_lock:
+            worker = EventBusObjectPool.workers.get(user_id)
+            if worker is None or not worker.running:
+                worker = EventBusWorker(EventBusObjectPool.get_for_user(user_id), name=f"eventbus-worker-{user_id}")
+                worker.start()
+                EventBusObjectPool.workers[user_id] = worker
+            return worker
+
+    @staticmethod
+    def _register_tenant(user_id: str) -> Tenant:
+        with EventBusObjectPool.pool_lock:
+            scheduler = EventBusObjectPool.scheduler
+            if scheduler is None or not scheduler.running:
+                scheduler = EventBusObjectPool.scheduler = EventBusScheduler()
+                scheduler.start()
+            step_quota, time_quota_ms = EventBusObjectPool.tenant_quotas.get(user_id, (None, None))
+            tenant = scheduler.register(
+                user_id, EventBusObjectPool.get_for_user(user_id),
+                weight=EventBusObjectPool.tenant_weights.get(user_id, 1),
+                step_quota=step_quota, time_quota_ms=time_quota_ms
+            )
+            EventBusObjectPool.workers[user_id] = tenant
+            return tenant
+
+    @staticmethod
+    def get_worker(user_id:int) -> Optional[Union[EventBusWorker, Tenant]]:
+        """用户事件总线的后台线程（SCHEDULER模式下为调度器中的Tenant），INLINE模式或尚未启动时返回None"""
+        return EventBusObjectPool.workers.get(str(user_id))
+
+    @staticmethod
+    def snapshot_path(user_id:int) -> Optional[str]:
+        """用户事件总线快照的文件路径，未设置快照目录时返回None"""
+        if EventBusObjectPool.snapshot_dir is None:
+            return None
+        return os.path.join(EventBusObjectPool.snapshot_dir, f"{user_id}.snapshot")
+
+    @staticmethod
+    def set_trace(user_id: int, enabled: bool = True):
+        """
+        开启或关闭某个用户事件总线的完整追踪，该用户之后创建的事件总线同样生效
+        """
+        user_id = str(user_id)
+        with EventBusObjectPool.pool_lock:
+            if enabled:
+                EventBusObjectPool.trace_users.add(user_id)
+            else:
+                EventBusObjectPool.trace_users.discard(user_id)
+            bus = EventBusObjectPool.eventBusObjectPool.get(user_id)
+            if bus is not None:
+                bus.set_trace(enabled)
\ No newline at end of file
@@ -0,0 +1,326 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from time import perf_counter_ns
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from django.db import close_old_connections, connections
+from loguru import logger
+
+from api.event.event_engine import EventBus
+from api.event.event_queue import LockedEventQueue
+
+
+class Tenant:
+    """
+    EventBusScheduler中的一个用户事件总线，submit()的接口与EventBusWorker相同
+    """
+
+    def __init__(self, scheduler: 'EventBusScheduler', user_id: str, eventBus: EventBus, weight: int = 1,
+                 step_quota: Optional[int] = None, time_quota_ms: Optional[float] = None):
+        """
+        :param weight: 时间片权重，每个时间片的步数与时长为基准值的weight倍
+        :param step_quota: 每个配额窗口内最多处理的步数，None为不限制
+        :param time_quota_ms: 每个配额窗口内最多占用的毫秒数，None为不限制
+        """
+        self.scheduler = scheduler
+        self.user_id = user_id
+        self.eventBus = eventBus
+        self.weight = weight
+        self.step_quota = step_quota
+        self.time_quota_ms = time_quota_ms
+
+        #等待执行的任务，[(<任务>, <Future>), ...]，由调度器的锁保护
+        self.jobs: Deque[Tuple[Callable, Future]] = deque()
+        #已执行、等待本轮处理结束的任务
+        self.waiting: List[Tuple[Future, object]] = []
+
+        #是否处于一轮处理中（见EventBus.start_processing()），以及本轮已处理的步数
+        self.in_round = False
+        self.round_steps = 0
+        #本轮达到步数上限后为True，此时只有新任务能使该用户重新参与调度
+        self.stalled = False
+
+        #当前配额窗口的开始时刻（time.monotonic()）与窗口内的用量
+        self.window_start = time.monotonic()
+        self.window_steps = 0
+        self.window_ns = 0
+
+        #累计用量
+        self.steps = 0
+        self.busy_ns = 0
+        self.slices = 0
+        self.jobs_done = 0
+        self.throttled = 0
+
+    def submit(self, job: Callable) -> Future:
+        """见EventBusWorker.submit()"""
+        return self.scheduler.submit(self, job)
+
+    def has_work(self) -> bool:
+        if self.jobs:
+            return True
+        if self.stalled:
+            return False
+        if self.in_round or self.eventBus.event_bus.qsize():
+            return True
+        expiry = self.eventBus.timed_tasks.next_expiry()
+        return expiry is not None and expiry <= self.eventBus._now_ms()
+
+    def over_quota(self, now: float) -> bool:
+        """当前配额窗口内的用量是否已超过配额，窗口结束时清零"""
+        if now - self.window_start >= self.scheduler.quota_window:
+            self.window_start = now
+            self.window_steps = 0
+            self.window_ns = 0
+            return False
+        if self.step_quota is not None and self.window_steps >= self.step_quota:
+            return True
+        if self.time_quota_ms is not None and self.window_ns >= self.time_quota_ms * 1e6:
+            return True
+        return False
+
+    def usage(self) -> Dict:
+        return {
+            'weight': self.weight,
+            'steps': self.steps,
+            'busy_ms': self.busy_ns / 1e6,
+            'slices': self.slices,
+            'jobs': self.jobs_done,
+            'throttled': self.throttled,
+            'pending_jobs': len(self.jobs),
+            'queue_depth': self.eventBus.event_bus.qsize(),
+            'in_round': self.in_round,
+            'stalled': self.stalled,
+            'window': {
+                'steps': self.window_steps,
+                'busy_ms': self.window_ns / 1e6,
+                'step_quota': self.step_quota,
+                'time_quota_ms': self.time_quota_ms,
+            },
+        }
+
+
+class EventBusScheduler:
+    """
+    由一个后台线程分时处理所有用户的事件总线，限制单个用户的事件级联占用的时间，使其它用户的触发延迟不受影响\n
+    1. 加权轮转：每轮按注册顺序依次为有工作的用户执行一个时间片，时间片为slice_steps * weight步、slice_ms * weight毫秒，先到者为准
+    2. 一个用户的一轮处理（执行一个任务后处理事件直到队列为空，与EventBusWorker的顺序一致）可以跨越多个时间片，
+       本轮处理结束前不会执行该用户的下一个任务；本轮达到max_step步（事件循环）时结束，剩余事件等到下一个任务提交时再处理
+    3. 配额：每个quota_window秒的窗口内，用户的步数或占用时间超过配额后，直到窗口结束前都不再被调度（计入throttled）
+    4. usage()按用户报告累计与当前窗口的用量
+    5. 事件总线只在调度线程中被处理，必须使用多线程模式（LockedEventQueue），其它线程直接发布的事件最迟在poll_interval秒后被处理
+    6. 与请求一样，每个时间片与每个任务的前后关闭过期或出错的数据库连接，调度线程退出时关闭该线程持有的所有连接
+    """
+
+    #以下参数由api.apps.ApiConfig.ready()根据settings设置
+    #每个时间片的基准步数与毫秒数
+    slice_steps: int = 100
+    slice_ms: float = 5.0
+    #配额窗口的秒数，以及默认的每用户配额（None为不限制）
+    quota_window: float = 1.0
+    step_quota: Optional[int] = None
+    time_quota_ms: Optional[float] = None
+    #每轮处理的步数上限与批次大小，见EventBus.process()
+    max_step: int = 10000
+    batch_size: int = 1
+    #空闲时最长的等待秒数
+    poll_interval: float = 0.1
+
+    def __init__(self, name: str = 'eventbus-scheduler'):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+
+        #{"<用户id>": <Tenant>}，按注册顺序轮转
+        self.tenants: Dict[str, Tenant] = {}
+        self.stopping = False
+
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        logger.success(f"EVENTBUS: scheduler <{self.thread.name}> started")
+
+    def stop(self, timeout: Optional[float] = None):
+        """停止调度线程，尚未执行的任务被取消"""
+        with self.wakeup:
+            self.stopping = True
+            self.wakeup.notify_all()
+        self.thread.join(timeout)
+
+    @property
+    def running(self) -> bool:
+        return self.thread.is_alive() and not self.stopping
+
+    def register(self, user_id: str, eventBus: EventBus, weight: int = 1, step_quota: Optional[int] = None,
+                 time_quota_ms: Optional[float] = None) -> Tenant:
+        """
+        注册一个用户的事件总线（已注册时返回原来的Tenant，事件总线被替换时重新注册）
+        :param step_quota: None时使用默认配额EventBusScheduler.step_quota
+        :param time_quota_ms: None时使用默认配额EventBusScheduler.time_quota_ms
+        """
+        if not isinstance(eventBus.event_bus, LockedEventQueue):
+            raise ValueError("EVENTBUS: scheduler requires a threaded event bus")
+        user_id = str(user_id)
+        with self.wakeup:
+            tenant = self.tenants.get(user_id)
+            if tenant is None or tenant.eventBus is not eventBus:
+                tenant = Tenant(
+                    self, user_id, eventBus, weight=weight,
+                    step_quota=step_quota if step_quota is not None else EventBusScheduler.step_quota,
+                    time_quota_ms=time_quota_ms if time_quota_ms is not None else EventBusScheduler.time_quota_ms
+                )
+                self.tenants[user_id] = tenant
+                logger.success(f"EVENTBUS: user <{user_id}> registered to scheduler, weight {weight}")
+            return tenant
+
+    def unregister(self, user_id: str):
+        """移除一个用户，尚未执行的任务被取消"""
+        with self.wakeup:
+            tenant = self.tenants.pop(str(user_id), None)
+            jobs = list(tenant.jobs) if tenant is not None else []
+        for _, future in jobs:
+            future.cancel()
+
+    def submit(self, tenant: Tenant, job: Callable) -> Future:
+        future = Future()
+        with self.wakeup:
+            if self.stopping:
+                raise RuntimeError(f"EVENTBUS: scheduler <{self.thread.name}> is stopped")
+            tenant.jobs.append((job, future))
+            self.wakeup.notify_all()
+        return future
+
+    def usage(self, user_id: Optional[str] = None) -> Dict:
+        """
+        :param user_id: 不为None时只返回该用户的用量
+        :return: {"<用户id>": {...}}
+        """
+        with self.lock:
+            tenants = list(self.tenants.values())
+        return {tenant.user_id: tenant.usage() for tenant in tenants
+                if user_id is None or tenant.user_id == str(user_id)}
+
+    def _run(self):
+        try:
+            self._schedule()
+        finally:
+            # close_old_connections()只关闭过期或出错的连接
+            connections.close_all()
+
+        with self.wakeup:
+            tenants = list(self.tenants.values())
+        for tenant in tenants:
+            for _, future in tenant.jobs:
+                future.cancel()
+            tenant.jobs.clear()
+        logger.success(f"EVENTBUS: scheduler <{self.thread.name}> stopped")
+
+    def _schedule(self):
+        """加权轮转，直到调度器被停止"""
+        while not self.stopping:
+            with self.lock:
+                tenants = list(self.tenants.values())
+
+            now = time.monotonic()
+            scheduled = False
+            throttled: List[Tenant] = []
+            for tenant in tenants:
+                if self.stopping:
+                    break
+                if not tenant.has_work():
+                    continue
+                if tenant.over_quota(now):
+                    tenant.throttled += 1
+                    throttled.append(tenant)
+                    continue
+                self._run_slice(tenant)
+                scheduled = True
+
+            if not scheduled:
+                self._wait(tenants, throttled, now)
+
+    def _wait(self, tenants: List[Tenant], throttled: List[Tenant], now: float):
+        """所有用户都没有可调度的工作时，等待新的任务、配额窗口结束或下一个定时任务到期"""
+        timeout = EventBusScheduler.poll_interval
+        for tenant in throttled:
+            timeout = min(timeout, tenant.window_start + self.quota_window - now)
+        for tenant in tenants:
+            if tenant.stalled or tenant in throttled:
+                continue
+            expiry = tenant.eventBus.timed_tasks.next_expiry()
+            if expiry is not None:
+                timeout = min(timeout, max(expiry - tenant.eventBus._now_ms(), 0) / 1000)
+        if timeout <= 0:
+            return
+        with self.wakeup:
+            if not self.stopping and not any(tenant.jobs for tenant in tenants if tenant not in throttled):
+                self.wakeup.wait(timeout)
+
+    def _run_slice(self, tenant: Tenant):
+        eventBus = tenant.eventBus
+        start_ns = perf_counter_ns()
+        deadline_ns = start_ns + int(EventBusScheduler.slice_ms * tenant.weight * 1e6)
+
+        # 触发器可能访问数据库，连接按线程持有，需要像请求一样在前后清理，避免长期运行的调度线程持有失效的连接
+        close_old_connections()
+        try:
+            if not tenant.in_round:
+                # 开始新的一轮：先执行一个任务（如果有）
+                with self.lock:
+                    job = tenant.jobs.popleft() if tenant.jobs else None
+                tenant.stalled = False
+                tenant.in_round = True
+                tenant.round_steps = 0
+                eventBus.start_processing()
+                if job is not None:
+                    self._run_job(tenant, job)
+
+            max_steps = min(EventBusScheduler.slice_steps * tenant.weight, EventBusScheduler.max_step - tenant.round_steps)
+            is_done, steps = eventBus.process_steps(max_steps, EventBusScheduler.batch_size, deadline_ns)
+            tenant.round_steps += steps
+            tenant.steps += steps
+            tenant.window_steps += steps
+
+            if is_done or tenant.round_steps >= EventBusScheduler.max_step:
+                if not is_done:
+                    tenant.stalled = True
+                    logger.critical(f"EVENTBUS: user <{tenant.user_id}> reach step limit {EventBusScheduler.max_step}, "
+                                    f"check infinite event loop")
+                self._finish_round(tenant)
+        except BaseException as e:
+            logger.exception(f"EVENTBUS: scheduler failed to process events of user <{tenant.user_id}>")
+            self._finish_round(tenant, error=e)
+        finally:
+            close_old_connections()
+            elapsed_ns = perf_counter_ns() - start_ns
+            tenant.busy_ns += elapsed_ns
+            tenant.window_ns += elapsed_ns
+            tenant.slices += 1
+
+    @staticmethod
+    def _run_job(tenant: Tenant, job: Tuple[Callable, Future]):
+        function, future = job
+        if not future.set_running_or_notify_cancel():
+            return
+        close_old_connections()
+        try:
+            tenant.waiting.append((future, function()))
+        except BaseException as e:
+            logger.exception(f"EVENTBUS: job of user <{tenant.user_id}> failed")
+            future.set_exception(e)
+        finally:
+            close_old_connections()
+        tenant.jobs_done += 1
+
+    @staticmethod
+    def _finish_round(tenant: Tenant, error: Optional[BaseException] = None):
+        tenant.in_round = False
+        tenant.eventBus.finish_processing()
+        waiting, tenant.waiting = tenant.waiting, []
+        for future, result in waiting:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
@@ -0,0 +1,217 @@
+import bisect
+import hashlib
+import threading
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Callable, Dict, Optional, Tuple
+
+from django.db import close_old_connections, connections as db_connections
+from loguru import logger
+from rest_framework import status
+from rest_framework.response import Response
+
+
+class HashRing:
+    """
+    一致性哈希环，将用户id映射到分片编号，分片数变化时只有约1/N的用户被重新分配
+    """
+
+    def __init__(self, shard_count: int, replicas: int = 128):
+        """
+        :param replicas: 每个分片在环上的虚拟节点数，越多分布越均匀
+        """
+        self.shard_count = shard_count
+        points = sorted((self._hash(f"shard-{shard}#{replica}"), shard)
+                        for shard in range(shard_count) for replica in range(replicas))
+        self.keys = [key for key, _ in points]
+        self.shards = [shard for _, shard in points]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+    def shard_for(self, user_id) -> int:
+        index = bisect.bisect(self.keys, self._hash(str(user_id)))
+        return self.shards[index % len(self.shards)]
+
+
+class EventBusShardRouter:
+    """
+    多进程分片：每个分片进程（manage.py run_eventbus_shards）持有一部分用户的事件总线，
+    Django进程中的视图按一致性哈希将请求转发到用户所在的分片，使同一用户的所有请求都落在同一个事件总线上\n
+    1. 请求与响应通过multiprocessing.connection在本地回环地址上传输：请求为(<操作名>, <用户id>, <参数>)，响应为(<数据>, <状态码>)
+    2. 每个线程为每个分片缓存一个连接，发送失败时重新连接一次；已发送但读取响应失败或超时时不重试（触发器不是幂等的），返回503/504
+    3. shard_count为0时不分片，视图直接使用本进程的EventBusObjectPool
+    """
+
+    #以下参数由api.apps.ApiConfig.ready()根据settings设置
+    #分片进程数，为0时不分片
+    shard_count: int = 0
+    host: str = '127.0.0.1'
+    #分片i监听base_port + i
+    base_port: int = 6300
+    authkey: bytes = b''
+    #等待分片响应的最长秒数
+    timeout: float = 60.0
+
+    ring: Optional[HashRing] = None
+
+    #{<分片编号>: <Connection>}，每个线程一份
+    connections = threading.local()
+
+    @staticmethod
+    def configure(shard_count: int, host: str = '127.0.0.1', base_port: int = 6300, authkey: bytes = b'',
+                  timeout: float = 60.0):
+        EventBusShardRouter.shard_count = shard_count
+        EventBusShardRouter.host = host
+        EventBusShardRouter.base_port = base_port
+        EventBusShardRouter.authkey = authkey
+        EventBusShardRouter.timeout = timeout
+        EventBusShardRouter.ring = HashRing(shard_count) if shard_count > 0 else None
+
+    @staticmethod
+    def enabled() -> bool:
+        return EventBusShardRouter.ring is not None
+
+    @staticmethod
+    def address(shard: int) -> Tuple[str, int]:
+        return EventBusShardRouter.host, EventBusShardRouter.base_port + shard
+
+    @staticmethod
+    def shard_for(user_id) -> int:
+        return EventBusShardRouter.ring.shard_for(user_id)
+
+    @staticmethod
+    def _connection(shard: int, reconnect: bool = False) -> Connection:
+        cache: Dict[int, Connection] = EventBusShardRouter.connections.__dict__.setdefault('by_shard', {})
+        connection = cache.get(shard)
+        if connection is not None and reconnect:
+            EventBusShardRouter._discard(shard)
+            connection = None
+        if connection is None:
+            connection = cache[shard] = Client(EventBusShardRouter.address(shard), authkey=EventBusShardRouter.authkey)
+        return connection
+
+    @staticmethod
+    def _discard(shard: int):
+        cache: Dict[int, Connection] = EventBusShardRouter.connections.__dict__.setdefault('by_shard', {})
+        connection = cache.pop(shard, None)
+        if connection is not None:
+            try:
+                connection.close()
+            except OSError:
+                pass
+
+    @staticmethod
+    def forward(user_id, op: str, params: Optional[Dict] = None) -> Response:
+        """
+        将一个操作转发到用户所在的分片，返回分片的响应
+        :param op: 操作名，见EventBusShardServer.handlers
+        """
+        shard = EventBusShardRouter.shard_for(user_id)
+        request = (op, user_id, params or {})
+        try:
+            try:
+                connection = EventBusShardRouter._connection(shard)
+                connection.send(request)
+            except (OSError, EOFError):
+                # 缓存的连接可能已被分片关闭（如分片重启），重新连接一次
+                connection = EventBusShardRouter._connection(shard, reconnect=True)
+                connection.send(request)
+        except (OSError, EOFError) as e:
+            EventBusShardRouter._discard(shard)
+            logger.error(f"EVENTBUS: cannot reach event engine shard {shard} at {EventBusShardRouter.address(shard)}: {e}")
+            return Response({"shard error": f"event engine shard {shard} is unavailable"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        try:
+            if not connection.poll(EventBusShardRouter.timeout):
+                # 之后到达的响应会与下一个请求错位，丢弃该连接
+                EventBusShardRouter._discard(shard)
+                return Response({"shard error": f"event engine shard {shard} did not respond in {EventBusShardRouter.timeout}s"},
+                                status=status.HTTP_504_GATEWAY_TIMEOUT)
+            data, status_code = connection.recv()
+        except (OSError, EOFError) as e:
+            EventBusShardRouter._discard(shard)
+            logger.error(f"EVENTBUS: event engine shard {shard} closed the connection: {e}")
+            return Response({"shard error": f"event engine shard {shard} closed the connection"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response(data, status=status_code)
+
+
+class EventBusShardServer:
+    """
+    分片进程中的服务端，每个连接一个线程，按操作名调用处理函数，处理函数与视图使用相同的实现并返回Response
+    与请求一样，每个请求的前后关闭过期或出错的数据库连接，连接线程退出时关闭该线程持有的所有连接
+    """
+
+    def __init__(self, shard: int, handlers: Dict[str, Callable[..., Response]]):
+        """
+        :param handlers: {<操作名>: <处理函数>}，处理函数的参数为(<用户id>, <参数>)
+        """
+        self.shard = shard
+        self.handlers = handlers
+        self.listener = Listener(EventBusShardRouter.address(shard), authkey=EventBusShardRouter.authkey)
+        self.stopping = False
+
+    def serve_forever(self):
+        logger.success(f"EVENTBUS: event engine shard {self.shard}/{EventBusShardRouter.shard_count} "
+                       f"listening on {EventBusShardRouter.address(self.shard)}")
+        while not self.stopping:
+            try:
+                connection = self.listener.accept()
+            except OSError:
+                if self.stopping:
+                    break
+                logger.exception(f"EVENTBUS: shard {self.shard} failed to accept a connection")
+                continue
+            if self.stopping:
+                connection.close()
+                break
+            threading.Thread(target=self._serve, args=(connection,), name=f'eventbus-shard-{self.shard}-conn',
+                             daemon=True).start()
+
+    def stop(self):
+        self.stopping = True
+        # 关闭监听套接字不会唤醒阻塞在accept()中的线程，先连接一次使其返回
+        try:
+            Client(self.listener.address, authkey=EventBusShardRouter.authkey).close()
+        except (OSError, EOFError):
+            pass
+        self.listener.close()
+
+    def _serve(self, connection: Connection):
+        try:
+            with connection:
+                while True:
+                    try:
+                        op, user_id, params = connection.recv()
+                    except (OSError, EOFError):
+                        return
+                    # 处理函数可能访问数据库，连接按线程持有，长连接的线程需要像请求一样在前后清理
+                    close_old_connections()
+                    try:
+                        response = self.handle(op, user_id, params)
+                    finally:
+                        close_old_connections()
+                    try:
+                        connection.send(response)
+                    except (OSError, EOFError):
+                        return
+        finally:
+            # close_old_connections()只关闭过期或出错的连接
+            db_connections.close_all()
+
+    def handle(self, op: str, user_id, params: Dict) -> Tuple[object, int]:
+        owner = EventBusShardRouter.shard_for(user_id)
+        if owner != self.shard:
+            # 分片数配置不一致时拒绝，避免同一用户在两个分片上各有一个事件总线
+            return {"shard error": f"user {user_id} belongs to shard {owner}, not {self.shard}"}, status.HTTP_421_MISDIRECTED_REQUEST
+
+        handler = self.handlers.get(op)
+        if handler is None:
+            return {"shard error": f"unknown operation <{op}>"}, status.HTTP_400_BAD_REQUEST
+        try:
+            response = handler(user_id, params)
+        except Exception as e:
+            logger.exception(e)
+            return {"shard error": str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR
+        return response.data, response.status_code
+
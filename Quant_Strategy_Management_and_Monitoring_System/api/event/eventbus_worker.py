@@ -0,0 +1,155 @@
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Deque, List, Optional, Tuple
+
+from django.db import close_old_connections, connections
+from loguru import logger
+
+from api.event.event_engine import EventBus
+from api.event.event_queue import LockedEventQueue
+
+
+class EventBusWorker:
+    """
+    在后台线程中持续处理一个事件总线，请求线程只提交任务，不需要等待事件级联结束\n
+    1. 每个事件总线一个守护线程，线程中按提交顺序执行任务（如调用标签触发器），每个任务之后处理事件直到队列为空，
+       与原来在请求中"调用触发器 + process()"的顺序一致；与请求一样，每次执行任务与处理事件的前后关闭过期或出错的数据库连接
+    2. submit()返回concurrent.futures.Future，任务本身与之后的事件处理都结束时完成，结果为任务的返回值，调用方可以选择是否等待
+    3. 空闲时线程等待新的任务、其它线程直接发布的事件或下一个定时任务到期，不需要请求驱动，事件可以在两次请求之间继续流动
+    4. process()达到步数上限（事件循环）时不会立即重试，剩余事件等到下一个任务提交时再处理，与请求驱动时的行为一致
+    5. 事件总线只在该线程中被处理，必须使用多线程模式（LockedEventQueue），不支持AsyncEventBus
+    """
+
+    #每次process()的步数上限与批次大小，由api.apps.ApiConfig.ready()根据settings设置
+    max_step: int = 10000
+    batch_size: int = 1
+
+    #空闲时最长的等待秒数，之后重新检查队列与定时任务
+    poll_interval: float = 1.0
+
+    #请求选择等待时最多等待的秒数，由api.apps.ApiConfig.ready()根据settings.EVENTBUS_WORKER_WAIT_TIMEOUT设置
+    wait_timeout: float = 30.0
+
+    def __init__(self, eventBus: EventBus, name: Optional[str] = None):
+        if not isinstance(eventBus.event_bus, LockedEventQueue):
+            raise ValueError("EVENTBUS: background worker requires a threaded event bus")
+        self.eventBus = eventBus
+
+        #等待执行的任务，[(<任务>, <Future>), ...]，与事件队列共用一把锁，使提交任务与发布事件都能唤醒线程
+        self.jobs: Deque[Tuple[Callable, Future]] = deque()
+        self.wakeup = eventBus.event_bus.not_empty
+
+        #达到步数上限后为True，此时只有新任务能唤醒线程
+        self.stalled = False
+        self.stopping = False
+
+        self.thread = threading.Thread(target=self._run, name=name or 'eventbus-worker', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        logger.success(f"EVENTBUS: background worker <{self.thread.name}> started")
+
+    def stop(self, timeout: Optional[float] = None):
+        """停止线程，尚未执行的任务被取消"""
+        with self.wakeup:
+            self.stopping = True
+            self.wakeup.notify_all()
+        self.thread.join(timeout)
+
+    @property
+    def running(self) -> bool:
+        return self.thread.is_alive() and not self.stopping
+
+    def submit(self, job: Callable) -> Future:
+        """
+        提交一个在工作线程中执行的任务，立即返回
+        :param job: 无参数的可调用对象，通常调用标签触发器并发布事件
+        :return: 任务与之后的事件处理都结束时完成的Future，任务或回调抛出的异常设置在Future上
+        """
+        future = Future()
+        with self.wakeup:
+            if self.stopping:
+                raise RuntimeError(f"EVENTBUS: background worker <{self.thread.name}> is stopped")
+            self.jobs.append((job, future))
+            self.wakeup.notify_all()
+        return future
+
+    def _run(self):
+        try:
+            while True:
+                job = self._wait()
+                if self.stopping:
+                    break
+                if job is None and (self.stalled or not self._has_work()):
+                    continue
+
+                # 触发器可能访问数据库，连接按线程持有，需要像请求一样在前后清理，避免长期运行的线程持有失效的连接
+                close_old_connections()
+                try:
+                    self._drain(job)
+                finally:
+                    close_old_connections()
+        finally:
+            # close_old_connections()只关闭过期或出错的连接，线程退出时关闭该线程持有的所有连接
+            connections.close_all()
+
+        # 停止后取消尚未执行的任务
+        with self.wakeup:
+            jobs, self.jobs = self.jobs, deque()
+        for _, future in jobs:
+            future.cancel()
+        logger.success(f"EVENTBUS: background worker <{self.thread.name}> stopped")
+
+    def _drain(self, job: Optional[Tuple[Callable, Future]]):
+        """执行一个任务（可以为None），再处理事件直到队列为空或达到步数上限"""
+        finished: List[Tuple[Future, object]] = []
+        if job is not None:
+            function, future = job
+            if future.set_running_or_notify_cancel():
+                try:
+                    finished.append((future, function()))
+                except BaseException as e:
+                    logger.exception(f"EVENTBUS: job in background worker <{self.thread.name}> failed")
+                    future.set_exception(e)
+
+        try:
+            self.stalled = not self.eventBus.process(EventBusWorker.max_step, EventBusWorker.batch_size)
+        except BaseException as e:
+            logger.exception(f"EVENTBUS: background worker <{self.thread.name}> failed to process events")
+            for future, _ in finished:
+                future.set_exception(e)
+            return
+
+        for future, result in finished:
+            future.set_result(result)
+
+    def _has_work(self) -> bool:
+        """队列中有事件或有定时任务可能已到期"""
+        if self.eventBus.event_bus.qsize():
+            return True
+        expiry = self.eventBus.timed_tasks.next_expiry()
+        return expiry is not None and expiry <= self.eventBus._now_ms()
+
+    def _wait(self) -> Optional[Tuple[Callable, Future]]:
+        """
+        等待下一个任务、新的事件或定时任务到期
+        :return: 下一个任务，没有任务时返回None
+        """
+        queue = self.eventBus.event_bus
+        timed_tasks = self.eventBus.timed_tasks
+        with self.wakeup:
+            if not self.jobs and not self.stopping and (self.stalled or not queue.size):
+                timeout = EventBusWorker.poll_interval
+                expiry = timed_tasks.next_expiry() if not self.stalled else None
+                if expiry is not None:
+                    timeout = min(timeout, max(expiry - self.eventBus._now_ms(), 0) / 1000)
+                if timeout > 0:
+                    self.wakeup.wait_for(
+                        lambda: self.jobs or self.stopping or (not self.stalled and queue.size),
+                        timeout=timeout
+                    )
+            if self.jobs and not self.stopping:
+                self.stalled = False
+                return self.jobs.popleft()
+            return None
@@ -3,6 +3,7 @@ from typing import Callable, List, Dict, Set, Deque, Optional
 from loguru import logger
 
 from api.event.event_engine import EventBus
+from api.event.event_queue import EventQueue
 
 
 class NullEventBus(EventBus):
@@ -12,60 +13,166 @@ class NullEventBus(EventBus):
     def __init__(self):
         super().__init__()
 
-    def publish(self,event: str):
+    def publish(self,event: str, payload=None, priority: int = EventQueue.NORMAL):
         logger.critical(f"NullEventBus: You are trying to use a NULL evnetBus object with evnet={event}!")
 
+    def publish_many(self, events, priority: int = EventQueue.NORMAL):
+        logger.critical(f"NullEventBus: You are trying to use a NULL evnetBus object with evnets={events}!")
+
     def process_one_step(self):
         logger.critical(
             f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
         )
 
-    def process(self, maxStep=10000):
+    def process_batch(self, n: int = 100):
+        logger.critical(
+            f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
+        )
+
+    def process(self, maxStep=10000, batch_size: int = 1):
+        logger.critical(
+            f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
+        )
+
+    def enable_metrics(self, metrics):
+        logger.critical(
+            f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
+        )
+
+    def enable_journal(self, journal):
+        logger.critical(
+            f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
+        )
+
+    def replay_event(self, event: str, merged: int = 0):
+        logger.critical(
+            f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
+        )
+
+    def set_trace(self, enabled: bool = True):
+        logger.critical(
+            f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
+        )
+
+    def queue_stats(self):
+        logger.critical(
+            f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
+        )
+
+    def add_immediate_listener(self, source: str, callback: Callable, independent: bool = False,
+                               with_payload: bool = False):
+        logger.critical(
+            f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
+        )
+
+    def add_delayed_listener(self, source: str, delay: int, callback: Callable, with_payload: bool = False):
+        logger.critical(
+            f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
+        )
+
+    def add_timed_listener(self, source: str, delay_ms: int, callback: Callable, with_payload: bool = False):
+        logger.critical(
+            f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
+        )
+
+    def schedule_delayed(self, delay: int, callback: Callable):
+        logger.critical(
+            f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
+        )
+
+    def schedule_timed(self, delay_ms: int, callback: Callable):
+        logger.critical(
+            f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
+        )
+
+    def add_joint_listener(self, sources: List[str], callback: Callable, with_payload: bool = False,
+                           window_events: Optional[int] = None, window_ms: Optional[int] = None):
+        logger.critical(
+            f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
+        )
+
+    def add_cycle_budget(self, events, budget: int):
+        logger.critical(
+            f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
+        )
+
+    def add_coalesce_rule(self, event: str):
+        logger.critical(
+            f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
+        )
+
+    def remove_coalesce_rule(self, event: str):
+        logger.critical(
+            f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
+        )
+
+    def add_pattern_listener(self, pattern: List[str], callback: Callable, with_payload: bool = False):
+        logger.critical(
+            f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
+        )
+
+    def add_topic_listener(self, topic: str, callback: Callable, with_payload: bool = False):
+        logger.critical(
+            f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
+        )
+
+    def remove_listener(self, subscription):
+        logger.critical(
+            f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
+        )
+
+    def compact_listeners(self):
+        logger.critical(
+            f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
+        )
+
+    def compile_patterns(self, positions=None):
         logger.critical(
             f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
         )
 
-    def add_immediate_listener(self, source: str, callback: Callable):
+    def freeze(self):
         logger.critical(
             f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
         )
 
-    def add_delayed_listener(self, source: str, delay: int, callback: Callable):
+    def bind_callback(self, func: Callable, *args, publish: str = None, priority: int = EventQueue.NORMAL):
         logger.critical(
             f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
         )
 
-    def add_joint_listener(self, sources: List[str], callback: Callable):
+    def publish_event(self, event: str, priority: int = EventQueue.NORMAL):
         logger.critical(
             f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
         )
 
-    def add_pattern_listener(self, pattern: List[str], callback: Callable):
+    def listen_immediately(self, source: str, independent: bool = False, with_payload: bool = False):
         logger.critical(
             f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
         )
 
-    def publish_event(self, event: str):
+    def listen_delayed(self, source: str, delay: int, with_payload: bool = False):
         logger.critical(
             f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
         )
 
-    def listen_immediately(self, source: str):
+    def listen_timed(self, source: str, delay_ms: int, with_payload: bool = False):
         logger.critical(
             f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
         )
 
-    def listen_delayed(self, source: str, delay: int):
+    def listen_jointly(self, sources: List[str], with_payload: bool = False,
+                       window_events: Optional[int] = None, window_ms: Optional[int] = None):
         logger.critical(
             f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
         )
 
-    def listen_jointly(self, sources: List[str]):
+    def listen_pattern_matcher(self, pattern: List[str], with_payload: bool = False):
         logger.critical(
             f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
         )
 
-    def listen_pattern_matcher(self, pattern: List[str]):
+    def listen_topic(self, topic: str, with_payload: bool = False):
         logger.critical(
             f"NullEventBus: You are trying to use a NULL evnetBus object nothing will happen!"
         )
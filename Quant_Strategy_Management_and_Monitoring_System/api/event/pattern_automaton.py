@@ -0,0 +1,111 @@
+from typing import List, Dict, Tuple, FrozenSet, Iterable, Hashable
+
+from loguru import logger
+
+
+class PatternAutomaton:
+    """
+    将一个EventBus上注册的所有模式监听器编译为一个共享的惰性DFA\n
+    1. NFA状态为(<模式下标>, <已匹配长度>)，所有模式的起始状态(p, 0)隐式存在于每个DFA状态中，因此重叠输入（如模式A A B与输入A A A B）不会漏匹配
+    2. DFA状态为NFA状态的集合，转移表在第一次遇到(<DFA状态>, <事件>)时计算并缓存，之后每个事件只需一次字典查找即可同时推进所有模式
+    3. 不在任何模式中出现的事件被归为同一个符号OTHER，只能被'*'匹配
+    4. 事件可以是事件名，也可以是EventBus符号表分配的事件编号，'*'始终为通配符
+    5. 某个模式匹配成功后，丢弃该模式所有进行中的部分匹配（触发后重置），与原PatternMatcher的语义保持一致
+    """
+
+    OTHER = object()  # 字母表之外的事件
+
+    def __init__(self, patterns: List[List[Hashable]], max_states: int = 4096,
+                 positions: Iterable[Tuple[int, int]] = ()):
+        """
+        :param patterns: 模式列表，下标即模式编号
+        :param max_states: 缓存的DFA状态数上限，超过后清空缓存（只保留当前状态）
+        :param positions: 初始的部分匹配状态，用于重新编译时保留进行中的匹配
+        """
+        self.patterns: List[Tuple[Hashable, ...]] = [tuple(pattern) for pattern in patterns]
+        self.alphabet = {event for pattern in self.patterns for event in pattern if event != '*'}
+        self.max_states = max_states
+
+        #{<首个事件>: [<模式下标>, ...]}，以'*'开头的模式单独存放
+        self._start_by_event: Dict[Hashable, List[int]] = {}
+        self._start_wildcard: List[int] = []
+        for pattern_id, pattern in enumerate(self.patterns):
+            if not pattern:
+                continue
+            if pattern[0] == '*':
+                self._start_wildcard.append(pattern_id)
+            else:
+                self._start_by_event.setdefault(pattern[0], []).append(pattern_id)
+
+        #{<NFA状态集合>: <DFA状态>}
+        self._states: Dict[FrozenSet[Tuple[int, int]], '_DFAState'] = {}
+        self.current = self._get_state(frozenset(positions))
+
+    @property
+    def positions(self) -> FrozenSet[Tuple[int, int]]:
+        """当前所有进行中的部分匹配，(<模式下标>, <已匹配长度>)"""
+        return self.current.positions
+
+    def feed(self, event: Hashable) -> Tuple[int, ...]:
+        """
+        输入一个事件，推进所有模式
+        :param event: 事件名或事件编号，不在字母表中的值（包括None）视为OTHER
+        :return: 本次匹配成功的模式下标（按注册顺序）
+        """
+        symbol = event if event in self.alphabet else PatternAutomaton.OTHER
+        transition = self.current.transitions.get(symbol)
+        if transition is None:
+            transition = self._compute_transition(self.current, symbol)
+        self.current, matched = transition
+        return matched
+
+    def reset(self):
+        """丢弃所有进行中的部分匹配"""
+        self.current = self._get_state(frozenset())
+
+    def _get_state(self, positions: FrozenSet[Tuple[int, int]]) -> '_DFAState':
+        state = self._states.get(positions)
+        if state is None:
+            state = _DFAState(positions)
+            self._states[positions] = state
+        return state
+
+    def _compute_transition(self, state: '_DFAState', symbol) -> Tuple['_DFAState', Tuple[int, ...]]:
+        if len(self._states) >= self.max_states:
+            logger.warning(f"EVENTBUS: pattern automaton reach state limit {self.max_states}, cache is flushed")
+            self._states = {state.positions: state}
+            state.transitions.clear()
+
+        candidates = list(state.positions)
+        if symbol is not PatternAutomaton.OTHER:
+            candidates.extend((pattern_id, 0) for pattern_id in self._start_by_event.get(symbol, ()))
+        candidates.extend((pattern_id, 0) for pattern_id in self._start_wildcard)
+
+        next_positions = set()
+        matched = set()
+        for pattern_id, length in candidates:
+            pattern = self.patterns[pattern_id]
+            expected = pattern[length]
+            if expected != '*' and expected != symbol:
+                continue
+            if length + 1 == len(pattern):
+                matched.add(pattern_id)
+            else:
+                next_positions.add((pattern_id, length + 1))
+
+        # 触发后重置：丢弃已匹配模式的其它部分匹配
+        if matched:
+            next_positions = {position for position in next_positions if position[0] not in matched}
+
+        transition = (self._get_state(frozenset(next_positions)), tuple(sorted(matched)))
+        state.transitions[symbol] = transition
+        return transition
+
+
+class _DFAState:
+    __slots__ = ('positions', 'transitions')
+
+    def __init__(self, positions: FrozenSet[Tuple[int, int]]):
+        self.positions = positions
+        #{<事件或OTHER>: (<下一个DFA状态>, <匹配成功的模式下标>)}
+        self.transitions: Dict[object, Tuple['_DFAState', Tuple[int, ...]]] = {}
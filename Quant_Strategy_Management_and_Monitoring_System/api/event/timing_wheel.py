@@ -0,0 +1,212 @@
+from typing import Callable, List, Iterator, Optional
+
+
+class TimerHandle:
+    """
+    定时任务的句柄，可用于取消尚未触发的任务
+    """
+    __slots__ = ('deadline', 'seq', 'callback', 'cancelled', '_wheel')
+
+    def __init__(self, deadline: int, seq: int, callback: Callable, wheel: 'TimingWheel'):
+        self.deadline = deadline
+        self.seq = seq  # 同一时刻到期的任务按添加顺序触发
+        self.callback = callback
+        self.cancelled = False
+        self._wheel = wheel
+
+    @property
+    def pending(self) -> bool:
+        """任务是否仍在等待触发"""
+        return self._wheel is not None
+
+    def cancel(self) -> bool:
+        """
+        取消任务，O(1)：只做标记，任务在所在的槽被处理时丢弃
+        :return: 任务已触发或已取消时返回False
+        """
+        if self._wheel is None:
+            return False
+        self.cancelled = True
+        self._wheel._size -= 1
+        self._wheel = None
+        return True
+
+
+class TimingWheel:
+    """
+    分层时间轮，时间单位为整数tick（事件计数或毫秒，由调用方决定）\n
+    1. 共levels层，每层2^slot_bits个槽，第k层的一个槽覆盖2^(slot_bits*k)个tick
+    2. 添加任务时根据剩余时间选择层，O(1)；超出最高层范围的任务放入overflow，在最高层转完一圈时重新放置
+    3. 时间推进到第k层槽的边界时，将该槽中的任务重新放置到更低的层（级联），第0层的槽到期即触发
+    4. 低层全部为空时直接跳到下一个需要级联的边界，推进很长一段时间（如两次请求之间的毫秒数）不需要逐tick遍历
+    """
+
+    def __init__(self, slot_bits: int = 6, levels: int = 6, start: int = 0):
+        self.slot_bits = slot_bits
+        self.slots = 1 << slot_bits
+        self.mask = self.slots - 1
+        self.levels = levels
+        self.now = start
+
+        self._wheels: List[List[List[TimerHandle]]] = [[[] for _ in range(self.slots)] for _ in range(levels)]
+        #每层中的任务数（包含已取消但尚未丢弃的任务），用于跳过空层
+        self._level_counts = [0] * levels
+        self._overflow: List[TimerHandle] = []
+        #到期时间不晚于now的任务，在下一次advance()时触发
+        self._due: List[TimerHandle] = []
+
+        self._size = 0  # 等待触发的任务数
+        self._seq = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def schedule(self, deadline: int, callback: Callable) -> TimerHandle:
+        """添加一个在deadline时刻触发的任务"""
+        handle = TimerHandle(deadline, self._seq, callback, self)
+        self._seq += 1
+        self._size += 1
+        self._place(handle)
+        return handle
+
+    def advance(self, target: int) -> List[TimerHandle]:
+        """
+        将时间推进到target，返回到期的任务（按到期时间、添加顺序排序），由调用方执行回调
+        """
+        fired: List[TimerHandle] = []
+        if self._due:
+            self._collect(self._due, fired)
+            self._due = []
+
+        bits = self.slot_bits
+        while self.now < target:
+            if self._size == len(fired):
+                # 没有等待中的任务，丢弃已取消的残留任务后直接跳到target
+                if any(self._level_counts) or self._overflow:
+                    self._clear()
+                self.now = target
+                break
+
+            # 低层全部为空时，跳到最低非空层的下一个边界之前
+            level = 0
+            while level < self.levels and self._level_counts[level] == 0:
+                level += 1
+            if level > 0:
+                span = 1 << (bits * level)
+                self.now = min(target, (self.now // span + 1) * span - 1)
+                if self.now >= target:
+                    break
+
+            tick = self.now + 1
+            self.now = tick
+
+            if self._overflow and tick & ((1 << (bits * self.levels)) - 1) == 0:
+                overflow = self._overflow
+                self._overflow = []
+                for handle in overflow:
+                    if not handle.cancelled:
+                        self._place(handle)
+
+            for level in range(self.levels - 1, 0, -1):
+                if tick & ((1 << (bits * level)) - 1) == 0:
+                    self._cascade(level, (tick >> (bits * level)) & self.mask)
+
+            index = tick & self.mask
+            bucket = self._wheels[0][index]
+            if bucket:
+                self._wheels[0][index] = []
+                self._level_counts[0] -= len(bucket)
+                self._collect(bucket, fired)
+
+            if self._due:
+                self._collect(self._due, fired)
+                self._due = []
+
+        for handle in fired:
+            handle._wheel = None
+        self._size -= len(fired)
+
+        if len(fired) > 1:
+            fired.sort(key=lambda handle: (handle.deadline, handle.seq))
+        return fired
+
+    def next_expiry(self) -> Optional[int]:
+        """
+        下一次可能有任务到期（或需要级联）的时刻，没有等待中的任务时返回None\n
+        返回值不晚于最早的到期时间，可用于后台线程决定等待多久
+        """
+        if self._size == 0:
+            return None
+        if self._due:
+            return self.now
+
+        # 更高层的任务在槽的边界级联，取最低非空层（或overflow）的下一个边界
+        bits = self.slot_bits
+        level = 1
+        while level < self.levels and self._level_counts[level] == 0:
+            level += 1
+        span = 1 << (bits * level)
+        expiry = (self.now // span + 1) * span
+
+        if self._level_counts[0]:
+            for offset in range(1, self.slots + 1):
+                tick = self.now + offset
+                if tick >= expiry:
+                    break
+                if any(not handle.cancelled for handle in self._wheels[0][tick & self.mask]):
+                    return tick
+
+        return expiry
+
+    def pending(self) -> Iterator[TimerHandle]:
+        """遍历所有等待触发的任务（无序）"""
+        for handle in self._due:
+            if not handle.cancelled:
+                yield handle
+        for wheel in self._wheels:
+            for bucket in wheel:
+                for handle in bucket:
+                    if not handle.cancelled:
+                        yield handle
+        for handle in self._overflow:
+            if not handle.cancelled:
+                yield handle
+
+    def _place(self, handle: TimerHandle):
+        delta = handle.deadline - self.now
+        if delta <= 0:
+            self._due.append(handle)
+            return
+
+        bits = self.slot_bits
+        for level in range(self.levels):
+            if delta < 1 << (bits * (level + 1)):
+                self._wheels[level][(handle.deadline >> (bits * level)) & self.mask].append(handle)
+                self._level_counts[level] += 1
+                return
+
+        self._overflow.append(handle)
+
+    def _cascade(self, level: int, index: int):
+        bucket = self._wheels[level][index]
+        if not bucket:
+            return
+        self._wheels[level][index] = []
+        self._level_counts[level] -= len(bucket)
+        for handle in bucket:
+            if not handle.cancelled:
+                self._place(handle)
+
+    def _clear(self):
+        for level, wheel in enumerate(self._wheels):
+            if self._level_counts[level]:
+                for index in range(self.slots):
+                    wheel[index] = []
+                self._level_counts[level] = 0
+        self._overflow = []
+
+    @staticmethod
+    def _collect(bucket: List[TimerHandle], fired: List[TimerHandle]):
+        for handle in bucket:
+            if not handle.cancelled:
+                fired.append(handle)
@@ -0,0 +1,119 @@
+from typing import Dict, Hashable, List, Set, Tuple
+
+
+class TopicTrie:
+    """
+    层级主题的订阅表，主题为以'.'分隔的事件名（如fill.AAPL.buy），订阅按段存放在前缀树中\n
+    1. 订阅中的'*'匹配恰好一段，'#'匹配零段或多段：fill.*.buy匹配fill.AAPL.buy，fill.#匹配fill与fill下的所有主题（前缀订阅）
+    2. 同一节点上的订阅存放在一起，匹配一个主题只需沿主题的各段遍历字面量、'*'与'#'三个分支，耗时与节点上的订阅数无关
+    3. 匹配结果按订阅的添加顺序返回，同一个订阅即使通过多条路径匹配（如a.#.#）也只返回一次
+    """
+
+    SEPARATOR = '.'
+    ONE = '*'
+    ANY = '#'
+
+    def __init__(self):
+        self.root = _TopicNode()
+        #订阅数
+        self.count = 0
+        #下一个订阅的序号，序号即添加顺序
+        self._next_seq = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    @staticmethod
+    def split(topic: str) -> List[str]:
+        """
+        :raise ValueError: 主题或订阅为空，或包含空段（如fill..buy）
+        """
+        segments = topic.split(TopicTrie.SEPARATOR)
+        if not all(segments):
+            raise ValueError(f"EVENTBUS: invalid topic <{topic}>, segments must not be empty")
+        return segments
+
+    def add(self, pattern: str, value: Hashable) -> int:
+        """
+        :param pattern: 订阅，可以包含'*'与'#'段
+        :return: 订阅的序号，取消订阅时使用
+        """
+        node = self.root
+        for segment in TopicTrie.split(pattern):
+            child = node.children.get(segment)
+            if child is None:
+                child = node.children[segment] = _TopicNode()
+            node = child
+        seq = self._next_seq
+        self._next_seq += 1
+        node.values[seq] = value
+        self.count += 1
+        return seq
+
+    def remove(self, pattern: str, seq: int) -> bool:
+        """移除一个订阅，并删除因此变空的节点"""
+        path: List[Tuple[_TopicNode, str]] = []
+        node = self.root
+        for segment in TopicTrie.split(pattern):
+            child = node.children.get(segment)
+            if child is None:
+                return False
+            path.append((node, segment))
+            node = child
+        if node.values.pop(seq, None) is None:
+            return False
+        self.count -= 1
+
+        for parent, segment in reversed(path):
+            child = parent.children[segment]
+            if child.values or child.children:
+                break
+            del parent.children[segment]
+        return True
+
+    def match(self, topic: str) -> List[Hashable]:
+        """
+        返回所有匹配该主题的订阅的值，按添加顺序
+        :param topic: 事件名，不含'.'的事件名是只有一段的主题
+        """
+        segments = topic.split(TopicTrie.SEPARATOR)
+        length = len(segments)
+        found: Dict[int, Hashable] = {}
+        # (<节点>, <已匹配的段数>)，'#'可以从不同的路径到达同一状态，每个状态只访问一次
+        stack: List[Tuple[_TopicNode, int]] = [(self.root, 0)]
+        visited: Set[Tuple[int, int]] = set()
+        while stack:
+            node, index = stack.pop()
+            state = (id(node), index)
+            if state in visited:
+                continue
+            visited.add(state)
+
+            any_child = node.children.get(TopicTrie.ANY)
+            if any_child is not None:
+                # '#'匹配零段或多段
+                for end in range(index, length + 1):
+                    stack.append((any_child, end))
+
+            if index == length:
+                found.update(node.values)
+                continue
+
+            child = node.children.get(segments[index])
+            if child is not None:
+                stack.append((child, index + 1))
+            one_child = node.children.get(TopicTrie.ONE)
+            if one_child is not None:
+                stack.append((one_child, index + 1))
+
+        return [found[seq] for seq in sorted(found)]
+
+
+class _TopicNode:
+    __slots__ = ('children', 'values')
+
+    def __init__(self):
+        #{<段>: <子节点>}，'*'与'#'也作为段存放
+        self.children: Dict[str, '_TopicNode'] = {}
+        #在该节点结束的订阅，{<序号>: <值>}
+        self.values: Dict[int, Hashable] = {}
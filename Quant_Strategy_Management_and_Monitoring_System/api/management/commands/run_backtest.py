@@ -0,0 +1,69 @@
+import json
+import random
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from api.views.start_eventbus_engine import StartEventBusEngine
+from labels.models.label_backtest import LabelBacktest
+
+
+class Command(BaseCommand):
+    help = "Run a recorded or synthetic event stream through a user's label triggers on in-memory label copies"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, required=True, help="user id whose labels are backtested")
+        parser.add_argument('--events', help="JSON lines file, each line is \"<event>\", [<event>, <payload>] "
+                                             "or [<event>, <payload>, <timestamp ms>]")
+        parser.add_argument('--synthetic', type=int, default=0,
+                            help="number of random events to generate instead of reading --events")
+        parser.add_argument('--choices', default='', help="comma separated event names for --synthetic")
+        parser.add_argument('--interval-ms', type=float, default=0, help="virtual time between synthetic events")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1)
+        parser.add_argument('--output', help="write the JSON report to this file instead of stdout")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(id=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"user {options['user']} does not exist")
+
+        if options['synthetic'] > 0:
+            choices = [event for event in options['choices'].split(',') if event]
+            if not choices:
+                raise CommandError("--synthetic requires --choices")
+            stream = self._synthetic(options['synthetic'], choices, options['interval_ms'], options['seed'])
+        elif options['events']:
+            stream = self._read(options['events'])
+        else:
+            raise CommandError("either --events or --synthetic is required")
+
+        backtest = LabelBacktest(StartEventBusEngine().get_all_labels_from_user(user), batch_size=options['batch_size'])
+        report = json.dumps(backtest.run(stream), indent=2, default=str, ensure_ascii=False)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(report)
+        else:
+            self.stdout.write(report)
+
+    @staticmethod
+    def _read(path: str):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    item = json.loads(line)
+                    yield item if isinstance(item, str) else tuple(item)
+
+    @staticmethod
+    def _synthetic(count: int, choices, interval_ms: float, seed: int):
+        # 固定种子，相同参数生成相同的事件流
+        rng = random.Random(seed)
+        if not interval_ms:
+            for _ in range(count):
+                yield rng.choice(choices)
+            return
+        for index in range(count):
+            yield rng.choice(choices), None, index * interval_ms
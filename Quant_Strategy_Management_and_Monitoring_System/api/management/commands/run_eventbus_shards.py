@@ -0,0 +1,87 @@
+import multiprocessing
+import time
+from typing import Callable, Dict
+
+from django.core.management.base import BaseCommand, CommandError
+from loguru import logger
+from rest_framework.response import Response
+
+from api.event.eventbus_shard import EventBusShardRouter, EventBusShardServer
+
+
+def shard_handlers() -> Dict[str, Callable[..., Response]]:
+    """分片进程中的处理函数，{<操作名>: <处理函数>}，与视图使用相同的实现"""
+    from api.views.event_metrics_view import EventMetricsView
+    from api.views.event_scheduler_view import EventSchedulerView
+    from api.views.event_snapshot_view import EventSnapshotView
+    from api.views.label_trigger_view import LabelTriggerView
+    from api.views.start_eventbus_engine import StartEventBusEngine
+
+    return {
+        'start-event-engine': lambda user_id, params: StartEventBusEngine().start(user_id),
+        'label-trigger': lambda user_id, params: LabelTriggerView.trigger(user_id, params),
+        'event-metrics': lambda user_id, params: EventMetricsView.metrics(user_id),
+        'event-snapshot': lambda user_id, params: EventSnapshotView.snapshot(user_id),
+        'event-scheduler': lambda user_id, params: EventSchedulerView.usage(user_id, params.get('is_staff', False)),
+    }
+
+
+def serve_shard(shard: int):
+    """分片进程的入口（spawn方式启动的子进程需要重新初始化Django）"""
+    import django
+    django.setup()
+    try:
+        EventBusShardServer(shard, shard_handlers()).serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+class Command(BaseCommand):
+    help = "Start the event engine shard processes (settings.EVENTBUS_SHARDS), each owning a consistent-hash slice of users"
+
+    #分片进程异常退出后重启前等待的秒数
+    restart_delay = 1.0
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shard', type=int, default=None,
+                            help="run only this shard in the current process (for an external process supervisor)")
+
+    def handle(self, *args, **options):
+        shard_count = EventBusShardRouter.shard_count
+        if shard_count <= 0:
+            raise CommandError("EVENTBUS_SHARDS must be greater than 0 to run event engine shards")
+
+        shard = options['shard']
+        if shard is not None:
+            if not 0 <= shard < shard_count:
+                raise CommandError(f"--shard must be in [0, {shard_count}), got {shard}")
+            EventBusShardServer(shard, shard_handlers()).serve_forever()
+            return
+
+        context = multiprocessing.get_context('spawn')
+        processes = {}
+        for shard in range(shard_count):
+            processes[shard] = self._start(context, shard)
+
+        try:
+            while True:
+                time.sleep(Command.restart_delay)
+                for shard, process in processes.items():
+                    if not process.is_alive():
+                        # 重启后该分片上的事件引擎需要重新GET /api/start-event-engine（设置了快照时从快照恢复）
+                        logger.critical(f"EVENTBUS: event engine shard {shard} exited with code {process.exitcode}, restarting")
+                        processes[shard] = self._start(context, shard)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for process in processes.values():
+                process.terminate()
+            for process in processes.values():
+                process.join()
+            logger.success(f"EVENTBUS: {shard_count} event engine shards stopped")
+
+    @staticmethod
+    def _start(context, shard: int):
+        process = context.Process(target=serve_shard, args=(shard,), name=f'eventbus-shard-{shard}', daemon=False)
+        process.start()
+        return process
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from api.event.async_event_engine import AsyncEventBus
+
+
+def test_async_listeners_and_round_hooks():
+    bus = AsyncEventBus()
+    seen = []
+
+    async def on_tick(payload):
+        await asyncio.sleep(0)
+        seen.append(payload)
+        bus.publish('done', 'last')
+
+    bus.add_immediate_listener('tick', on_tick, with_payload=True)
+    bus.add_immediate_listener('done', lambda: seen.append('done'))
+    bus.publish('tick', 42)
+    asyncio.run(bus.process())
+
+    assert seen == [42, 'done']
+    assert not bus.pending_tasks
+    # 一轮处理结束后不再持有最后一个事件的负载，见EventBus.finish_processing()
+    assert bus.current_payload is None
+
+
+def test_step_limit_still_finishes_round():
+    bus = AsyncEventBus()
+    bus.add_immediate_listener('tick', lambda payload: None, with_payload=True)
+    for price in range(3):
+        bus.publish('tick', price)
+    asyncio.run(bus.process(maxStep=2))
+
+    assert bus.event_count == 2
+    assert bus.current_payload is None
+
+
+@pytest.mark.parametrize('batch_size', [1, 8])
+def test_step_limit_counts_dequeued_events(batch_size):
+    bus = AsyncEventBus(maxsize=0)
+    log = []
+    for event in ('tick', 'bar', 'fill'):
+        bus.add_immediate_listener(event, lambda event=event: log.append(event))
+    bus.add_coalesce_rule('tick')
+    for _ in range(10):
+        bus.publish('tick')
+    bus.publish('bar')
+    bus.publish('fill')
+
+    # 合并的9个事件计入事件计数，但不占用步数
+    asyncio.run(bus.process(maxStep=2, batch_size=batch_size))
+    assert log == ['tick', 'bar']
+    assert bus.event_count == 11
+
+    asyncio.run(bus.process(maxStep=2, batch_size=batch_size))
+    assert log == ['tick', 'bar', 'fill']
+    assert bus.event_count == 12
+
@@ -0,0 +1,66 @@
+from api.event.event_engine import EventBus
+
+
+def test_merged_events_are_counted():
+    bus = EventBus(threaded=False, maxsize=0)
+    log = []
+    bus.add_immediate_listener('tick', lambda payload: log.append(payload), with_payload=True)
+    bus.add_delayed_listener('start', 10, lambda: log.append(('delayed', bus.event_count)))
+    assert bus.add_coalesce_rule('tick')
+
+    bus.publish('start')
+    for price in range(20):
+        bus.publish('tick', price)
+    assert bus.queue_stats()['depth'] == 2
+    bus.process()
+
+    # 只触发一次，负载为最后一次发布的负载；被合并的事件仍计入事件计数，延迟任务在原来的计数之后到期
+    assert log == [19, ('delayed', 21)]
+    assert bus.event_count == 21
+    stats = bus.queue_stats()
+    assert stats['merged'] == 19
+    assert stats['merged_events'] == {'tick': 19}
+
+
+def test_events_published_while_processing_are_not_merged():
+    bus = EventBus(threaded=False, maxsize=0)
+    log = []
+
+    def on_tick(payload):
+        log.append(payload)
+        if payload < 3:
+            bus.publish('tick', payload + 1)
+            bus.publish('tick', payload + 10)
+
+    bus.add_immediate_listener('tick', on_tick, with_payload=True)
+    bus.add_coalesce_rule('tick')
+    bus.publish('tick', 0)
+    bus.process()
+
+    # 正在处理的事件不再接受合并，处理中发布的两个事件合并为一个新的待处理事件
+    assert log == [0, 10]
+    assert bus.event_count == 3
+    assert bus.queue_stats()['merged_events'] == {'tick': 1}
+
+
+def test_batch_processing_counts_the_same():
+    counts = []
+    for batch_size in (1, 16):
+        bus = EventBus(threaded=False, maxsize=0)
+        log = []
+        bus.add_immediate_listener('tick', lambda: log.append(('tick', bus.event_count)))
+        bus.add_immediate_listener('bar', lambda: log.append(('bar', bus.event_count)))
+        bus.add_coalesce_rule('tick')
+        for index in range(50):
+            bus.publish('bar' if index % 7 == 0 else 'tick')
+        bus.process(batch_size=batch_size)
+        counts.append((log, bus.event_count, bus.queue_stats()['merged']))
+    assert counts[0] == counts[1]
+
+
+def test_pattern_events_cannot_be_coalesced():
+    bus = EventBus(threaded=False, maxsize=0)
+    bus.add_pattern_listener(['tick', 'fill'], lambda: None)
+    bus.compile_patterns()
+    assert not bus.add_coalesce_rule('tick')
+    assert bus.add_coalesce_rule('bar')
@@ -0,0 +1,133 @@
+import os
+
+from api.event.event_engine import EventBus
+from api.event.event_journal import EventJournal
+
+
+def build(log):
+    bus = EventBus(threaded=False, maxsize=0)
+    bus.add_immediate_listener('A', lambda: log.append('A'))
+    bus.add_joint_listener(['A', 'B'], lambda: log.append('A&B'))
+    bus.add_delayed_listener('C', 3, lambda: log.append('C+3'))
+    bus.add_pattern_listener(['A', '*', 'C'], lambda: log.append('A*C'))
+    bus.compile_patterns()
+    return bus
+
+
+def state(bus):
+    return (bus.event_count, [condition.occurred_mask for condition in bus.joint_conditions],
+            bus.pattern_automaton.positions,
+            sorted((handle.deadline, handle.callback.__name__) for handle in bus.delayed_tasks.pending()))
+
+
+def run(bus, events):
+    for event in events:
+        bus.publish(event)
+        bus.process()
+
+
+def test_replay_after_restart(tmp_path):
+    log = []
+    bus = build(log)
+    bus.enable_journal(EventJournal(str(tmp_path), segment_size=256))
+    run(bus, 'ABCADCABDA' * 5)
+    bus.journal.close()
+    bus.enable_journal(None)
+
+    restarted_log = []
+    restarted = build(restarted_log)
+    journal = EventJournal(str(tmp_path))
+    restarted.enable_journal(journal)
+    assert journal.replay(restarted) == bus.event_count
+    assert state(restarted) == state(bus)
+    # 重放只恢复状态，不执行触发器
+    assert restarted_log == []
+
+    # 之后的事件在两个事件总线上触发相同的回调
+    log.clear()
+    run(bus, 'BCAC')
+    run(restarted, 'BCAC')
+    assert restarted_log == log
+
+
+def test_retain_removes_segments_before_snapshot(tmp_path):
+    bus = build([])
+    journal = EventJournal(str(tmp_path), segment_size=128)
+    bus.enable_journal(journal)
+    run(bus, 'ABCD' * 40)
+    position = journal.dispatch_count
+    run(bus, 'ABCD' * 10)
+
+    segments = journal.segments()
+    removed = journal.retain(position)
+    assert removed and removed == segments[:len(removed)]
+    assert journal.segments() == segments[len(removed):]
+    journal.close()
+
+    # 从快照位置之后重放：只有快照之后的事件被重放，位置与删除前一致
+    restarted = build([])
+    journal = EventJournal(str(tmp_path))
+    assert journal.replay(restarted, skip=position) == 40
+    assert journal.dispatch_count == bus.event_count
+
+    # 所有段都被删除后，新的段从快照的位置继续计数
+    journal.retain(journal.dispatch_count)
+    journal.close()
+    journal = EventJournal(str(tmp_path))
+    assert journal.replay(build([]), skip=bus.event_count) == 0
+    assert journal.dispatch_count == bus.event_count
+
+
+def base_records(journal):
+    return [value for kind, _, value in journal.read() if kind == EventJournal.BASE]
+
+
+def test_reopen_without_replay_continues_count(tmp_path):
+    bus = build([])
+    bus.enable_journal(EventJournal(str(tmp_path), segment_size=128))
+    run(bus, 'ABCD' * 10)
+    bus.journal.close()
+
+    # 不重放也从已有的段继续计数，新段的BASE记录为之前的DISPATCH记录数
+    for session in range(3):
+        journal = EventJournal(str(tmp_path), segment_size=128)
+        assert journal.dispatch_count == bus.event_count
+        bus.enable_journal(journal)
+        run(bus, 'ABCD' * session)
+        journal.close()
+
+    # 只打开不写入的空段被跳过
+    EventJournal(str(tmp_path)).close()
+    journal = EventJournal(str(tmp_path))
+    assert journal.dispatch_count == bus.event_count
+    bases = base_records(journal)
+    assert bases == sorted(bases)
+
+    # 重放得到的位置与打开时一致，每条记录的位置与BASE记录相符
+    assert journal.replay(build([])) == bus.event_count
+    assert journal.dispatch_count == bus.event_count
+    journal.close()
+
+
+def test_reopen_after_retain(tmp_path):
+    bus = build([])
+    journal = EventJournal(str(tmp_path), segment_size=128)
+    bus.enable_journal(journal)
+    run(bus, 'ABCD' * 20)
+    journal.retain(journal.dispatch_count // 2)
+    journal.close()
+
+    journal = EventJournal(str(tmp_path))
+    assert journal.dispatch_count == bus.event_count
+    journal.close()
+
+
+def test_segments_are_created_exclusively(tmp_path, monkeypatch):
+    first = EventJournal(str(tmp_path))
+    # 模拟两个进程同时选择序号：第二个日志看不到第一个日志已经创建的段
+    monkeypatch.setattr(EventJournal, 'segments', lambda self: [])
+    second = EventJournal(str(tmp_path))
+    assert first.file.name != second.file.name
+    assert os.path.basename(second.file.name) == f"{1:08d}{EventJournal.SUFFIX}"
+    first.close()
+    second.close()
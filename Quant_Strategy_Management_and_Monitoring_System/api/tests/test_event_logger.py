@@ -0,0 +1,140 @@
+import pytest
+from loguru import logger
+
+from api.event.event_engine import EventBus
+from api.event.event_logger import EventLogger
+
+
+class Counted:
+    """记录被格式化的次数"""
+
+    def __init__(self):
+        self.formatted = 0
+
+    def __format__(self, spec):
+        self.formatted += 1
+        return 'counted'
+
+
+@pytest.fixture
+def records(monkeypatch):
+    for name in ('level', 'sample_rate', 'events_enabled'):
+        monkeypatch.setattr(EventLogger, name, getattr(EventLogger, name))
+    records = []
+    handler = logger.add(records.append, level='TRACE', format='{message}')
+    yield records
+    logger.remove(handler)
+
+
+def messages(records):
+    return [record.record['message'] for record in records]
+
+
+def test_suppressed_levels_are_not_formatted(records):
+    EventLogger.configure(level='WARNING')
+    event_logger = EventLogger()
+    field = Counted()
+
+    event_logger.begin_event()
+    assert not event_logger.active
+    event_logger.event("event <{event}> is processing", event=field)
+    event_logger.debug("debug {field}", field=field)
+    event_logger.info("info {field}", field=field)
+    event_logger.success("success {field}", field=field)
+    event_logger.log('INFO', "log {field}", field=field)
+    assert field.formatted == 0 and records == []
+
+    event_logger.log('WARNING', "warning {field}", field=field)
+    assert field.formatted == 1
+    assert messages(records) == ['EVENTBUS: warning counted']
+
+
+def test_enabled_levels(records):
+    EventLogger.configure(level='SUCCESS')
+    event_logger = EventLogger()
+    assert not event_logger.enabled('INFO')
+    assert event_logger.enabled('SUCCESS') and event_logger.enabled('ERROR')
+    event_logger.info("info")
+    event_logger.success("success")
+    assert messages(records) == ['EVENTBUS: success']
+
+
+@pytest.mark.parametrize('sample_rate', [1, 3, 10])
+def test_sampling(records, sample_rate):
+    EventLogger.configure(sample_rate=sample_rate)
+    event_logger = EventLogger()
+    field = Counted()
+    for _ in range(300):
+        event_logger.begin_event()
+        event_logger.event("event {event}", event=field)
+        # 普通日志不受采样影响
+        event_logger.info("info")
+    assert field.formatted == 300 // sample_rate
+    assert messages(records).count('EVENTBUS: event counted') == 300 // sample_rate
+    assert messages(records).count('EVENTBUS: info') == 300
+
+
+def test_sampling_on_event_bus(records):
+    EventLogger.configure(sample_rate=10)
+    bus = EventBus(threaded=False, maxsize=0)
+    bus.add_immediate_listener('A', lambda: None)
+    for _ in range(100):
+        bus.publish('A')
+    bus.process()
+    assert messages(records).count('EVENTBUS: event <A> is processing') == 10
+
+
+def test_trace_bypasses_sampling_and_level(records):
+    EventLogger.configure(level='WARNING', sample_rate=10)
+    traced, sampled = EventLogger(trace=False), EventLogger(trace=False)
+    traced.set_trace(True)
+    for _ in range(20):
+        traced.begin_event()
+        traced.event("traced")
+        sampled.begin_event()
+        sampled.event("sampled")
+    traced.debug("debug")
+    assert messages(records) == ['EVENTBUS: traced'] * 20 + ['EVENTBUS: debug']
+
+    traced.set_trace(False)
+    traced.begin_event()
+    assert not traced.active
+
+
+def test_trace_overrides_set_events(records):
+    bus = EventBus(threaded=False, maxsize=0)
+    bus.event_logger.set_events(False)
+    bus.add_immediate_listener('A', lambda: None)
+    bus.publish('A')
+    bus.process()
+    assert 'EVENTBUS: event <A> is processing' not in messages(records)
+
+    bus.set_trace(True)
+    bus.publish('A')
+    bus.process()
+    assert messages(records).count('EVENTBUS: event <A> is processing') == 1
+
+
+def test_configure_applies_to_existing_instances(records):
+    event_logger = EventLogger()
+    EventLogger.configure(level='WARNING')
+    event_logger.begin_event()
+    assert not event_logger.active
+    EventLogger.configure(level='INFO')
+    event_logger.begin_event()
+    assert event_logger.active
+
+
+@pytest.mark.parametrize('level, sample_rate', [('VERBOSE', 1), ('INFO', 0)])
+def test_configure_rejects_invalid_values(records, level, sample_rate):
+    with pytest.raises(ValueError):
+        EventLogger.configure(level=level, sample_rate=sample_rate)
+
+
+def test_context_and_fields_in_extra(records):
+    event_logger = EventLogger(user_id=7)
+    event_logger.bind(strategy='grid')
+    event_logger.info("{count} events are published", count=3)
+    record = records[0].record
+    assert record['message'] == 'EVENTBUS: 3 events are published'
+    assert record['extra'] == {'user_id': 7, 'strategy': 'grid', 'count': 3}
@@ -0,0 +1,146 @@
+import functools
+import threading
+
+import pytest
+
+from api.event.event_engine import EventBus
+from api.event.event_metrics import EventBusMetrics
+
+
+@pytest.fixture
+def max_events():
+    previous = EventBusMetrics.max_events
+    yield
+    EventBusMetrics.max_events = previous
+
+
+def test_event_names_beyond_limit_are_merged(max_events):
+    EventBusMetrics.max_events = 3
+    bus = EventBus()
+    bus.enable_metrics(EventBusMetrics())
+    bus.add_topic_listener('fill.#', lambda: None)
+    for index in range(10):
+        bus.publish(f'fill.SYM{index}.buy')
+    bus.process()
+
+    events = bus.metrics.snapshot(bus)['events']
+    assert len(events) == 4
+    assert events[EventBusMetrics.OTHER_EVENTS]['processed'] == 7
+    assert sum(stats['processed'] for stats in events.values()) == 10
+
+
+def test_removed_listener_histograms_are_dropped():
+    bus = EventBus()
+    bus.enable_metrics(EventBusMetrics())
+
+    def on_tick():
+        pass
+
+    def on_tick_delayed(payload):
+        pass
+
+    immediate = bus.add_immediate_listener('tick', on_tick)
+    delayed = bus.add_delayed_listener('tick', 1, on_tick_delayed, with_payload=True)
+    for price in range(3):
+        bus.publish('tick', price)
+    bus.process()
+
+    listeners = bus.metrics.snapshot(bus)['listeners']
+    # 绑定负载的延迟任务每次触发都是新的函数对象，按原回调合并记录；最后一个tick的延迟任务尚未触发
+    assert len(bus.metrics.listeners[EventBus.DELAY]) == 1
+    assert listeners['DELAY:on_tick_delayed']['count'] == 2
+
+    immediate.remove()
+    delayed.remove()
+    assert not any(bus.metrics.listeners.values())
+    listener_types = bus.metrics.snapshot(bus)['listener_types']
+    assert listener_types['IMMEDIATE']['count'] == 6
+    assert listener_types['DELAY']['count'] == 2
+
+
+def test_snapshot_while_processing():
+    bus = EventBus()
+    bus.enable_metrics(EventBusMetrics())
+    bus.add_topic_listener('tick.#', lambda: None)
+    stop = threading.Event()
+    errors = []
+
+    def read():
+        while not stop.is_set():
+            try:
+                bus.metrics.snapshot(bus)
+            except RuntimeError as e:
+                errors.append(e)
+                return
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        for index in range(3000):
+            bus.publish(f'tick.{index}')
+            bus.process()
+    finally:
+        stop.set()
+        reader.join()
+    assert not errors
+
+
+class CountingLock:
+    """记录加锁次数"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.acquired = 0
+
+    def __enter__(self):
+        self.acquired += 1
+        return self.lock.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self.lock.__exit__(*exc_info)
+
+
+def test_wrapped_callback_uses_lock_free_lookup():
+    metrics = EventBusMetrics()
+    metrics.lock = CountingLock()
+
+    def on_tick():
+        pass
+
+    def wrap():
+        # 与绑定负载的延迟任务一样，每次都是新的包装函数
+        @functools.wraps(on_tick)
+        def wrapper():
+            return on_tick()
+        return wrapper
+
+    metrics.call(wrap(), EventBus.DELAY)
+    assert metrics.lock.acquired == 1
+    for _ in range(10):
+        metrics.call(wrap(), EventBus.DELAY)
+        metrics.record_listener(wrap(), EventBus.DELAY, 100)
+    # 已有直方图时按原回调不加锁地找到
+    assert metrics.lock.acquired == 1
+    assert list(metrics.listeners[EventBus.DELAY]) == [on_tick]
+    assert metrics.listeners[EventBus.DELAY][on_tick].count == 21
+
+
+def test_payload_delayed_listener_uses_lock_free_lookup():
+    bus = EventBus(threaded=False, maxsize=0)
+    bus.enable_metrics(EventBusMetrics())
+    bus.metrics.lock = CountingLock()
+
+    def on_tick_delayed(payload):
+        pass
+
+    bus.add_delayed_listener('tick', 1, on_tick_delayed, with_payload=True)
+    for price in range(3):
+        bus.publish('tick', price)
+    bus.process()
+    acquired = bus.metrics.lock.acquired
+
+    for price in range(20):
+        bus.publish('tick', price)
+    bus.process()
+    assert bus.metrics.lock.acquired == acquired
+    assert bus.metrics.snapshot(bus)['listeners']['DELAY:on_tick_delayed']['count'] == 22
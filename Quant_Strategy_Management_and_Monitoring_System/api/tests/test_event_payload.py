@@ -0,0 +1,157 @@
+import pytest
+
+from api.event.event_engine import EventBus
+from api.event.event_journal import EventJournal
+from api.event.event_payload import CoalescedEvent, PayloadEvent
+from api.event.event_queue import EventQueue
+from api.event.event_snapshot import EventBusSnapshot
+
+
+def test_payload_event_is_its_name():
+    event = PayloadEvent('tick', {'price': 1})
+    assert event == 'tick' and hash(event) == hash('tick')
+    assert str(event).__class__ is str and str(event) == 'tick'
+    assert {event: 1} == {'tick': 1}
+    assert repr(event) == "PayloadEvent('tick', payload={'price': 1})"
+
+
+@pytest.mark.parametrize('batch_size', [1, 8])
+def test_payload_reaches_listeners(batch_size):
+    bus = EventBus(threaded=False, maxsize=0)
+    seen = []
+    bus.add_immediate_listener('tick', lambda: seen.append(('current', bus.current_payload)))
+    bus.add_immediate_listener('tick', lambda payload: seen.append(('immediate', payload)), with_payload=True)
+    bus.add_delayed_listener('tick', 1, lambda payload: seen.append(('delayed', payload)), with_payload=True)
+    bus.add_joint_listener(['tick', 'bar'], lambda payload: seen.append(('joint', payload)), with_payload=True)
+    bus.add_pattern_listener(['bar', 'tick'], lambda payload: seen.append(('pattern', payload)), with_payload=True)
+    bus.add_topic_listener('#', lambda payload: seen.append(('topic', payload)), with_payload=True)
+
+    prices = bytearray(b'\x01\x02')
+    bus.publish('bar')
+    bus.publish('tick', prices)
+    bus.publish('tick')
+    bus.publish('end')
+    bus.process(batch_size=batch_size)
+
+    assert seen == [
+        ('topic', None),
+        ('current', prices), ('immediate', prices), ('topic', prices), ('joint', prices), ('pattern', prices),
+        # 延迟任务在之后的事件中触发，收到的是source事件的负载
+        ('current', None), ('immediate', None), ('topic', None), ('delayed', prices),
+        ('topic', None), ('delayed', None),
+    ]
+    # 只传递引用
+    assert seen[1][1] is prices
+    # 处理结束后不再持有负载
+    assert bus.current_payload is None
+
+
+def test_payload_is_not_copied_across_threads():
+    bus = EventBus(maxsize=0)
+    buffer = memoryview(bytearray(8))
+    seen = []
+    bus.add_immediate_listener('tick', lambda payload: seen.append(payload), with_payload=True)
+    bus.publish('tick', buffer)
+    bus.process()
+    assert seen[0] is buffer
+
+
+def test_coalesced_event_keeps_latest_payload():
+    bus = EventBus(threaded=False, maxsize=0)
+    seen = []
+    bus.add_immediate_listener('tick', lambda payload: seen.append(payload), with_payload=True)
+    bus.add_coalesce_rule('tick')
+
+    bus.publish('tick')
+    bus.publish('tick', 1)
+    bus.publish('tick', 2)
+    # 不带负载的同名事件不覆盖已合并的负载
+    bus.publish('tick')
+    queued = bus.event_bus.lanes[EventQueue.NORMAL][0]
+    assert queued.__class__ is CoalescedEvent and queued.merged == 3
+    bus.process()
+    assert seen == [2]
+    assert bus.event_count == 4
+
+
+@pytest.mark.parametrize('policy, expected', [
+    # 队列满时丢弃新事件，队列中的事件保留自己的负载
+    (EventQueue.COALESCE, [1, 3]),
+    (EventQueue.DROP_NEWEST, [1, 3]),
+    (EventQueue.DROP_OLDEST, [2, 3]),
+])
+def test_overflow_keeps_payload_of_queued_event(policy, expected):
+    bus = EventBus(threaded=False, maxsize=2, overflow_policy=policy)
+    seen = []
+    bus.add_immediate_listener('tick', lambda payload: seen.append(payload), with_payload=True)
+    bus.add_immediate_listener('bar', lambda payload: seen.append(payload), with_payload=True)
+    bus.publish('tick', 1)
+    bus.publish('bar', 3)
+    bus.publish('tick', 2)
+    bus.process()
+    assert sorted(seen) == expected
+
+
+def test_journal_stores_names_only(tmp_path):
+    log = []
+
+    def build():
+        bus = EventBus(threaded=False, maxsize=0)
+        bus.add_immediate_listener('tick', lambda payload: log.append(payload), with_payload=True)
+        bus.add_joint_listener(['tick', 'bar'], lambda: log.append('joint'))
+        bus.add_delayed_listener('bar', 5, lambda: log.append('delayed'))
+        bus.add_coalesce_rule('tick')
+        return bus
+
+    bus = build()
+    bus.enable_journal(EventJournal(str(tmp_path)))
+    bus.publish('tick', {'price': 1})
+    bus.publish('tick', {'price': 2})
+    bus.publish('bar', [1, 2, 3])
+    bus.process()
+    bus.publish('tick', object())
+    bus.process()
+    bus.journal.close()
+
+    records = [(kind, event) for kind, event, _ in EventJournal(str(tmp_path)).read() if kind != EventJournal.BASE]
+    assert all(event.__class__ is str for _, event in records)
+    assert [event for kind, event in records if kind == EventJournal.DISPATCH] == ['tick', 'bar', 'tick']
+    assert [event for kind, event in records if kind == EventJournal.MERGED] == ['tick']
+
+    restored = build()
+    journal = EventJournal(str(tmp_path))
+    restored.enable_journal(journal)
+    log.clear()
+    assert journal.replay(restored) == 3
+    # 重放只恢复状态，不执行带负载的回调
+    assert log == []
+    assert restored.event_count == bus.event_count == 4
+    assert [condition.occurred_mask for condition in restored.joint_conditions] == \
+           [condition.occurred_mask for condition in bus.joint_conditions]
+    assert [handle.deadline for handle in restored.delayed_tasks.pending()] == \
+           [handle.deadline for handle in bus.delayed_tasks.pending()]
+    journal.close()
+
+
+def test_snapshot_drops_payloads_of_queued_events():
+    def build(log):
+        bus = EventBus(threaded=False, maxsize=0)
+        bus.add_immediate_listener('tick', lambda payload: log.append(('tick', payload)), with_payload=True)
+        bus.add_immediate_listener('bar', lambda payload: log.append(('bar', payload)), with_payload=True)
+        bus.add_coalesce_rule('tick')
+        return bus
+
+    bus = build([])
+    bus.publish('bar', [1, 2, 3], priority=EventQueue.HIGH)
+    bus.publish('tick', {'price': 1})
+    bus.publish('tick', {'price': 2})
+    state = EventBusSnapshot.loads(EventBusSnapshot.dumps(EventBusSnapshot.capture(bus)))
+    assert state['queue'] == [['bar', EventQueue.HIGH, 0], ['tick', EventQueue.NORMAL, 1]]
+
+    log = []
+    restored = build(log)
+    EventBusSnapshot.restore(restored, state)
+    restored.process()
+    # 负载不保存在快照中，合并数与车道保留
+    assert log == [('bar', None), ('tick', None)]
+    assert restored.event_count == 3
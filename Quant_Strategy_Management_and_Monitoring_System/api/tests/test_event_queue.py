@@ -0,0 +1,276 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from api.event.event_engine import EventBus
+from api.event.event_queue import EventQueue, LockedEventQueue
+
+
+TIMEOUT = 5
+
+
+def drain(event_queue):
+    events = []
+    while not event_queue.empty():
+        events.append(str(event_queue.get_nowait()))
+    return events
+
+
+@pytest.fixture(params=[EventQueue, LockedEventQueue])
+def queue_class(request):
+    return request.param
+
+
+def test_drop_newest(queue_class):
+    event_queue = queue_class(maxsize=3, overflow_policy=EventQueue.DROP_NEWEST)
+    for event in 'abcd':
+        event_queue.put(event)
+    assert event_queue.full() and event_queue.qsize() == 3
+    assert drain(event_queue) == ['a', 'b', 'c']
+    assert event_queue.stats['dropped_newest'] == 1
+
+
+def test_drop_oldest(queue_class):
+    event_queue = queue_class(maxsize=3, overflow_policy=EventQueue.DROP_OLDEST)
+    for event in 'abcde':
+        event_queue.put(event)
+    assert drain(event_queue) == ['c', 'd', 'e']
+    assert event_queue.stats['dropped_oldest'] == 2
+
+
+def test_drop_oldest_drops_from_lowest_lane(queue_class):
+    event_queue = queue_class(maxsize=3, overflow_policy=EventQueue.DROP_OLDEST)
+    event_queue.put('n1')
+    event_queue.put('l1', EventQueue.LOW)
+    event_queue.put('n2')
+    # 丢弃优先级最低的非空车道中最早的事件
+    event_queue.put('h1', EventQueue.HIGH)
+    assert event_queue.lane_depths() == {'critical': 0, 'high': 1, 'normal': 2, 'low': 0}
+    # 新事件的优先级比队列中所有事件都低时丢弃新事件
+    event_queue.put('l2', EventQueue.LOW)
+    assert drain(event_queue) == ['h1', 'n1', 'n2']
+    assert event_queue.stats['dropped_oldest'] == 1
+    assert event_queue.stats['dropped_newest'] == 1
+
+
+def test_coalesce(queue_class):
+    event_queue = queue_class(maxsize=2, overflow_policy=EventQueue.COALESCE)
+    for event in 'abab':
+        event_queue.put(event)
+    # 队列中没有相同的待处理事件时丢弃
+    event_queue.put('c')
+    assert event_queue.stats['coalesced'] == 2
+    assert event_queue.stats['dropped_newest'] == 1
+    assert event_queue.get_nowait() == 'a'
+    # 取出后不再有待处理的a
+    event_queue.put('c')
+    event_queue.put('b')
+    assert drain(event_queue) == ['b', 'c']
+    assert event_queue.stats['coalesced'] == 3
+    assert event_queue.pending == {}
+
+
+def test_spill(queue_class):
+    event_queue = queue_class(maxsize=2, overflow_policy=EventQueue.SPILL, spill_maxsize=2)
+    for event in 'abcde':
+        event_queue.put(event)
+    assert event_queue.qsize() == 4
+    assert event_queue.stats['spilled'] == 2
+    assert event_queue.stats['dropped_newest'] == 1
+
+    assert event_queue.get_nowait() == 'a'
+    # 溢出缓冲区非空时新事件也进入缓冲区，保证FIFO
+    assert not event_queue.full() or event_queue.spill
+    event_queue.put('f')
+    assert drain(event_queue) == ['b', 'c', 'd', 'f']
+    assert event_queue.stats['spilled'] == 3
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        EventQueue(overflow_policy='unknown')
+
+
+def test_block_requires_locked_queue():
+    with pytest.raises(ValueError):
+        EventQueue(overflow_policy=EventQueue.BLOCK)
+    with pytest.raises(ValueError):
+        EventBus(threaded=False, overflow_policy=EventQueue.BLOCK)
+
+
+def test_block_waits_for_space():
+    event_queue = LockedEventQueue(maxsize=1, overflow_policy=EventQueue.BLOCK)
+    event_queue.put('a')
+    publisher = threading.Thread(target=event_queue.put, args=('b',))
+    publisher.start()
+    time.sleep(0.05)
+    assert publisher.is_alive()
+    assert event_queue.stats['blocked'] == 1
+
+    assert event_queue.get() == 'a'
+    publisher.join(TIMEOUT)
+    assert not publisher.is_alive()
+    assert event_queue.get(timeout=TIMEOUT) == 'b'
+    assert event_queue.stats['block_timeout'] == 0
+
+
+def test_block_timeout():
+    event_queue = LockedEventQueue(maxsize=1, overflow_policy=EventQueue.BLOCK, block_timeout=0.01)
+    event_queue.put('a')
+    event_queue.put('b')
+    assert drain(event_queue) == ['a']
+    assert event_queue.stats['blocked'] == 1
+    assert event_queue.stats['block_timeout'] == 1
+    with pytest.raises(queue.Empty):
+        event_queue.get(timeout=0.01)
+
+
+def run_with_timeout(target):
+    """在其它线程中运行，死锁时测试失败而不是挂起"""
+    result = []
+    thread = threading.Thread(target=lambda: result.append(target()), daemon=True)
+    thread.start()
+    thread.join(TIMEOUT)
+    assert not thread.is_alive(), 'deadlock'
+    return result[0]
+
+
+def test_block_publish_from_processing_thread():
+    bus = EventBus(maxsize=2)
+    assert bus.event_bus.overflow_policy == EventQueue.BLOCK
+    log = []
+    bus.add_immediate_listener('A', lambda: [bus.publish('B') for _ in range(3)])
+    bus.add_immediate_listener('B', lambda: log.append('B'))
+    bus.publish('A')
+    bus.publish('A')
+
+    assert run_with_timeout(bus.process)
+    # 处理线程发布的事件超出容量放入队列，不丢弃
+    assert log == ['B'] * 6
+    stats = bus.queue_stats()
+    assert stats['overfilled'] >= 1
+    assert stats['blocked'] == 0 and stats['dropped_newest'] == 0
+    assert bus.event_bus.consumers == set()
+
+
+def test_block_publish_from_parallel_listener():
+    executor = ThreadPoolExecutor(2)
+    try:
+        bus = EventBus(maxsize=1, dispatch_executor=executor)
+        log = []
+        bus.add_immediate_listener('A', lambda: [bus.publish('B') for _ in range(2)], independent=True)
+        bus.add_immediate_listener('B', lambda: log.append('B'))
+        bus.publish('A')
+
+        assert run_with_timeout(bus.process)
+    finally:
+        executor.shutdown(wait=False)
+    assert log == ['B'] * 2
+    assert bus.queue_stats()['overfilled'] >= 1
+    assert bus.event_bus.consumers == set()
+
+
+def test_block_other_threads_still_wait_while_processing():
+    bus = EventBus(maxsize=1)
+    started, go = threading.Event(), threading.Event()
+    log = []
+    bus.add_immediate_listener('A', lambda: (started.set(), go.wait(TIMEOUT)))
+    bus.add_immediate_listener('X', lambda: log.append('X'))
+    bus.add_immediate_listener('Y', lambda: log.append('Y'))
+    bus.publish('A')
+
+    processor = threading.Thread(target=bus.process)
+    processor.start()
+    assert started.wait(TIMEOUT)
+    bus.publish('X')
+    publisher = threading.Thread(target=bus.publish, args=('Y',))
+    publisher.start()
+    time.sleep(0.05)
+    # 其它线程发布事件时仍然等待空位
+    assert publisher.is_alive()
+    assert bus.queue_stats()['blocked'] == 1
+
+    go.set()
+    publisher.join(TIMEOUT)
+    processor.join(TIMEOUT)
+    assert not publisher.is_alive() and not processor.is_alive()
+    bus.process()
+    assert log == ['X', 'Y']
+    assert bus.queue_stats()['overfilled'] == 0
+
+
+@pytest.fixture
+def starvation_limit():
+    previous = EventQueue.starvation_limit
+    yield
+    EventQueue.starvation_limit = previous
+
+
+def fill_lanes(event_queue, count):
+    for index in range(count):
+        for lane, name in enumerate(EventQueue.LANE_NAMES):
+            event_queue.put(f'{name}{index}', lane)
+
+
+def test_strict_priority_without_starvation(queue_class, starvation_limit):
+    EventQueue.starvation_limit = 1000
+    event_queue = queue_class(maxsize=0, overflow_policy=EventQueue.DROP_NEWEST)
+    fill_lanes(event_queue, 5)
+    expected = [f'{name}{index}' for name in EventQueue.LANE_NAMES for index in range(5)]
+    assert drain(event_queue) == expected
+
+
+@pytest.mark.parametrize('limit', [0, 1, 3, 8, 64])
+def test_starvation_across_lanes(queue_class, starvation_limit, limit):
+    EventQueue.starvation_limit = limit
+    event_queue = queue_class(maxsize=0, overflow_policy=EventQueue.DROP_NEWEST)
+    count = 100
+    fill_lanes(event_queue, count)
+    events = drain(event_queue)
+    lane_count = len(EventQueue.LANE_NAMES)
+    assert len(events) == count * lane_count
+
+    for name in EventQueue.LANE_NAMES:
+        positions = [position for position, event in enumerate(events) if event.startswith(name)]
+        # 同一车道内为FIFO
+        assert [events[position] for position in positions] == [f'{name}{index}' for index in range(count)]
+        # 车道非空时最多连续被跳过starvation_limit次，加上同时达到阈值的其它车道轮流取出的次数
+        gaps = [after - before for before, after in zip([-1] + positions, positions)]
+        assert max(gaps) <= limit + lane_count
+
+    # 所有车道都非空时，高优先级车道取出的事件数不少于低优先级车道（防饿死不会反过来饿死高优先级车道）
+    for end in range(1, count + 1):
+        served = [sum(event.startswith(name) for event in events[:end]) for name in EventQueue.LANE_NAMES]
+        assert served == sorted(served, reverse=True)
+
+
+def test_starvation_limit_zero_is_round_robin(queue_class, starvation_limit):
+    EventQueue.starvation_limit = 0
+    event_queue = queue_class(maxsize=0, overflow_policy=EventQueue.DROP_NEWEST)
+    fill_lanes(event_queue, 3)
+    assert drain(event_queue) == [f'{name}{index}' for index in range(3) for name in EventQueue.LANE_NAMES]
+
+
+def test_starved_lane_is_served_after_limit(queue_class, starvation_limit):
+    EventQueue.starvation_limit = 3
+    event_queue = queue_class(maxsize=0, overflow_policy=EventQueue.DROP_NEWEST)
+    event_queue.put('low', EventQueue.LOW)
+    for index in range(6):
+        event_queue.put(f'critical{index}', EventQueue.CRITICAL)
+    assert drain(event_queue) == ['critical0', 'critical1', 'critical2', 'low', 'critical3', 'critical4', 'critical5']
+
+
+def test_priorities_on_event_bus():
+    bus = EventBus(threaded=False, maxsize=0)
+    log = []
+    for event in ('low', 'normal', 'high', 'critical'):
+        bus.add_immediate_listener(event, lambda event=event: log.append(event))
+    bus.publish('low', priority=EventQueue.LOW)
+    bus.publish('normal')
+    bus.publish('high', priority=EventQueue.HIGH)
+    bus.publish('critical', priority=EventQueue.CRITICAL)
+    bus.process()
+    assert log == ['critical', 'high', 'normal', 'low']
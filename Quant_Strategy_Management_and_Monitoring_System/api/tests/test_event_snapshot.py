@@ -0,0 +1,95 @@
+import random
+
+import pytest
+
+from api.event.event_engine import EventBus
+from api.event.event_snapshot import EventBusSnapshot, SnapshotError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def build(seed, clock, log, rng):
+    """按seed随机注册各类监听器，回调按rng随机发布新的事件"""
+    r = random.Random(seed)
+    bus = EventBus(threaded=False, maxsize=0, clock=clock)
+    names = 'ABCDE'
+    for index in range(8):
+        def make(name=f'cb{index}', publish=r.choice(names + 'XX')):
+            def callback():
+                log.append(name)
+                if publish != 'X' and rng[0].random() < 0.3:
+                    bus.publish(publish)
+            callback.__name__ = name
+            return callback
+
+        kind = r.randint(0, 4)
+        if kind == 0:
+            bus.add_immediate_listener(r.choice(names), make())
+        elif kind == 1:
+            bus.add_delayed_listener(r.choice(names), r.randint(1, 6), make())
+        elif kind == 2:
+            bus.add_joint_listener(r.sample(names, r.randint(1, 3)), make())
+        elif kind == 3:
+            bus.add_pattern_listener([r.choice(names + '*') for _ in range(r.randint(1, 3))], make())
+        else:
+            bus.add_timed_listener(r.choice(names), r.randint(1, 50), make())
+    bus.compile_patterns()
+    return bus
+
+
+def continue_run(bus, clock, rng):
+    rng[0] = random.Random(999)
+    for _ in range(3):
+        for event in 'ABCDEAB':
+            bus.publish(event)
+        bus.process(maxStep=200)
+        clock.now += 0.02
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_round_trip_continues_identically(seed, tmp_path):
+    clock = Clock()
+    rng = [random.Random(seed)]
+    log = []
+    bus = build(seed, clock, log, rng)
+    # 处理步数有限，快照中包含尚未处理的事件、延迟与定时任务、联合与模式的进行中状态
+    r = random.Random(seed + 7)
+    for _ in range(r.randint(1, 10)):
+        for _ in range(r.randint(1, 5)):
+            bus.publish(r.choice('ABCDEF'))
+        bus.process(maxStep=r.randint(1, 30))
+        clock.now += 0.01
+
+    path = str(tmp_path / 'bus.snapshot')
+    EventBusSnapshot.save(bus, path)
+    restored_log = []
+    restored = build(seed, clock, restored_log, rng)
+    EventBusSnapshot.restore(restored, EventBusSnapshot.load(path))
+    assert restored.event_count == bus.event_count
+
+    start = clock.now
+    log.clear()
+    continue_run(bus, clock, rng)
+    clock.now = start
+    continue_run(restored, clock, rng)
+    assert restored_log == log
+    assert restored.event_count == bus.event_count
+
+
+def test_load_rejects_damaged_snapshot(tmp_path):
+    path = tmp_path / 'bus.snapshot'
+    EventBusSnapshot.save(EventBus(threaded=False), str(path))
+    raw = path.read_bytes()
+
+    with pytest.raises(SnapshotError):
+        EventBusSnapshot.loads(b'not a snapshot')
+    with pytest.raises(SnapshotError):
+        EventBusSnapshot.loads(raw[:-1])
+    with pytest.raises(SnapshotError):
+        EventBusSnapshot.loads(raw[:-4] + b'\0\0\0\0')
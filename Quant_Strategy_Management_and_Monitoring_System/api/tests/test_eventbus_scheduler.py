@@ -0,0 +1,127 @@
+import threading
+
+import pytest
+
+from api.event import eventbus_scheduler
+from api.event.event_engine import EventBus
+from api.event.eventbus_scheduler import EventBusScheduler
+
+
+TIMEOUT = 5
+
+
+@pytest.fixture
+def db_cleanup(monkeypatch):
+    """记录调度线程清理数据库连接的次数"""
+    calls = {'close_old': 0, 'close_all': 0}
+
+    class Connections:
+        @staticmethod
+        def close_all():
+            calls['close_all'] += 1
+
+    monkeypatch.setattr(eventbus_scheduler, 'close_old_connections',
+                        lambda: calls.__setitem__('close_old', calls['close_old'] + 1))
+    monkeypatch.setattr(eventbus_scheduler, 'connections', Connections)
+    return calls
+
+
+@pytest.fixture
+def scheduler(monkeypatch, db_cleanup):
+    # 时间片只按步数结束
+    monkeypatch.setattr(EventBusScheduler, 'slice_steps', 10)
+    monkeypatch.setattr(EventBusScheduler, 'slice_ms', 10000.0)
+    monkeypatch.setattr(EventBusScheduler, 'batch_size', 1)
+    scheduler = EventBusScheduler(name='test-scheduler')
+    yield scheduler
+    scheduler.stop(TIMEOUT)
+
+
+def busy_bus() -> EventBus:
+    """队列不限容量，每个事件E是一步"""
+    bus = EventBus(maxsize=0)
+    bus.event_logger.set_events(False)
+    bus.add_immediate_listener('E', lambda: None)
+    return bus
+
+
+def submit_events(tenant, count: int):
+    """提交一个在调度线程中一次发布count个事件的任务"""
+    return tenant.submit(lambda: tenant.eventBus.publish_many(['E'] * count))
+
+
+def test_job_and_round(scheduler, db_cleanup):
+    bus = EventBus()
+    log = []
+    bus.add_immediate_listener('A', lambda: (log.append('A'), bus.publish('B')))
+    bus.add_immediate_listener('B', lambda: log.append(threading.current_thread().name))
+    tenant = scheduler.register('1', bus)
+    scheduler.start()
+
+    assert tenant.submit(lambda: (bus.publish('A'), 'done')[1]).result(TIMEOUT) == 'done'
+    assert log == ['A', 'test-scheduler']
+    assert scheduler.usage('1')['1']['jobs'] == 1
+    # 时间片与任务的前后都清理数据库连接
+    assert db_cleanup['close_old'] >= 4
+
+    scheduler.stop(TIMEOUT)
+    assert not scheduler.thread.is_alive()
+    assert db_cleanup['close_all'] == 1
+
+
+def test_weighted_round_robin(scheduler):
+    heavy_bus, light_bus = busy_bus(), busy_bus()
+    heavy = scheduler.register('heavy', heavy_bus, weight=3)
+    light = scheduler.register('light', light_bus, weight=1)
+
+    # 轻用户处理第500个事件时，记录两个用户已处理的事件数
+    counts = []
+
+    def record():
+        if light_bus.event_count == 500:
+            counts.append((heavy_bus.event_count, light_bus.event_count))
+
+    light_bus.add_immediate_listener('E', record)
+    futures = [submit_events(heavy, 3000), submit_events(light, 1000)]
+    scheduler.start()
+    for future in futures:
+        future.result(TIMEOUT)
+
+    (heavy_count, light_count), = counts
+    assert 2.5 < heavy_count / light_count < 3.5
+    assert heavy.slices == pytest.approx(light.slices, abs=2)
+
+
+def test_quota_defers_tenant(scheduler):
+    scheduler.quota_window = 60.0
+    limited = scheduler.register('limited', busy_bus(), step_quota=50)
+    free = scheduler.register('free', busy_bus())
+
+    limited_future = submit_events(limited, 500)
+    free_future = submit_events(free, 500)
+    scheduler.start()
+
+    free_future.result(TIMEOUT)
+    # 超过配额的用户在窗口结束前不再被调度，其它用户不受影响
+    usage = scheduler.usage('limited')['limited']
+    assert usage['steps'] == 50 and usage['throttled'] > 0
+    assert usage['in_round'] and not limited_future.done()
+    assert free.steps == 500
+
+
+def test_step_cap(scheduler, monkeypatch):
+    monkeypatch.setattr(EventBusScheduler, 'max_step', 100)
+    bus = EventBus()
+    # 无限事件循环
+    bus.add_immediate_listener('A', lambda: bus.publish('A'))
+    tenant = scheduler.register('1', bus)
+    scheduler.start()
+
+    # 达到步数上限时结束本轮，剩余事件等到下一个任务提交时再处理
+    tenant.submit(lambda: bus.publish('A')).result(TIMEOUT)
+    assert tenant.steps == 100 and tenant.stalled
+    assert bus.event_bus.qsize() == 1
+    assert not tenant.has_work()
+
+    tenant.submit(lambda: None).result(TIMEOUT)
+    assert tenant.steps == 200
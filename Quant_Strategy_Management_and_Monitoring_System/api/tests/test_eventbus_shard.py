@@ -0,0 +1,145 @@
+import threading
+import time
+
+import pytest
+from rest_framework.response import Response
+
+from api.event import eventbus_shard
+from api.event.eventbus_shard import EventBusShardRouter, EventBusShardServer, HashRing
+
+
+TIMEOUT = 5
+USERS = range(20000)
+
+
+def test_hash_ring_is_deterministic():
+    # 不同进程各自构造的环必须给出相同的映射
+    first, second = HashRing(4), HashRing(4)
+    assert [first.shard_for(user) for user in USERS] == [second.shard_for(user) for user in USERS]
+    assert first.shard_for(42) == first.shard_for('42')
+    assert {first.shard_for(user) for user in USERS} == {0, 1, 2, 3}
+
+
+@pytest.mark.parametrize('shard_count', [1, 3, 4, 8])
+def test_hash_ring_adding_a_shard_only_moves_users_to_it(shard_count):
+    before, after = HashRing(shard_count), HashRing(shard_count + 1)
+    moved = [user for user in USERS if before.shard_for(user) != after.shard_for(user)]
+    # 被重新分配的用户全部落到新分片上，其余用户不动
+    assert all(after.shard_for(user) == shard_count for user in moved)
+    expected = len(USERS) / (shard_count + 1)
+    assert 0.7 * expected < len(moved) < 1.3 * expected
+
+
+@pytest.mark.parametrize('shard_count', [2, 4, 8])
+def test_hash_ring_removing_a_shard_only_moves_its_users(shard_count):
+    before, after = HashRing(shard_count), HashRing(shard_count - 1)
+    removed = shard_count - 1
+    for user in USERS:
+        if before.shard_for(user) != removed:
+            assert after.shard_for(user) == before.shard_for(user)
+
+
+@pytest.fixture
+def db_cleanup(monkeypatch):
+    """记录连接线程清理数据库连接的次数"""
+    calls = {'close_old': 0, 'close_all': 0}
+
+    class Connections:
+        @staticmethod
+        def close_all():
+            calls['close_all'] += 1
+
+    monkeypatch.setattr(eventbus_shard, 'close_old_connections',
+                        lambda: calls.__setitem__('close_old', calls['close_old'] + 1))
+    monkeypatch.setattr(eventbus_shard, 'db_connections', Connections)
+    return calls
+
+
+@pytest.fixture
+def router(monkeypatch):
+    for name in ('shard_count', 'host', 'base_port', 'authkey', 'timeout', 'ring'):
+        monkeypatch.setattr(EventBusShardRouter, name, getattr(EventBusShardRouter, name))
+    # 端口0由系统分配，之后按实际端口修正base_port
+    EventBusShardRouter.configure(1, base_port=0, authkey=b'test-shard', timeout=TIMEOUT)
+    yield EventBusShardRouter
+    EventBusShardRouter._discard(0)
+
+
+def wait_for(predicate):
+    deadline = time.monotonic() + TIMEOUT
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def server(router, db_cleanup):
+    calls = []
+
+    def echo(user_id, params):
+        calls.append((threading.current_thread().name, user_id, params))
+        return Response({'user': user_id, 'params': params}, status=201)
+
+    def fail(user_id, params):
+        raise ValueError('handler failed')
+
+    server = EventBusShardServer(0, {'echo': echo, 'fail': fail})
+    router.base_port = server.listener.address[1]
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.calls = calls
+    yield server
+    server.stop()
+    thread.join(TIMEOUT)
+    assert not thread.is_alive()
+
+
+def test_forward_round_trip(server, db_cleanup):
+    response = EventBusShardRouter.forward(7, 'echo', {'label': 'a'})
+    assert response.status_code == 201
+    assert response.data == {'user': 7, 'params': {'label': 'a'}}
+
+    # 同一线程复用缓存的连接，处理函数在分片的连接线程中执行
+    response = EventBusShardRouter.forward(8, 'echo')
+    assert response.data == {'user': 8, 'params': {}}
+    assert [call[1:] for call in server.calls] == [(7, {'label': 'a'}), (8, {})]
+    assert all(call[0] == 'eventbus-shard-0-conn' for call in server.calls)
+
+
+def test_forward_errors(server):
+    response = EventBusShardRouter.forward(7, 'missing')
+    assert response.status_code == 400
+    response = EventBusShardRouter.forward(7, 'fail')
+    assert response.status_code == 500
+    assert response.data == {'shard error': 'handler failed'}
+
+
+def test_misdirected_request(server):
+    EventBusShardRouter.ring = HashRing(2)
+    user = next(user for user in USERS if EventBusShardRouter.ring.shard_for(user) == 1)
+    data, status_code = server.handle('echo', user, {})
+    assert status_code == 421
+    assert server.calls == []
+
+
+def test_forward_unavailable_shard(router):
+    # 没有分片在监听
+    router.base_port = 1
+    response = EventBusShardRouter.forward(7, 'echo')
+    assert response.status_code == 503
+
+
+def test_connection_thread_cleans_up_db_connections(server, db_cleanup):
+    for _ in range(3):
+        assert EventBusShardRouter.forward(7, 'echo').status_code == 201
+    # 每个请求前后各一次
+    assert db_cleanup['close_old'] == 6
+    assert db_cleanup['close_all'] == 0
+
+    EventBusShardRouter._discard(0)
+    wait_for(lambda: db_cleanup['close_all'] == 1)
+
+
+def test_handler_exception_still_cleans_up(server, db_cleanup):
+    assert EventBusShardRouter.forward(7, 'fail').status_code == 500
+    assert db_cleanup['close_old'] == 2
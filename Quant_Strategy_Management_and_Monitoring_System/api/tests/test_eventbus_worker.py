@@ -0,0 +1,122 @@
+import threading
+import time
+
+import pytest
+
+from api.event import eventbus_worker
+from api.event.event_engine import EventBus
+from api.event.eventbus_worker import EventBusWorker
+
+
+TIMEOUT = 5
+
+
+@pytest.fixture
+def db_cleanup(monkeypatch):
+    """记录工作线程清理数据库连接的次数"""
+    calls = {'close_old': 0, 'close_all': 0}
+
+    class Connections:
+        @staticmethod
+        def close_all():
+            calls['close_all'] += 1
+
+    monkeypatch.setattr(eventbus_worker, 'close_old_connections',
+                        lambda: calls.__setitem__('close_old', calls['close_old'] + 1))
+    monkeypatch.setattr(eventbus_worker, 'connections', Connections)
+    return calls
+
+
+@pytest.fixture
+def worker(db_cleanup):
+    bus = EventBus()
+    worker = EventBusWorker(bus, name='test-worker')
+    worker.start()
+    yield worker
+    worker.stop(TIMEOUT)
+
+
+def test_start_and_stop(db_cleanup):
+    worker = EventBusWorker(EventBus(), name='test-worker')
+    worker.start()
+    assert worker.running
+
+    worker.stop(TIMEOUT)
+    assert not worker.thread.is_alive() and not worker.running
+    assert db_cleanup['close_all'] == 1
+    with pytest.raises(RuntimeError):
+        worker.submit(lambda: None)
+
+
+def test_job_and_cascade(worker, db_cleanup):
+    bus = worker.eventBus
+    log = []
+    bus.add_immediate_listener('A', lambda: (log.append('A'), bus.publish('B')))
+    bus.add_immediate_listener('B', lambda: log.append(threading.current_thread().name))
+
+    future = worker.submit(lambda: (bus.publish('A'), 'done')[1])
+
+    # Future在任务与之后的事件级联都结束后完成
+    assert future.result(TIMEOUT) == 'done'
+    assert log == ['A', 'test-worker']
+    assert db_cleanup['close_old'] >= 2
+
+
+def test_job_exception(worker):
+    def fail():
+        raise KeyError('job')
+
+    with pytest.raises(KeyError):
+        worker.submit(fail).result(TIMEOUT)
+    # 任务失败不影响之后的任务
+    assert worker.submit(lambda: 1).result(TIMEOUT) == 1
+
+
+def test_publish_from_other_thread(worker):
+    bus = worker.eventBus
+    processed = threading.Event()
+    bus.add_immediate_listener('A', processed.set)
+
+    # 不提交任务，直接从其它线程发布的事件也会唤醒工作线程
+    threading.Thread(target=bus.publish, args=('A',)).start()
+    assert processed.wait(TIMEOUT)
+
+
+def test_timed_task_fires(worker):
+    bus = worker.eventBus
+    fired = threading.Event()
+    bus.add_timed_listener('A', 50, fired.set)
+
+    worker.submit(lambda: bus.publish('A')).result(TIMEOUT)
+    assert not fired.is_set()
+    # 空闲的工作线程在定时任务到期时醒来，不需要新的任务或事件
+    assert fired.wait(TIMEOUT)
+
+
+def test_clean_shutdown(db_cleanup):
+    worker = EventBusWorker(EventBus(), name='test-worker')
+    worker.start()
+    started, release = threading.Event(), threading.Event()
+
+    def block():
+        started.set()
+        return release.wait(TIMEOUT)
+
+    running = worker.submit(block)
+    pending = worker.submit(lambda: None)
+    assert started.wait(TIMEOUT)
+
+    stopper = threading.Thread(target=worker.stop, args=(TIMEOUT,))
+    stopper.start()
+    # 停止请求先于正在执行的任务结束
+    deadline = time.monotonic() + TIMEOUT
+    while not worker.stopping and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    stopper.join(TIMEOUT)
+
+    # 正在执行的任务正常结束，尚未执行的任务被取消，线程退出时关闭数据库连接
+    assert running.result(TIMEOUT) is True
+    assert pending.cancelled()
+    assert not worker.thread.is_alive()
+    assert db_cleanup['close_all'] == 1
@@ -0,0 +1,169 @@
+import random
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from api.event.event_engine import EventBus
+from api.event.event_metrics import EventBusMetrics
+from api.tests.test_process_batch import build_bus
+
+
+def set_mode(bus: EventBus, mode: str):
+    """fast：没有逐事件日志与指标，冻结后使用只检查取消订阅的循环；logged：逐事件日志；metrics：挂载指标收集器"""
+    if mode == 'fast':
+        bus.event_logger.set_events(False)
+    elif mode == 'metrics':
+        bus.enable_metrics(EventBusMetrics())
+
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('batch_size', [1, 8])
+@pytest.mark.parametrize('mode', ['fast', 'logged', 'metrics'])
+def test_frozen_matches_unfrozen(seed, batch_size, mode):
+    events = [f'E{i}' for i in random.Random(seed + 3000).choices(range(6), k=200)]
+
+    plain_log, frozen_log = [], []
+    plain = build_bus(seed, plain_log)
+    frozen = build_bus(seed, frozen_log)
+    frozen.freeze()
+    for bus in (plain, frozen):
+        set_mode(bus, mode)
+        bus.publish_many(events)
+        bus.process(batch_size=batch_size)
+
+    assert frozen_log == plain_log
+    assert frozen.event_count == plain.event_count
+    assert all(isinstance(callbacks, tuple) for callbacks in frozen.immediate_table)
+
+
+@pytest.mark.parametrize('batch_size', [1, 8])
+@pytest.mark.parametrize('mode', ['fast', 'logged', 'metrics'])
+def test_frozen_remove_during_dispatch(batch_size, mode):
+    bus = EventBus(threaded=False, maxsize=0)
+    log = []
+    bus.add_immediate_listener('A', lambda: log.append('first'))
+    bus.add_immediate_listener('A', lambda: (log.append('second'), third.remove()))
+    third = bus.add_immediate_listener('A', lambda: log.append('third'))
+    fourth = bus.add_immediate_listener('A', lambda: log.append('fourth'))
+    bus.freeze()
+    set_mode(bus, mode)
+
+    bus.publish('A')
+    bus.publish('A')
+    bus.process(batch_size=batch_size)
+
+    # 取消订阅立即重建元组，正在分发的旧元组中尚未执行的该监听器也不再被执行
+    assert log == ['first', 'second', 'fourth'] * 2
+    assert len(bus.immediate_table[bus.symbols.lookup('A')]) == 3
+    assert fourth.index == 2
+
+
+def test_frozen_remove_during_parallel_dispatch():
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        bus = EventBus(dispatch_executor=executor)
+        log = []
+        bus.add_immediate_listener('A', lambda: (log.append('first'), second.remove()))
+        second = bus.add_immediate_listener('A', lambda: log.append('second'), independent=True)
+        bus.add_immediate_listener('A', lambda: log.append('third'), independent=True)
+        bus.freeze()
+
+        bus.publish('A')
+        bus.process()
+
+    assert log == ['first', 'third']
+
+
+class Label:
+    def __init__(self, name: str, log: list):
+        self.name = name
+        self.log = log
+
+    def trigger(self):
+        self.log.append(self.name)
+
+
+@pytest.mark.parametrize('batch_size', [1, 8])
+def test_frozen_bound_callbacks(batch_size):
+    bus = EventBus(threaded=False, maxsize=0)
+    bus.event_logger.set_events(False)
+    log = []
+    labels = [Label(f'label{i}', log) for i in range(4)]
+
+    def remove_third(label):
+        label.trigger()
+        subscriptions[2].remove()
+
+    subscriptions = []
+    for label, func in zip(labels, (Label.trigger, remove_third, Label.trigger, Label.trigger)):
+        callback = bus.bind_callback(func, label)
+        callback.__name__ = label.name
+        subscriptions.append(bus.add_immediate_listener('A', callback))
+    bus.freeze()
+
+    # bind_callback()绑定单个实例的回调在分发表中为绑定方法，立即触发表中仍是原回调
+    event_id = bus.symbols.lookup('A')
+    assert all(callback.__class__ is types.MethodType for callback in bus.dispatch_table[event_id])
+    assert bus.immediate_table[event_id] == tuple(subscription.callback for subscription in subscriptions)
+
+    for _ in range(2):
+        bus.publish('A')
+    bus.process(batch_size=batch_size)
+
+    assert log == ['label0', 'label1', 'label3'] * 2
+    assert len(bus.dispatch_table[event_id]) == 3
+
+
+def test_frozen_add_listener():
+    bus = EventBus(threaded=False, maxsize=0)
+    log = []
+
+    def add_during_dispatch():
+        log.append('first')
+        if len(log) == 1:
+            bus.add_immediate_listener('A', lambda: log.append('added'))
+
+    bus.add_immediate_listener('A', add_during_dispatch)
+    bus.freeze()
+    # 冻结后监听新事件的监听器只在新编号上添加空元组，不需要解冻
+    bus.add_immediate_listener('B', lambda: log.append('B'))
+    bus.add_joint_listener(['A', 'B'], lambda: log.append('joint'))
+    assert bus.frozen and isinstance(bus.immediate_table[bus.symbols.lookup('B')], tuple)
+
+    for event in 'AAB':
+        bus.publish(event)
+    bus.process()
+
+    # 分发过程中注册的监听器从下一个事件开始触发
+    assert log == ['first', 'first', 'added', 'B', 'joint']
+
+
+def test_frozen_remove_joint_listener():
+    bus = EventBus(threaded=False, maxsize=0)
+    log = []
+    removed = bus.add_joint_listener(['A', 'B'], lambda: log.append('removed'))
+    bus.add_joint_listener(['A', 'B'], lambda: log.append('kept'))
+    bus.freeze()
+
+    bus.publish('A')
+    bus.process()
+    removed.remove()
+    assert len(bus.joint_table[bus.symbols.lookup('A')]) == 1 and len(bus.joint_conditions) == 1
+
+    bus.publish('B')
+    bus.process()
+    assert log == ['kept']
+
+
+def test_frozen_unknown_event():
+    bus = EventBus(threaded=False, maxsize=0)
+    bus.add_immediate_listener('A', lambda: None)
+    bus.freeze()
+
+    for event in ('X', 'Y', 'A'):
+        bus.publish(event)
+    bus.process()
+
+    # 没有监听器关心的事件不会被分配编号或创建表项
+    assert len(bus.symbols) == 1 and len(bus.immediate_table) == 1
+    assert bus.event_count == 3
@@ -0,0 +1,40 @@
+import time
+
+from api.event.event_engine import EventBus
+
+
+def joint_bus(interned: int) -> EventBus:
+    """先为interned个无关的事件名分配编号，再注册50个都监听A的联合监听器"""
+    bus = EventBus(threaded=False, maxsize=0)
+    bus.event_logger.set_events(False)
+    for index in range(interned):
+        bus._intern(f'unrelated{index}')
+    for index in range(50):
+        bus.add_joint_listener(['A', f'B{index}'], lambda: None)
+    return bus
+
+
+def dispatch_ns(bus: EventBus, events: int = 2000) -> float:
+    best = float('inf')
+    for _ in range(5):
+        for _ in range(events):
+            bus.publish('A')
+        start = time.perf_counter_ns()
+        bus.process(maxStep=events + 1)
+        best = min(best, (time.perf_counter_ns() - start) / events)
+    return best
+
+
+def test_masks_only_cover_required_events():
+    bus = joint_bus(10000)
+    for index, condition in enumerate(bus.joint_conditions):
+        assert condition.required_mask == 0b11
+        assert set(condition.event_bits) == {bus.symbols.lookup('A'), bus.symbols.lookup(f'B{index}')}
+        assert set(condition.event_bits.values()) == {0b01, 0b10}
+
+
+def test_dispatch_cost_does_not_grow_with_symbol_table():
+    small = dispatch_ns(joint_bus(0))
+    large = dispatch_ns(joint_bus(100000))
+    # 位掩码的宽度与符号表大小无关，两者只有计时误差
+    assert large < small * 2, (small, large)
@@ -0,0 +1,88 @@
+import pytest
+
+from api.event.event_engine import EventBus
+from api.event.event_snapshot import EventBusSnapshot
+
+
+def run(events, **window):
+    bus = EventBus(threaded=False, maxsize=0)
+    log = []
+    bus.add_joint_listener(['A', 'B'], lambda: log.append(bus.event_count), **window)
+    for event in events:
+        bus.publish(event)
+        bus.process()
+    return log, bus
+
+
+@pytest.mark.parametrize('events, expected', [
+    ('AXB', [3]),
+    # 窗口包括A本身，A只在A、X、X这3个事件内有效，B到来时已经过期
+    ('AXXB', []),
+    ('AXXAB', [5]),
+    ('BXXA', []),
+])
+def test_event_window_expiry(events, expected):
+    assert run(events, window_events=3)[0] == expected
+
+
+def test_expired_events_release_their_tasks():
+    log, bus = run('AXXXX', window_events=3)
+    assert log == []
+    assert bus.joint_conditions[0].occurred_mask == 0
+    assert len(bus.delayed_tasks) == 0
+
+
+def test_without_window_events_never_expire():
+    assert run('AXXXXXB')[0] == [7]
+
+
+def test_ms_window_expiry():
+    now = [0.0]
+    bus = EventBus(threaded=False, maxsize=0, clock=lambda: now[0])
+    log = []
+    bus.add_joint_listener(['A', 'B'], lambda: log.append(now[0]), window_ms=500)
+
+    bus.publish('A')
+    bus.process()
+    now[0] = 0.6
+    bus.process()
+    bus.publish('B')
+    bus.process()
+    assert log == []
+
+    now[0] = 1.2
+    bus.publish('A')
+    bus.process()
+    now[0] = 1.6
+    bus.publish('B')
+    bus.process()
+    assert log == [1.6]
+
+
+def test_windows_cannot_be_combined():
+    with pytest.raises(ValueError):
+        EventBus(threaded=False).add_joint_listener(['A', 'B'], lambda: None, window_ms=1, window_events=2)
+
+
+def test_remaining_window_survives_snapshot():
+    log = []
+    buses = []
+    for _ in range(2):
+        bus = EventBus(threaded=False, maxsize=0)
+        bus.add_joint_listener(['A', 'B', 'C'], lambda: log.append('joint'), window_events=5)
+        buses.append(bus)
+
+    original, restored = buses
+    for event in 'AXB':
+        original.publish(event)
+    original.process()
+    EventBusSnapshot.restore(restored, EventBusSnapshot.loads(EventBusSnapshot.dumps(EventBusSnapshot.capture(original))))
+
+    # 快照时A的窗口还剩2个事件（包括A在内已经过了A、X、B），C到来时A已经过期
+    for bus in buses:
+        log.clear()
+        for event in 'XXC':
+            bus.publish(event)
+        bus.process()
+        assert log == []
+        assert bus.joint_conditions[0].occurred == {'B', 'C'}
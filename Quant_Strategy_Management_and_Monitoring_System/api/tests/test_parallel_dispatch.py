@@ -0,0 +1,147 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from api.event.event_engine import EventBus
+
+
+NAMES = [f'E{i}' for i in range(6)]
+
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(max_workers=4)
+    yield executor
+    executor.shutdown(wait=True)
+
+
+def build_bus(seed: int, log: list, dispatch_executor=None) -> EventBus:
+    """
+    随机的立即、延迟、联合、模式监听器，约一半的立即触发监听器为independent（只记录，不发布事件），其余回调可能发布新的事件
+    log中记录(<标签>, <事件计数>, <是否为independent>, <线程id>)
+    """
+    rng = random.Random(seed)
+    bus = EventBus(maxsize=0, dispatch_executor=dispatch_executor)
+
+    def make_callback(tag: str, independent: bool, publish: str = None):
+        def callback():
+            if independent:
+                # 让并行执行的监听器交错完成
+                time.sleep(rng_sleep.random() / 2000)
+            log.append((tag, bus.event_count, independent, threading.get_ident()))
+            if publish is not None:
+                bus.publish(publish)
+        return callback
+
+    rng_sleep = random.Random(seed)
+    for i in range(16):
+        kind = rng.choice(('immediate', 'immediate', 'delayed', 'joint', 'pattern'))
+        # 只向编号更大的事件发布，触发图中没有循环
+        source = rng.randrange(len(NAMES) - 1)
+        independent = kind == 'immediate' and rng.random() < 0.5
+        publish = None
+        if kind in ('immediate', 'delayed') and not independent and rng.random() < 0.5:
+            publish = NAMES[rng.randrange(source + 1, len(NAMES))]
+        callback = make_callback(f'{kind}{i}', independent, publish)
+        if kind == 'immediate':
+            bus.add_immediate_listener(NAMES[source], callback, independent=independent)
+        elif kind == 'delayed':
+            bus.add_delayed_listener(NAMES[source], rng.randint(1, 3), callback)
+        elif kind == 'joint':
+            bus.add_joint_listener(rng.sample(NAMES, 2), callback)
+        else:
+            bus.add_pattern_listener([NAMES[source], rng.choice(NAMES + ['*'])], callback)
+    return bus
+
+
+def without_independent(log):
+    return [(tag, count) for tag, count, independent, _ in log if not independent]
+
+
+def by_event(log):
+    """按事件计数分组的标签集合，independent监听器在同一事件内的执行顺序不确定"""
+    events = {}
+    for tag, count, _, _ in log:
+        events.setdefault(count, set()).add(tag)
+    return events
+
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('batch_size', [1, 8])
+def test_parallel_matches_serial(seed, batch_size, executor):
+    events = random.Random(seed + 1000).choices(NAMES, k=100)
+
+    serial_log, parallel_log = [], []
+    serial = build_bus(seed, serial_log)
+    parallel = build_bus(seed, parallel_log, dispatch_executor=executor)
+    serial.publish_many(events)
+    parallel.publish_many(events)
+    assert serial.process(batch_size=batch_size)
+    assert parallel.process(batch_size=batch_size)
+
+    # 非independent监听器的执行顺序与串行分发完全一致，independent监听器在同一事件中执行
+    assert without_independent(parallel_log) == without_independent(serial_log)
+    assert by_event(parallel_log) == by_event(serial_log)
+    assert parallel.event_count == serial.event_count
+
+
+@pytest.mark.parametrize('batch_size', [1, 8])
+def test_only_independent_listeners_leave_dispatch_thread(batch_size, executor):
+    log = []
+    bus = build_bus(3, log, dispatch_executor=executor)
+    bus.publish_many(NAMES * 10)
+    bus.process(batch_size=batch_size)
+
+    dispatch_thread = threading.get_ident()
+    assert any(independent for _, _, independent, _ in log)
+    for tag, _, independent, thread in log:
+        if independent:
+            assert thread != dispatch_thread, tag
+        else:
+            assert thread == dispatch_thread, tag
+
+
+@pytest.mark.parametrize('batch_size', [1, 8])
+def test_barrier_before_later_stages(batch_size, executor):
+    bus = EventBus(maxsize=0, dispatch_executor=executor)
+    finished = []
+    seen = []
+    for i in range(4):
+        bus.add_immediate_listener('A', lambda: (time.sleep(0.01), finished.append(1)), independent=True)
+    # 非independent的立即触发监听器在分发线程中与并行监听器同时执行，联合与模式触发阶段在屏障之后
+    bus.add_immediate_listener('A', lambda: seen.append(('immediate', len(finished))))
+    bus.add_joint_listener(['A', 'B'], lambda: seen.append(('joint', len(finished))))
+    bus.add_pattern_listener(['B', 'A'], lambda: seen.append(('pattern', len(finished))))
+
+    bus.publish('B')
+    bus.publish('A')
+    bus.process(batch_size=batch_size)
+    assert [stage for stage, _ in seen] == ['immediate', 'joint', 'pattern']
+    assert seen[1:] == [('joint', 4), ('pattern', 4)]
+
+
+@pytest.mark.parametrize('batch_size', [1, 8])
+def test_parallel_listener_exception(batch_size, executor):
+    bus = EventBus(maxsize=0, dispatch_executor=executor)
+    log = []
+
+    def fail():
+        raise ValueError('independent listener failed')
+
+    bus.add_immediate_listener('A', fail, independent=True)
+    bus.add_immediate_listener('A', lambda: (time.sleep(0.01), log.append('independent')), independent=True)
+    bus.add_immediate_listener('A', lambda: log.append('serial'))
+    bus.publish('A')
+
+    # 在屏障之后重新抛出，其它监听器已经执行完
+    with pytest.raises(ValueError, match='independent listener failed'):
+        bus.process(batch_size=batch_size)
+    assert sorted(log) == ['independent', 'serial']
+
+
+def test_parallel_dispatch_requires_threaded_bus(executor):
+    with pytest.raises(ValueError):
+        EventBus(threaded=False, dispatch_executor=executor)
@@ -0,0 +1,25 @@
+from api.event.event_engine import EventBus
+from api.event.pattern_automaton import PatternAutomaton
+
+
+def test_overlapping_prefix_matches():
+    # 模式A A B在输入A A A B中：第二个A之后的A既是失败的第三个事件，也是新一次匹配的开始
+    automaton = PatternAutomaton([['A', 'A', 'B']])
+    matched = [automaton.feed(event) for event in ['A', 'A', 'A', 'B']]
+    assert matched == [(), (), (), (0,)]
+
+
+def test_wildcard_and_reset_after_match():
+    automaton = PatternAutomaton([['A', '*', 'B'], ['B']])
+    assert [automaton.feed(event) for event in ['A', 'X', 'B']] == [(), (), (0, 1)]
+    # 触发后重置，之前的部分匹配不会延续
+    assert automaton.feed('B') == (1,)
+
+
+def test_pattern_listener_on_event_bus():
+    bus = EventBus(threaded=False)
+    fired = []
+    bus.add_pattern_listener(['A', 'A', 'B'], lambda: fired.append(bus.event_count))
+    bus.publish_many(['A', 'A', 'A', 'B', 'A', 'B'])
+    bus.process()
+    assert fired == [4]
@@ -0,0 +1,97 @@
+import random
+
+import pytest
+
+from api.event.event_engine import EventBus
+from api.event.event_queue import EventQueue
+
+
+def build_bus(seed: int, log: list, lanes: int = 1) -> EventBus:
+    """
+    随机的立即、延迟、联合、模式监听器，部分回调会发布新的事件
+    :param lanes: 回调发布事件时随机使用的优先级车道数
+    """
+    rng = random.Random(seed)
+    names = [f'E{i}' for i in range(6)]
+    bus = EventBus(threaded=False, maxsize=0)
+
+    def make_callback(tag: str, publish: str = None):
+        priority = rng.randrange(lanes) if lanes > 1 else EventQueue.NORMAL
+
+        def callback():
+            log.append((tag, bus.event_count))
+            if publish is not None:
+                bus.publish(publish, priority=priority)
+        return callback
+
+    for i in range(12):
+        kind = rng.choice(('immediate', 'delayed', 'joint', 'pattern'))
+        # 只有立即与延迟监听器向编号更大的事件发布，触发图中没有循环
+        source = rng.randrange(len(names) - 1)
+        publish = None
+        if kind in ('immediate', 'delayed') and rng.random() < 0.5:
+            publish = names[rng.randrange(source + 1, len(names))]
+        callback = make_callback(f'{kind}{i}', publish)
+        if kind == 'immediate':
+            bus.add_immediate_listener(names[source], callback)
+        elif kind == 'delayed':
+            bus.add_delayed_listener(names[source], rng.randint(1, 3), callback)
+        elif kind == 'joint':
+            bus.add_joint_listener(rng.sample(names, 2), callback)
+        else:
+            bus.add_pattern_listener([names[source], rng.choice(names + ['*'])], callback)
+    return bus
+
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('batch_size', [2, 8, 64])
+def test_batch_matches_single_step(seed, batch_size):
+    events = [f'E{i}' for i in random.Random(seed + 1000).choices(range(6), k=200)]
+
+    single_log, batch_log = [], []
+    single = build_bus(seed, single_log)
+    batch = build_bus(seed, batch_log)
+    single.publish_many(events)
+    batch.publish_many(events)
+    single.process(batch_size=1)
+    batch.process(batch_size=batch_size)
+
+    assert batch_log == single_log
+    assert batch.event_count == single.event_count
+
+
+@pytest.fixture
+def starvation_limit():
+    previous = EventQueue.starvation_limit
+    yield
+    EventQueue.starvation_limit = previous
+
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('limit', [0, 1, 3, 64])
+def test_batch_matches_single_step_across_lanes(seed, limit, starvation_limit):
+    EventQueue.starvation_limit = limit
+    rng = random.Random(seed + 2000)
+    events = [(f'E{rng.randrange(6)}', rng.randrange(len(EventQueue.LANE_NAMES))) for _ in range(150)]
+
+    single_log, batch_log = [], []
+    single = build_bus(seed, single_log, lanes=len(EventQueue.LANE_NAMES))
+    batch = build_bus(seed, batch_log, lanes=len(EventQueue.LANE_NAMES))
+    for event, priority in events:
+        single.publish(event, priority=priority)
+        batch.publish(event, priority=priority)
+    single.process(batch_size=1)
+    batch.process(batch_size=rng.choice([2, 8, 64]))
+
+    assert batch_log == single_log
+    assert batch.event_count == single.event_count
+
+
+@pytest.mark.parametrize('priority', [-1, 4, 'high', None])
+def test_publish_rejects_unknown_priority(priority):
+    bus = EventBus(threaded=False)
+    with pytest.raises(ValueError, match='unknown priority'):
+        bus.publish('E0', priority=priority)
+    with pytest.raises(ValueError, match='unknown priority'):
+        bus.publish_many(['E0'], priority=priority)
+    assert bus.event_bus.empty()
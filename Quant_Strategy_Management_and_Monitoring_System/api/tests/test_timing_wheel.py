@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+from api.event.timing_wheel import TimingWheel
+
+
+def fire_all(wheel: TimingWheel, until: int, step: int):
+    """按step推进到until，返回[(<触发时刻>, <任务>), ...]"""
+    fired = []
+    now = wheel.now
+    while now < until:
+        now = min(until, now + step)
+        fired.extend((now, handle.callback) for handle in wheel.advance(now))
+    return fired
+
+
+@pytest.mark.parametrize('step', [1, 7, 64])
+def test_random_deadlines_fire_in_order(step):
+    rng = random.Random(7)
+    # 较小的时间轮，使任务分布在多层与overflow中
+    wheel = TimingWheel(slot_bits=2, levels=3)
+    deadlines = [rng.randint(1, 500) for _ in range(300)]
+    for seq, deadline in enumerate(deadlines):
+        wheel.schedule(deadline, (deadline, seq))
+
+    fired = fire_all(wheel, 600, step)
+    expected = sorted((deadline, seq) for seq, deadline in enumerate(deadlines))
+    assert [task for _, task in fired] == expected
+    # 每个任务都在到期后的第一次推进中触发
+    assert all(at - step < task[0] <= at for at, task in fired)
+    assert len(wheel) == 0
+
+
+def test_large_steps_keep_deadline_and_insertion_order():
+    wheel = TimingWheel()
+    for seq, deadline in enumerate([5000, 10, 10, 70000, 4096, 10]):
+        wheel.schedule(deadline, seq)
+    # 一次推进很远时按(<到期时间>, <添加顺序>)返回
+    assert [handle.callback for handle in wheel.advance(100000)] == [1, 2, 5, 4, 0, 3]
+
+
+def test_cancel():
+    wheel = TimingWheel(slot_bits=2, levels=2)
+    handles = [wheel.schedule(deadline, deadline) for deadline in (3, 20, 40, 100)]
+    assert handles[1].cancel()
+    assert not handles[1].cancel()
+    assert len(wheel) == 3
+
+    fired = [handle.callback for handle in wheel.advance(50)]
+    assert fired == [3, 40]
+    # 已触发的任务不能取消
+    assert not handles[0].pending and not handles[0].cancel()
+
+    assert handles[3].cancel()
+    assert wheel.advance(200) == []
+    assert len(wheel) == 0 and wheel.next_expiry() is None
+
+
+def test_deadline_in_past_fires_on_next_advance():
+    wheel = TimingWheel(start=100)
+    wheel.schedule(50, 'late')
+    assert [handle.callback for handle in wheel.advance(100)] == ['late']
+
+
+def test_next_expiry_is_not_after_earliest_deadline():
+    wheel = TimingWheel(slot_bits=2, levels=3)
+    wheel.schedule(37, 'a')
+    expiry = wheel.next_expiry()
+    assert expiry is not None and expiry <= 37
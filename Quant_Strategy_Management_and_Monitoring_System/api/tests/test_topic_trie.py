@@ -0,0 +1,199 @@
+import pytest
+
+from api.event.event_engine import EventBus
+from api.event.topic_trie import TopicTrie
+
+
+def build_trie(*patterns):
+    trie = TopicTrie()
+    for pattern in patterns:
+        trie.add(pattern, pattern)
+    return trie
+
+
+@pytest.mark.parametrize('topic, matched', [
+    ('fill.AAPL.buy', True),
+    ('fill.MSFT.buy', True),
+    ('fill.buy', False),
+    ('fill.AAPL.US.buy', False),
+    ('fill.AAPL.sell', False),
+])
+def test_star_matches_exactly_one_segment(topic, matched):
+    trie = build_trie('fill.*.buy')
+    assert trie.match(topic) == (['fill.*.buy'] if matched else [])
+
+
+def test_trailing_star():
+    trie = build_trie('fill.*')
+    assert trie.match('fill.AAPL') == ['fill.*']
+    assert trie.match('fill') == []
+    assert trie.match('fill.AAPL.buy') == []
+
+
+@pytest.mark.parametrize('topic, matched', [
+    ('fill', True),
+    ('fill.AAPL', True),
+    ('fill.AAPL.buy', True),
+    ('order.AAPL', False),
+    ('filled', False),
+])
+def test_trailing_hash_matches_zero_or_more_segments(topic, matched):
+    trie = build_trie('fill.#')
+    assert trie.match(topic) == (['fill.#'] if matched else [])
+
+
+@pytest.mark.parametrize('topic, matched', [
+    ('fill.buy', True),
+    ('fill.AAPL.buy', True),
+    ('fill.AAPL.US.buy', True),
+    ('fill.buy.buy', True),
+    ('fill', False),
+    ('fill.AAPL', False),
+    ('fill.buy.AAPL', False),
+])
+def test_middle_hash(topic, matched):
+    trie = build_trie('fill.#.buy')
+    assert trie.match(topic) == (['fill.#.buy'] if matched else [])
+
+
+def test_leading_and_lone_hash():
+    trie = build_trie('#', '#.buy')
+    assert trie.match('buy') == ['#', '#.buy']
+    assert trie.match('fill.AAPL.buy') == ['#', '#.buy']
+    assert trie.match('fill.AAPL') == ['#']
+
+
+def test_exact_and_wildcard_overlap_in_subscription_order():
+    trie = build_trie('fill.#', 'fill.AAPL.buy', 'fill.*.buy', '#', 'fill.AAPL.*', 'fill.MSFT.buy')
+    assert trie.match('fill.AAPL.buy') == ['fill.#', 'fill.AAPL.buy', 'fill.*.buy', '#', 'fill.AAPL.*']
+
+
+def test_subscription_reached_by_several_paths_matches_once():
+    trie = build_trie('a.#.#', 'a.#.*.#')
+    assert trie.match('a.b.c') == ['a.#.#', 'a.#.*.#']
+    assert trie.match('a') == ['a.#.#']
+
+
+def test_same_pattern_twice():
+    trie = TopicTrie()
+    trie.add('a.*', 'first')
+    trie.add('a.*', 'second')
+    assert trie.match('a.b') == ['first', 'second']
+    assert len(trie) == 2
+
+
+def test_remove():
+    trie = TopicTrie()
+    first = trie.add('fill.*.buy', 'first')
+    second = trie.add('fill.*.buy', 'second')
+    exact = trie.add('fill.AAPL.buy', 'exact')
+
+    assert trie.remove('fill.*.buy', first)
+    assert trie.match('fill.AAPL.buy') == ['second', 'exact']
+    assert not trie.remove('fill.*.buy', first)
+    # 序号与订阅不对应
+    assert not trie.remove('fill.AAPL.buy', second)
+    assert not trie.remove('order.*', second)
+    assert len(trie) == 2
+
+    assert trie.remove('fill.*.buy', second)
+    assert trie.remove('fill.AAPL.buy', exact)
+    assert trie.match('fill.AAPL.buy') == []
+    # 变空的节点被删除
+    assert len(trie) == 0 and trie.root.children == {}
+
+
+def test_remove_keeps_shared_prefix():
+    trie = TopicTrie()
+    short = trie.add('fill', 'short')
+    trie.add('fill.AAPL', 'long')
+    assert trie.remove('fill', short)
+    assert trie.match('fill.AAPL') == ['long']
+    assert trie.match('fill') == []
+
+
+@pytest.mark.parametrize('topic', ['', 'fill..buy', '.fill', 'fill.'])
+def test_invalid_topic(topic):
+    with pytest.raises(ValueError):
+        TopicTrie().add(topic, topic)
+    with pytest.raises(ValueError):
+        EventBus(threaded=False, maxsize=0).add_topic_listener(topic, lambda: None)
+
+
+def test_topic_listeners():
+    bus = EventBus(threaded=False, maxsize=0)
+    log = []
+    bus.add_immediate_listener('fill.AAPL.buy', lambda: log.append('immediate'))
+    bus.add_topic_listener('fill.#', lambda: log.append('prefix'))
+    bus.add_topic_listener('fill.*.buy', lambda: log.append('buy'))
+    bus.add_topic_listener('fill.*.buy', lambda payload: log.append(payload), with_payload=True)
+
+    bus.publish('fill.AAPL.buy', payload=100)
+    bus.publish('fill.AAPL.sell')
+    bus.publish('order.AAPL.buy')
+    bus.process()
+    # 在监听该事件名的立即触发监听器之后，按注册顺序执行
+    assert log == ['immediate', 'prefix', 'buy', 100, 'prefix']
+
+
+def test_topic_cache_invalidated_on_subscribe():
+    bus = EventBus(threaded=False, maxsize=0)
+    log = []
+    bus.add_topic_listener('fill.#', lambda: log.append('prefix'))
+    bus.publish('fill.AAPL.buy')
+    bus.process()
+    assert set(bus.topic_cache) == {'fill.AAPL.buy'}
+
+    bus.add_topic_listener('fill.*.buy', lambda: log.append('buy'))
+    assert bus.topic_cache == {}
+    bus.publish('fill.AAPL.buy')
+    bus.process()
+    assert log == ['prefix', 'prefix', 'buy']
+
+
+def test_topic_cache_invalidated_on_unsubscribe():
+    bus = EventBus(threaded=False, maxsize=0)
+    log = []
+    prefix = bus.add_topic_listener('fill.#', lambda: log.append('prefix'))
+    buy = bus.add_topic_listener('fill.*.buy', lambda: log.append('buy'))
+    bus.publish('fill.AAPL.buy')
+    bus.process()
+    assert bus.topic_cache
+
+    assert prefix.remove()
+    assert bus.topic_cache == {}
+    bus.publish('fill.AAPL.buy')
+    bus.process()
+    assert log == ['prefix', 'buy', 'buy']
+
+    # 最后一个主题监听器被移除后不再进行主题匹配
+    assert buy.remove()
+    assert not buy.remove()
+    assert bus.topic_trie is None
+    bus.publish('fill.AAPL.buy')
+    bus.process()
+    assert log == ['prefix', 'buy', 'buy'] and bus.topic_cache == {}
+
+
+def test_remove_during_dispatch():
+    bus = EventBus(threaded=False, maxsize=0)
+    log = []
+    bus.add_topic_listener('fill.#', lambda: (log.append('prefix'), buy.remove()))
+    buy = bus.add_topic_listener('fill.*.buy', lambda: log.append('buy'))
+    bus.publish('fill.AAPL.buy')
+    bus.publish('fill.AAPL.buy')
+    bus.process()
+    # 缓存的元组中尚未执行的订阅不再被执行
+    assert log == ['prefix', 'prefix']
+
+
+def test_topic_cache_flushed_at_limit(monkeypatch):
+    monkeypatch.setattr(EventBus, 'topic_cache_size', 2)
+    bus = EventBus(threaded=False, maxsize=0)
+    log = []
+    bus.add_topic_listener('fill.*', lambda: log.append('fill'))
+    for event in ('fill.a', 'fill.b', 'fill.c', 'fill.a'):
+        bus.publish(event)
+    bus.process()
+    assert log == ['fill'] * 4
+    assert set(bus.topic_cache) == {'fill.c', 'fill.a'}
@@ -0,0 +1,69 @@
+import pytest
+
+from api.event.event_engine import EventBus
+
+
+@pytest.mark.parametrize('batch_size', [1, 8])
+def test_remove_during_dispatch(batch_size):
+    bus = EventBus(threaded=False, maxsize=0)
+    log = []
+    bus.add_immediate_listener('A', lambda: log.append('first'))
+    bus.add_immediate_listener('A', lambda: (log.append('second'), third.remove()))
+    third = bus.add_immediate_listener('A', lambda: log.append('third'))
+    bus.add_immediate_listener('A', lambda: log.append('fourth'))
+
+    bus.publish('A')
+    bus.publish('A')
+    bus.process(batch_size=batch_size)
+
+    # 同一事件中排在后面、尚未执行的监听器不再被执行，之后的事件也不会
+    assert log == ['first', 'second', 'fourth'] * 2
+    assert not third.remove()
+
+
+def test_remove_cancels_pending_tasks_and_conditions():
+    now = [0.0]
+    bus = EventBus(threaded=False, maxsize=0, clock=lambda: now[0])
+    log = []
+    delayed = bus.add_delayed_listener('A', 3, lambda: log.append('delayed'))
+    timed = bus.add_timed_listener('A', 100, lambda: log.append('timed'))
+    joint = bus.add_joint_listener(['A', 'B'], lambda: log.append('joint'))
+    pattern = bus.add_pattern_listener(['A', 'B'], lambda: log.append('pattern'))
+    bus.add_pattern_listener(['A', '*', 'C'], lambda: log.append('kept'))
+
+    bus.publish('A')
+    bus.process()
+    assert len(bus.delayed_tasks) == 1 and len(bus.timed_tasks) == 1
+
+    for subscription in (delayed, timed, joint, pattern):
+        assert subscription.remove()
+    assert len(bus.delayed_tasks) == 0 and len(bus.timed_tasks) == 0
+
+    now[0] = 1.0
+    for event in 'BCDD':
+        bus.publish(event)
+    bus.process()
+    # 其它模式进行中的部分匹配保留
+    assert log == ['kept']
+    assert not bus.joint_conditions and len(bus.pattern_matchers) == 1
+
+
+def test_remove_other_listeners_from_callback_in_batch():
+    bus = EventBus(threaded=False, maxsize=0)
+    log = []
+    subscriptions = [bus.add_immediate_listener('E', lambda index=index: log.append(index)) for index in range(6)]
+
+    def remove_tail():
+        for subscription in subscriptions[3:]:
+            subscription.remove()
+
+    bus.add_immediate_listener('E', remove_tail)
+    for _ in range(3):
+        bus.publish('E')
+    bus.process(batch_size=8)
+
+    assert log == list(range(6)) + list(range(3)) * 2
+    # 下一轮处理开始时压缩监听器表，订阅句柄的位置随之更新
+    bus.publish('E')
+    bus.process()
+    assert [subscription.index for subscription in bus.immediate_subscriptions[bus.symbols.lookup('E')]] == [0, 1, 2, 3]
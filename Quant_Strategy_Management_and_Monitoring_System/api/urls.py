@@ -3,6 +3,9 @@ from rest_framework.routers import DefaultRouter
 from .views import *
 from rest_framework.authtoken.views import obtain_auth_token
 
+from .views.event_metrics_view import EventMetricsView
+from .views.event_scheduler_view import EventSchedulerView
+from .views.event_snapshot_view import EventSnapshotView
 from .views.label_trigger_view import LabelTriggerView
 from .views.start_eventbus_engine import StartEventBusEngine
 from .views.user_character_view import UserCharactersView
@@ -17,5 +20,8 @@ urlpatterns = [
     path('start-event-engine',StartEventBusEngine.as_view(),name='start-event-engine'),
     path('user-characters', UserCharactersView.as_view(), name="user-characters"),
     path('label-trigger',LabelTriggerView.as_view(),name='label-trigger'),
+    path('event-metrics', EventMetricsView.as_view(), name='event-metrics'),
+    path('event-snapshot', EventSnapshotView.as_view(), name='event-snapshot'),
+    path('event-scheduler', EventSchedulerView.as_view(), name='event-scheduler'),
 
 ]
\ No newline at end of file
@@ -0,0 +1,30 @@
+from rest_framework import status, permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from api.event.eventbus_object_pool import EventBusObjectPool
+from api.event.eventbus_shard import EventBusShardRouter
+
+
+class EventMetricsView(APIView):
+    """
+    拉取当前用户事件引擎的指标快照：每个事件、每个触发器、每种监听器类型的调用次数与耗时分布，以及队列深度和延迟任务数量
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        user_id = self.request.user.id
+        if EventBusShardRouter.enabled():
+            return EventBusShardRouter.forward(user_id, 'event-metrics')
+        return EventMetricsView.metrics(user_id)
+
+    @staticmethod
+    def metrics(user_id):
+        if not EventBusObjectPool.exist(user_id):
+            return Response({"eventbus error": "you must GET /api/start-event-engine first"}, status=status.HTTP_400_BAD_REQUEST)
+
+        eventbus = EventBusObjectPool.get_for_user(user_id)
+        if eventbus.metrics is None:
+            return Response({"metrics error": "metrics are disabled, set EVENTBUS_METRICS = True in settings"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({"user_id": user_id, "metrics": eventbus.metrics.snapshot(eventbus)}, status=status.HTTP_200_OK)
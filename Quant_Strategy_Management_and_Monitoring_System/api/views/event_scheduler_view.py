@@ -0,0 +1,36 @@
+from rest_framework import status, permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from api.event.eventbus_object_pool import EventBusObjectPool
+from api.event.eventbus_shard import EventBusShardRouter
+
+
+class EventSchedulerView(APIView):
+    """
+    拉取'scheduler'模式下事件引擎的用量：步数、占用时间、时间片数、任务数、被配额限制的次数以及当前配额窗口内的用量，
+    管理员可以查看所有用户（分片模式下为管理员所在分片上的所有用户）
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        user_id = self.request.user.id
+        is_staff = self.request.user.is_staff
+        if EventBusShardRouter.enabled():
+            return EventBusShardRouter.forward(user_id, 'event-scheduler', {'is_staff': is_staff})
+        return EventSchedulerView.usage(user_id, is_staff)
+
+    @staticmethod
+    def usage(user_id, is_staff:bool = False):
+        scheduler = EventBusObjectPool.scheduler
+        if EventBusObjectPool.engine_mode != EventBusObjectPool.SCHEDULER or scheduler is None:
+            return Response({"scheduler error": "scheduler is not running, set EVENTBUS_ENGINE_MODE = 'scheduler' in settings "
+                                                "and GET /api/start-event-engine first"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if is_staff:
+            return Response({"tenants": scheduler.usage()}, status=status.HTTP_200_OK)
+
+        usage = scheduler.usage(user_id)
+        if not usage:
+            return Response({"eventbus error": "you must GET /api/start-event-engine first"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"user_id": user_id, "usage": usage[str(user_id)]}, status=status.HTTP_200_OK)
@@ -0,0 +1,47 @@
+from loguru import logger
+from rest_framework import status, permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from api.event.eventbus_object_pool import EventBusObjectPool
+from api.event.eventbus_shard import EventBusShardRouter
+from labels.models.label_trigger_manager import LabelTriggerManager
+
+
+class EventSnapshotView(APIView):
+    """
+    保存当前用户事件引擎的快照，之后GET /api/start-event-engine（如服务重启后）会从快照恢复，保留进行中的触发条件
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        user_id = self.request.user.id
+        if EventBusShardRouter.enabled():
+            return EventBusShardRouter.forward(user_id, 'event-snapshot')
+        return EventSnapshotView.snapshot(user_id)
+
+    @staticmethod
+    def snapshot(user_id):
+        snapshot_path = EventBusObjectPool.snapshot_path(user_id)
+        if snapshot_path is None:
+            return Response({"snapshot error": "snapshots are disabled, set EVENTBUS_SNAPSHOT_DIR in settings"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not EventBusObjectPool.exist(user_id):
+            return Response({"eventbus error": "you must GET /api/start-event-engine first"}, status=status.HTTP_400_BAD_REQUEST)
+
+        eventbus = EventBusObjectPool.get_for_user(user_id)
+        if not eventbus.is_install:
+            return Response({"eventbus error": "you must GET /api/start-event-engine first"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            worker = EventBusObjectPool.get_worker(user_id)
+            if worker is not None:
+                # WORKER与SCHEDULER模式下在后台线程中保存，避免与事件处理同时读写事件总线
+                size = worker.submit(lambda: LabelTriggerManager.snapshot_eventbus(eventbus, snapshot_path)).result()
+            else:
+                size = LabelTriggerManager.snapshot_eventbus(eventbus, snapshot_path)
+        except OSError as e:
+            logger.exception(e)
+            return Response({"snapshot error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({"user_id": user_id, "event_count": eventbus.event_count, "size": size}, status=status.HTTP_200_OK)
@@ -1,17 +1,28 @@
+import inspect
 import uuid
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
+from asgiref.sync import async_to_sync
 from loguru import logger
 from rest_framework import status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from api.event.async_event_engine import AsyncEventBus
 from api.event.eventbus_object_pool import EventBusObjectPool
+from api.event.eventbus_shard import EventBusShardRouter
+from api.event.eventbus_worker import EventBusWorker
 from api.models.instance_hash_table.instance_hash_table import InstanceHashTable
 from labels.models.base_label import BaseLabel
 from labels.models.label_trigger_manager import LabelTriggerManager
 
 
 class LabelTriggerView(APIView):
+    """
+    调用标签触发器\n
+    WORKER与SCHEDULER模式（settings.EVENTBUS_ENGINE_MODE）下只向用户事件总线的后台线程提交任务并返回202，
+    带wait=true参数时等待触发器与之后的事件处理结束（最多EVENTBUS_WORKER_WAIT_TIMEOUT秒）
+    """
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
@@ -20,6 +31,12 @@ class LabelTriggerView(APIView):
         query_paras = self.request.query_params.dict()
         logger.debug(query_paras)
 
+        if EventBusShardRouter.enabled():
+            return EventBusShardRouter.forward(user_id, 'label-trigger', query_paras)
+        return LabelTriggerView.trigger(user_id, query_paras)
+
+    @staticmethod
+    def trigger(user_id, query_paras:dict):
         if 'label_uuid' not in query_paras or 'trigger' not in query_paras:
             return Response({"parameter require: 'label_uuid' and 'trigger'"}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -38,19 +55,45 @@ class LabelTriggerView(APIView):
         if label_instance is None or not isinstance(label_instance, BaseLabel):
             return Response({"uuid error": f"cannot find a label using your uuid {label_uuid}"}, status=status.HTTP_400_BAD_REQUEST)
 
+        worker = EventBusObjectPool.get_worker(user_id)
+        if worker is not None:
+            return LabelTriggerView.__submit(worker, eventbus, label_instance, f'trigger_{trigger}',
+                                             wait=query_paras.get('wait') == 'true', user_id=user_id, label_uuid=label_uuid)
+
         try:
-            if trigger == '0':
-                LabelTriggerManager.call(label_instance,'trigger_0')
-            if trigger == '1':
-                LabelTriggerManager.call(label_instance,'trigger_1')
-            eventbus.process()
+            if isinstance(eventbus, AsyncEventBus):
+                async_to_sync(LabelTriggerView.__call_async)(eventbus, label_instance, f'trigger_{trigger}')
+            else:
+                if trigger == '0':
+                    LabelTriggerManager.call(label_instance,'trigger_0',eventbus)
+                if trigger == '1':
+                    LabelTriggerManager.call(label_instance,'trigger_1',eventbus)
+                eventbus.process()
             return Response({"user_id":user_id, "label_uid":label_uuid, "message": "label successfully trigger"}, status=status.HTTP_200_OK)
         except Exception as e:
             logger.exception(e)
             return Response({"trigger error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    @staticmethod
+    def __submit(worker:EventBusWorker, eventbus, label_instance:BaseLabel, action:str, wait:bool, user_id, label_uuid):
+        future = worker.submit(lambda: LabelTriggerManager.call(label_instance, action, eventbus))
+        if not wait:
+            return Response({"user_id":user_id, "label_uid":label_uuid, "message": "label trigger queued"}, status=status.HTTP_202_ACCEPTED)
 
-
-
-
-
+        try:
+            future.result(timeout=EventBusWorker.wait_timeout)
+        except FutureTimeoutError:
+            return Response({"user_id":user_id, "label_uid":label_uuid,
+                             "message": f"label trigger is still processing after {EventBusWorker.wait_timeout}s"},
+                            status=status.HTTP_202_ACCEPTED)
+        except Exception as e:
+            logger.exception(e)
+            return Response({"trigger error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"user_id":user_id, "label_uid":label_uuid, "message": "label successfully trigger"}, status=status.HTTP_200_OK)
+
+    @staticmethod
+    async def __call_async(eventbus:AsyncEventBus, label_instance:BaseLabel, action:str):
+        result = LabelTriggerManager.call(label_instance, action, eventbus)
+        if inspect.isawaitable(result):
+            await result
+        await eventbus.process()
@@ -8,6 +8,7 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from api.event.eventbus_object_pool import EventBusObjectPool
+from api.event.eventbus_shard import EventBusShardRouter
 from characters.models.base_character import BaseCharacter
 from containers.models.base_container import BaseContainer
 from labels.models.base_label import BaseLabel
@@ -19,16 +20,28 @@ class StartEventBusEngine(APIView):
 
     def get(self, request):
         user_id = self.request.user.id
+        # 分片模式下由用户所在的分片进程安装事件总线
+        if EventBusShardRouter.enabled():
+            return EventBusShardRouter.forward(user_id, 'start-event-engine')
+        return self.start(user_id)
+
+    def start(self, user_id):
         user = User.objects.get(id=user_id)
         try:
             eventbus = EventBusObjectPool.get_for_user(user_id)
 
-            for character_instance in self.__get_all_characters_from_user(user):
-                for container_instance in self.__get_all_containers_from_character(character_instance):
-                    for label_instance in self.__get_all_label_from_container(container_instance):
-                        LabelTriggerManager.install_instance(label_instance)
+            # 优先从快照恢复，快照不存在或已失效时再遍历用户的所有标签
+            snapshot_path = EventBusObjectPool.snapshot_path(user_id)
+            if snapshot_path is not None and LabelTriggerManager.restore_eventbus(eventbus, snapshot_path):
+                EventBusObjectPool.start_worker(user_id)
+                return Response({"message":f'event engine of user id {user_id} restored from snapshot'}, status=status.HTTP_200_OK)
+
+            for label_instance in self.get_all_labels_from_user(user):
+                LabelTriggerManager.install_instance(label_instance)
 
             LabelTriggerManager.install_to_eventbus(eventbus)
+            # WORKER与SCHEDULER模式下安装完成后由后台线程持续处理该用户的事件
+            EventBusObjectPool.start_worker(user_id)
 
 
             return Response({"message":f'event engine of user id {user_id} started'}, status=status.HTTP_200_OK)
@@ -36,6 +49,16 @@ class StartEventBusEngine(APIView):
             logger.exception(e)
             return Response({'error': traceback.format_exc()}, status=status.HTTP_400_BAD_REQUEST)
 
+    def get_all_labels_from_user(self,user:User):
+        """
+        用户所有角色的所有容器中的标签实例
+        """
+        label_list = []
+        for character_instance in self.__get_all_characters_from_user(user):
+            for container_instance in self.__get_all_containers_from_character(character_instance):
+                label_list.extend(self.__get_all_label_from_container(container_instance))
+        return label_list
+
     def __get_all_characters_from_user(self,user:User):
         character_list = []
         for user_field in user._meta.get_fields():
@@ -0,0 +1,94 @@
+"""
+EventBus逐个处理与批量处理的吞吐量对比
+
+用法（在manage.py所在目录下运行）:
+    python -m benchmarks.bench_event_batch --events 50000 --batch-size 256
+"""
+import argparse
+import random
+import time
+
+from loguru import logger
+
+from api.event.event_engine import EventBus
+from api.event.event_logger import EventLogger
+from api.event.event_metrics import EventBusMetrics
+
+
+def build_bus(event_names, listeners_per_event: int, seed: int, threaded: bool, metrics: bool = False):
+    """构造一个带有立即、延迟、联合、模式监听器的事件总线"""
+    rng = random.Random(seed)
+    bus = EventBus(threaded=threaded, maxsize=0)
+    if metrics:
+        bus.enable_metrics(EventBusMetrics())
+    counter = [0]
+
+    def callback():
+        counter[0] += 1
+
+    for name in event_names:
+        for i in range(listeners_per_event):
+            bus.add_immediate_listener(name, callback)
+        bus.add_delayed_listener(name, rng.randint(1, 8), callback)
+        bus.add_joint_listener(rng.sample(event_names, 2), callback)
+        bus.add_pattern_listener([name, '*', rng.choice(event_names)], callback)
+
+    bus.compile_patterns()
+    return bus, counter
+
+
+def run(mode: str, events, event_names, listeners_per_event: int, batch_size: int, seed: int, threaded: bool,
+        metrics: bool = False):
+    bus, counter = build_bus(event_names, listeners_per_event, seed, threaded, metrics)
+
+    start = time.perf_counter()
+    if mode == 'single':
+        for event in events:
+            bus.publish(event)
+        while not bus.process_one_step():
+            pass
+    else:
+        bus.publish_many(events)
+        while not bus.process_batch(batch_size):
+            pass
+    elapsed = time.perf_counter() - start
+
+    return elapsed, counter[0], bus.event_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=50000)
+    parser.add_argument('--event-names', type=int, default=50)
+    parser.add_argument('--listeners', type=int, default=4, help='每个事件名的立即触发监听器数量')
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--single-threaded', action='store_true', help='使用不加锁的deque事件队列')
+    parser.add_argument('--metrics', action='store_true', help='挂载EventBusMetrics以测量指标收集的开销')
+    parser.add_argument('--with-logging', action='store_true', help='保留loguru默认输出与逐事件日志（默认关闭以测量引擎本身）')
+    args = parser.parse_args()
+
+    if not args.with_logging:
+        logger.remove()
+        EventLogger.configure(level='WARNING')
+
+    rng = random.Random(args.seed)
+    event_names = [f'event_{i}' for i in range(args.event_names)]
+    events = [rng.choice(event_names) for _ in range(args.events)]
+
+    results = {}
+    for mode in ('single', 'batch'):
+        elapsed, triggered, processed = run(
+            mode, events, event_names, args.listeners, args.batch_size, args.seed, not args.single_threaded, args.metrics
+        )
+        results[mode] = (elapsed, triggered, processed)
+        print(f"{mode:>6}: {processed} events, {triggered} callbacks, "
+              f"{elapsed:.3f}s, {processed / elapsed:,.0f} events/s")
+
+    # 两种模式的回调次数必须一致
+    assert results['single'][1] == results['batch'][1], 'batch mode is not equivalent to single step mode'
+    print(f"speedup: {results['single'][0] / results['batch'][0]:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
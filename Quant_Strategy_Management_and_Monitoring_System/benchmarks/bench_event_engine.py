@@ -0,0 +1,401 @@
+"""
+事件引擎基准测试套件：各监听器类型的吞吐量（events/s）与单个事件处理耗时的p50/p99，结果输出为JSON，便于比较不同版本
+
+场景:
+    immediate       立即触发监听器数量从10到100k
+    delayed         延迟触发监听器数量从10到10k
+    joint           联合触发的事件集合大小
+    pattern         模式长度
+    delayed_backlog 时间轮中等待触发的延迟任务数量
+    topic           含'*'/'#'的主题监听器数量从10到100k
+    install         使用合成标签类的LabelTriggerManager.install_to_eventbus() + 触发请求（call() + process()）完整路径
+
+用法（在manage.py所在目录下运行）:
+    python -m benchmarks.bench_event_engine --output bench.json
+    python -m benchmarks.bench_event_engine --quick --scenario immediate joint
+    python -m benchmarks.bench_event_engine --compare old.json new.json
+    python -m benchmarks.bench_event_engine --freeze --output frozen.json   # 与未冻结的结果比较，见EventBus.freeze()
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+from time import perf_counter_ns
+from typing import Callable, Dict, List
+
+from loguru import logger
+
+
+SCENARIOS = ('immediate', 'delayed', 'joint', 'pattern', 'delayed_backlog', 'topic', 'install')
+
+#{<场景>: (<完整参数>, <--quick参数>)}
+SWEEPS = {
+    'immediate': ([10, 100, 1000, 10000, 100000], [10, 1000, 100000]),
+    'delayed': ([10, 100, 1000, 10000], [10, 1000]),
+    'joint': ([2, 4, 8, 16, 64], [2, 16]),
+    'pattern': ([2, 4, 8, 16], [2, 8]),
+    'delayed_backlog': ([0, 1000, 10000, 100000], [0, 100000]),
+    'topic': ([10, 100, 1000, 10000, 100000], [10, 1000, 100000]),
+    'install': ([10, 100, 1000], [10, 100]),
+}
+
+
+def setup_django():
+    """install场景需要标签模型，其它场景只依赖api.event"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Quant_Strategy_Management_and_Monitoring_System.settings')
+    import django
+    django.setup()
+
+
+def percentile(sorted_values: List[int], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def measure(bus, events: List[str], counter: List[int], args) -> Dict:
+    """逐个处理events并记录每个事件的处理耗时，args.freeze为True时先冻结事件总线"""
+    if args.freeze:
+        bus.freeze()
+    bus.publish_many(events)
+    latencies = []
+    process_one_step = bus.process_one_step
+
+    start = perf_counter_ns()
+    for _ in range(len(events)):
+        event_start = perf_counter_ns()
+        process_one_step()
+        latencies.append(perf_counter_ns() - event_start)
+    elapsed_ns = perf_counter_ns() - start
+
+    latencies.sort()
+    return {
+        'events': len(events),
+        'callbacks': counter[0],
+        'events_per_s': len(events) / (elapsed_ns / 1e9),
+        'p50_us': percentile(latencies, 0.5) / 1e3,
+        'p99_us': percentile(latencies, 0.99) / 1e3,
+    }
+
+
+def new_bus():
+    from api.event.event_engine import EventBus
+    return EventBus(threaded=False, maxsize=0)
+
+
+def new_counter():
+    counter = [0]
+
+    def callback():
+        counter[0] += 1
+    return counter, callback
+
+
+def bench_immediate(listeners: int, args, rng: random.Random) -> Dict:
+    """listeners个立即触发监听器平均分布在至多1000个事件名上"""
+    bus = new_bus()
+    counter, callback = new_counter()
+    names = [f'event_{i}' for i in range(min(listeners, 1000))]
+    for i in range(listeners):
+        bus.add_immediate_listener(names[i % len(names)], callback)
+
+    fan_out = listeners // len(names)
+    events = [rng.choice(names) for _ in range(max(500, args.events // fan_out))]
+    return {'listener_type': 'IMMEDIATE', 'listeners': listeners, 'fan_out': fan_out, **measure(bus, events, counter, args)}
+
+
+def bench_delayed(listeners: int, args, rng: random.Random) -> Dict:
+    """listeners个延迟1到16个事件的延迟触发监听器平均分布在至多1000个事件名上"""
+    bus = new_bus()
+    counter, callback = new_counter()
+    names = [f'event_{i}' for i in range(min(listeners, 1000))]
+    for i in range(listeners):
+        bus.add_delayed_listener(names[i % len(names)], rng.randint(1, 16), callback)
+
+    fan_out = listeners // len(names)
+    events = [rng.choice(names) for _ in range(max(500, args.events // fan_out))]
+    return {'listener_type': 'DELAY', 'listeners': listeners, 'fan_out': fan_out, **measure(bus, events, counter, args)}
+
+
+def bench_joint(set_size: int, args, rng: random.Random) -> Dict:
+    """1000个联合触发监听器，每个监听100个事件名中随机的set_size个"""
+    bus = new_bus()
+    counter, callback = new_counter()
+    names = [f'event_{i}' for i in range(100)]
+    for _ in range(1000):
+        bus.add_joint_listener(rng.sample(names, set_size), callback)
+
+    events = [rng.choice(names) for _ in range(args.events)]
+    return {'listener_type': 'JOINT', 'listeners': 1000, 'set_size': set_size, **measure(bus, events, counter, args)}
+
+
+def bench_pattern(length: int, args, rng: random.Random) -> Dict:
+    """100个模式监听器，模式由20个事件名和约10%的'*'组成"""
+    bus = new_bus()
+    counter, callback = new_counter()
+    names = [f'event_{i}' for i in range(20)]
+    for _ in range(100):
+        pattern = [rng.choice(names)] + ['*' if rng.random() < 0.1 else rng.choice(names) for _ in range(length - 1)]
+        bus.add_pattern_listener(pattern, callback)
+    bus.compile_patterns()
+
+    events = [rng.choice(names) for _ in range(args.events)]
+    return {'listener_type': 'PATTERN', 'listeners': 100, 'pattern_length': length, **measure(bus, events, counter, args)}
+
+
+def bench_delayed_backlog(backlog: int, args, rng: random.Random) -> Dict:
+    """时间轮中预先放入backlog个远期任务，再测量每个事件触发一个延迟任务时的吞吐量"""
+    bus = new_bus()
+    counter, callback = new_counter()
+    for _ in range(backlog):
+        bus.schedule_delayed(rng.randint(10 ** 6, 10 ** 9), callback)
+
+    names = [f'event_{i}' for i in range(100)]
+    for name in names:
+        bus.add_delayed_listener(name, rng.randint(1, 16), callback)
+
+    events = [rng.choice(names) for _ in range(args.events)]
+    return {'listener_type': 'DELAY', 'backlog': backlog, **measure(bus, events, counter, args)}
+
+
+def bench_topic(listeners: int, args, rng: random.Random) -> Dict:
+    """listeners个主题监听器订阅1000个品种的fill.<品种>.*、*.<品种>.buy、fill.<品种>.#与quote.<品种>.#，事件为fill.<品种>.<方向>"""
+    bus = new_bus()
+    counter, callback = new_counter()
+    symbols = [f'SYM{i}' for i in range(1000)]
+    forms = ('fill.{}.*', '*.{}.buy', 'fill.{}.#', 'quote.{}.#')
+    for _ in range(listeners):
+        bus.add_topic_listener(rng.choice(forms).format(rng.choice(symbols)), callback)
+
+    fan_out = max(1, listeners // len(symbols))
+    events = [f'fill.{rng.choice(symbols)}.{rng.choice(("buy", "sell"))}' for _ in range(max(500, args.events // fan_out))]
+    return {'listener_type': 'TOPIC', 'listeners': listeners, 'fan_out': fan_out, **measure(bus, events, counter, args)}
+
+
+#合成标签类缓存，Django模型类在同一进程中只能创建一次，{<标签数量>: [<标签类>, ...]}
+_synthetic_labels: Dict[int, list] = {}
+
+
+def synthetic_label_classes(count: int, rng: random.Random) -> list:
+    """
+    创建count个合成标签类并注册触发器，每10个标签组成一条立即触发链：
+    Bench<n>Label<i>.trigger_0监听上一个标签发布的事件并发布自己的事件，trigger_1轮流使用DELAY、JOINT、PATTERN监听链上的事件
+    """
+    if count in _synthetic_labels:
+        return _synthetic_labels[count]
+
+    from api.event.event_engine import EventBus
+    from labels.models.base_label import BaseLabel
+    from labels.models.label_trigger_manager import LabelTriggerManager
+
+    classes = []
+    for i in range(count):
+        class_name = f'Bench{count}Label{i}'
+        chain_start = i - i % 10
+        previous_event = f'{class_name}_start' if i == chain_start else f'bench{count}_event_{i - 1}'
+
+        def trigger_0(self):
+            pass
+
+        def trigger_1(self):
+            pass
+
+        trigger_0.__qualname__ = f'{class_name}.trigger_0'
+        trigger_1.__qualname__ = f'{class_name}.trigger_1'
+
+        LabelTriggerManager.register_trigger(
+            listener_type=EventBus.IMMEDIATE, listen_event=previous_event, publish=f'bench{count}_event_{i}'
+        )(trigger_0)
+
+        kind = i % 3
+        if kind == 0:
+            LabelTriggerManager.register_trigger(
+                listener_type=EventBus.DELAY, listen_event=previous_event, delay=rng.randint(1, 5)
+            )(trigger_1)
+        elif kind == 1:
+            LabelTriggerManager.register_trigger(
+                listener_type=EventBus.JOINT, listen_event=[previous_event, f'bench{count}_event_{chain_start}']
+            )(trigger_1)
+        else:
+            LabelTriggerManager.register_trigger(
+                listener_type=EventBus.PATTERN, listen_event=[previous_event, '*']
+            )(trigger_1)
+
+        classes.append(type(class_name, (BaseLabel,), {
+            '__module__': __name__,
+            'Meta': type('Meta', (), {'app_label': 'labels'}),
+            'trigger_0': trigger_0,
+            'trigger_1': trigger_1,
+        }))
+
+    _synthetic_labels[count] = classes
+    return classes
+
+
+def bench_install(labels: int, args, rng: random.Random) -> Dict:
+    """安装labels个合成标签后，每个请求调用一条链头部标签的trigger_0并处理到队列为空"""
+    from labels.models.label_trigger_manager import LabelTriggerManager
+
+    classes = synthetic_label_classes(labels, rng)
+    # trigger_hash_tabel是全局的，只保留本次的合成标签类
+    table = LabelTriggerManager.trigger_hash_tabel
+    saved_table = dict(table)
+    table.clear()
+    for cls in classes:
+        table[cls.__name__] = saved_table[cls.__name__]
+
+    saved_freeze = LabelTriggerManager.freeze_installed
+    LabelTriggerManager.freeze_installed = args.freeze
+    try:
+        instances = [cls(label_value='0') for cls in classes]
+        bus = new_bus()
+
+        start = perf_counter_ns()
+        for instance in instances:
+            LabelTriggerManager.install_instance(instance)
+        LabelTriggerManager.install_to_eventbus(bus)
+        install_ms = (perf_counter_ns() - start) / 1e6
+
+        heads = instances[::10]
+        latencies = []
+        start_count = bus.event_count
+        start = perf_counter_ns()
+        for _ in range(args.requests):
+            request_start = perf_counter_ns()
+            LabelTriggerManager.call(rng.choice(heads), 'trigger_0', bus)
+            bus.process()
+            latencies.append(perf_counter_ns() - request_start)
+        elapsed_ns = perf_counter_ns() - start
+    finally:
+        LabelTriggerManager.freeze_installed = saved_freeze
+        table.clear()
+        table.update(saved_table)
+
+    latencies.sort()
+    events = bus.event_count - start_count
+    return {
+        'labels': labels,
+        'install_ms': install_ms,
+        'requests': args.requests,
+        'events': events,
+        'events_per_s': events / (elapsed_ns / 1e9),
+        'p50_us': percentile(latencies, 0.5) / 1e3,
+        'p99_us': percentile(latencies, 0.99) / 1e3,
+    }
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    'immediate': bench_immediate,
+    'delayed': bench_delayed,
+    'joint': bench_joint,
+    'pattern': bench_pattern,
+    'delayed_backlog': bench_delayed_backlog,
+    'topic': bench_topic,
+    'install': bench_install,
+}
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_suite(args) -> Dict:
+    results = []
+    for scenario in args.scenario:
+        sweep = SWEEPS[scenario][1 if args.quick else 0]
+        for value in sweep:
+            # 每个场景使用独立的随机数生成器，单独运行某个场景时结果与完整运行一致
+            rng = random.Random(f'{args.seed}-{scenario}-{value}')
+            result = {'scenario': scenario, **BENCHMARKS[scenario](value, args, rng)}
+            results.append(result)
+            print(f"{scenario:>16} {value:>7}: {result['events_per_s']:>12,.0f} events/s, "
+                  f"p50 {result['p50_us']:8.2f}us, p99 {result['p99_us']:8.2f}us", file=sys.stderr)
+
+    return {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        },
+        'results': results,
+    }
+
+
+def result_key(result: Dict) -> tuple:
+    """用于在两次结果之间匹配同一个测试点"""
+    return tuple(sorted(
+        (key, value) for key, value in result.items()
+        if key in ('scenario', 'listeners', 'fan_out', 'set_size', 'pattern_length', 'backlog', 'labels')
+    ))
+
+
+def compare(baseline_path: str, current_path: str, threshold: float) -> int:
+    """
+    比较两次结果的吞吐量与p99，吞吐量下降或p99上升超过threshold时视为退化
+    :return: 退化的测试点数量
+    """
+    with open(baseline_path) as f:
+        baseline = {result_key(result): result for result in json.load(f)['results']}
+    with open(current_path) as f:
+        current = json.load(f)['results']
+
+    regressions = 0
+    for result in current:
+        old = baseline.get(result_key(result))
+        if old is None:
+            continue
+        throughput = result['events_per_s'] / old['events_per_s']
+        p99 = result['p99_us'] / old['p99_us'] if old['p99_us'] else 1.0
+        regressed = throughput < 1 - threshold or p99 > 1 + threshold
+        regressions += regressed
+        params = ', '.join(f'{key}={value}' for key, value in result_key(result) if key != 'scenario')
+        print(f"{'REGRESSION' if regressed else 'ok':>10} {result['scenario']:>16} {params:<40} "
+              f"throughput x{throughput:.2f}, p99 x{p99:.2f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--events', type=int, default=20000, help='每个测试点处理的事件数（扇出大的测试点按扇出缩减）')
+    parser.add_argument('--requests', type=int, default=500, help='install场景的触发请求数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--quick', action='store_true', help='只运行每个场景的部分参数')
+    parser.add_argument('--output', help='JSON结果的输出路径，默认输出到stdout')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help='比较两个JSON结果文件')
+    parser.add_argument('--threshold', type=float, default=0.1, help='--compare时视为退化的相对变化')
+    parser.add_argument('--freeze', action='store_true', help='处理事件前冻结事件总线（install场景为安装完成后冻结）')
+    parser.add_argument('--with-logging', action='store_true', help='保留loguru默认输出与逐事件日志')
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+
+    if 'install' in args.scenario:
+        setup_django()
+
+    from api.event.event_logger import EventLogger
+    if not args.with_logging:
+        logger.remove()
+        EventLogger.configure(level='WARNING')
+
+    report = run_suite(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+EventBus冻结前后（见EventBus.freeze()）的吞吐量对比\n
+两个相同的事件总线交替处理相同的事件序列，各取多轮中最快的一轮，减少机器负载波动的影响
+
+用法（在manage.py所在目录下运行）:
+    python -m benchmarks.bench_event_freeze --events 50000 --listeners 4
+    python -m benchmarks.bench_event_freeze --listeners 16 --batch-size 256
+"""
+import argparse
+import random
+import time
+
+from loguru import logger
+
+from api.event.event_engine import EventBus
+from api.event.event_logger import EventLogger
+
+
+class Label:
+    """模拟标签实例，触发器以bind_callback()绑定的实例方法注册"""
+
+    def __init__(self):
+        self.value = 0
+
+    def trigger(self):
+        self.value += 1
+
+
+def build_bus(event_names, listeners_per_event: int, seed: int):
+    """每个事件名注册listeners_per_event个立即触发监听器与一个联合监听器，部分事件名注册延迟监听器"""
+    rng = random.Random(seed)
+    bus = EventBus(threaded=False, maxsize=0)
+    labels = []
+
+    def bound_trigger():
+        label = Label()
+        labels.append(label)
+        return bus.bind_callback(Label.trigger, label)
+
+    for name in event_names:
+        for _ in range(listeners_per_event):
+            bus.add_immediate_listener(name, bound_trigger())
+        if rng.random() < 0.25:
+            bus.add_delayed_listener(name, rng.randint(1, 8), Label().trigger)
+        bus.add_joint_listener(rng.sample(event_names, 2), bound_trigger())
+
+    bus.compile_patterns()
+    return bus, labels
+
+
+def run(bus: EventBus, events, batch_size: int) -> float:
+    bus.publish_many(events)
+    start = time.perf_counter()
+    if batch_size > 1:
+        while not bus.process_batch(batch_size):
+            pass
+    else:
+        while not bus.process_one_step():
+            pass
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=50000)
+    parser.add_argument('--event-names', type=int, default=50)
+    parser.add_argument('--listeners', type=int, default=4, help='每个事件名的立即触发监听器数量')
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--rounds', type=int, default=7)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--with-logging', action='store_true', help='保留loguru默认输出与逐事件日志（默认关闭以测量引擎本身）')
+    args = parser.parse_args()
+
+    if not args.with_logging:
+        logger.remove()
+        EventLogger.configure(level='WARNING')
+
+    rng = random.Random(args.seed)
+    event_names = [f'event_{i}' for i in range(args.event_names)]
+    # 约10%的事件没有监听器关心
+    events = [rng.choice(event_names) if rng.random() < 0.9 else f'unknown_{rng.randrange(100)}'
+              for _ in range(args.events)]
+
+    buses = {mode: build_bus(event_names, args.listeners, args.seed) for mode in ('unfrozen', 'frozen')}
+    buses['frozen'][0].freeze()
+
+    best = {mode: float('inf') for mode in buses}
+    for _ in range(args.rounds):
+        for mode, (bus, _) in buses.items():
+            best[mode] = min(best[mode], run(bus, events, args.batch_size))
+
+    for mode, (bus, labels) in buses.items():
+        print(f"{mode:>8}: {len(events)} events, {sum(label.value for label in labels) // args.rounds} callbacks per round, "
+              f"best {best[mode]:.3f}s, {len(events) / best[mode]:,.0f} events/s")
+
+    # 冻结前后触发的回调必须一致
+    values = {mode: [label.value for label in labels] for mode, (_, labels) in buses.items()}
+    assert values['unfrozen'] == values['frozen'], 'frozen event bus is not equivalent to unfrozen event bus'
+    print(f"speedup: {best['unfrozen'] / best['frozen']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
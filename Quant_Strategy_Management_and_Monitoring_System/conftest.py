@@ -0,0 +1,22 @@
+import os
+
+import django
+import pytest
+
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Quant_Strategy_Management_and_Monitoring_System.settings')
+django.setup()
+
+
+@pytest.fixture(scope='session')
+def django_db():
+    """为需要数据库的测试创建一次测试数据库（不使用db.sqlite3），整个测试会话结束后销毁"""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    yield connection
+    connection.creation.destroy_test_db(old_name, verbosity=0)
+    teardown_test_environment()
@@ -0,0 +1,238 @@
+import copy
+import math
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from django.db import models, transaction
+from loguru import logger
+
+from api.event.event_engine import EventBus
+from api.event.event_metrics import EventBusMetrics
+from labels.models.base_label import BaseLabel
+from labels.models.label_trigger_manager import LabelTriggerManager
+
+
+#事件流中的一项：<事件名>、(<事件名>, <负载>)或(<事件名>, <负载>, <毫秒时间戳>)
+StreamItem = Union[str, Tuple[str, Any], Tuple[str, Any, float]]
+
+
+class VirtualClock:
+    """回测使用的虚拟时钟（秒），由事件流中的时间戳推进，使按毫秒的定时任务与联合窗口可以重现"""
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance_to(self, ms: float):
+        """推进到ms毫秒，时间不会倒退，乱序的时间戳按当前时间处理"""
+        seconds = ms / 1000
+        if seconds <= self.now:
+            return
+        # EventBus按int(clock() * 1000)取毫秒，浮点误差不能使到期时刻被向下取整到前一毫秒
+        while int(seconds * 1000) < int(ms):
+            seconds = math.nextafter(seconds, math.inf)
+        self.now = seconds
+
+
+class LabelBacktest:
+    """
+    离线回测：将一个事件流在标签的内存副本上运行，不读写数据库中的标签，用于验证触发器配置的事件逻辑\n
+    1. 使用与线上相同的LabelTriggerManager.install_to_eventbus()安装触发器：安装前清空trigger_hash_tabel中所有的"instance"，
+       只安装传入标签的副本，不会用到其它用户留在表中的标签；安装后恢复原来的"instance"
+    2. 标签副本的save()不写入数据库，只记录保存次数（写缓冲），需要时由apply()一次性批量写回原标签
+    3. 事件总线为单线程模式、队列不限容量、使用虚拟时钟、不记录逐事件日志，每个输入事件与线上一次触发请求相同：
+       发布后处理直到队列为空，相同的输入总是得到相同的结果
+    4. 默认在一个最终回滚的事务中运行（rollback=True），触发器直接写数据库的操作也不会生效
+    5. report()返回每个触发器的触发次数、每个事件的处理次数、标签的最终值与变化、吞吐量
+    """
+
+    #每个输入事件的步数上限，见EventBus.process()
+    max_step: int = 10000
+
+    def __init__(self, labels: Iterable[BaseLabel], batch_size: int = 1, rollback: bool = True):
+        """
+        :param labels: 要回测的标签实例，每个注册了触发器的标签类一个（与GET /api/start-event-engine安装的标签相同）
+        :param batch_size: 大于1时使用EventBus.process_batch()批量处理
+        :param rollback: 为True时在回滚的事务中运行
+        """
+        self.originals: Dict[str, BaseLabel] = {label.__class__.__name__: label for label in labels}
+        self.batch_size = batch_size
+        self.rollback = rollback
+
+        #{<class_name>: <标签副本>}
+        self.labels: Dict[str, BaseLabel] = {}
+        #{<class_name>: <save()次数>}
+        self.saves: Dict[str, int] = {}
+        for class_name, label in self.originals.items():
+            self.labels[class_name] = self._copy_label(label)
+            self.saves[class_name] = 0
+
+        self.clock = VirtualClock()
+        self.eventBus = EventBus(threaded=False, maxsize=0, clock=self.clock)
+        # 回测的事件数量很大，不记录逐事件日志
+        self.eventBus.event_logger.set_events(False)
+        self.metrics = EventBusMetrics()
+        self.eventBus.enable_metrics(self.metrics)
+
+        self.events = 0
+        self.stalled = 0
+        self.elapsed = 0.0
+
+        self._install()
+
+    def _copy_label(self, label: BaseLabel) -> BaseLabel:
+        label_copy = copy.copy(label)
+        class_name = label.__class__.__name__
+
+        def buffered_save(*args, **kwargs):
+            self.saves[class_name] += 1
+
+        def buffered_delete(*args, **kwargs):
+            raise RuntimeError(f"LABELBACKTEST: label <{class_name}> cannot be deleted in backtest")
+
+        # 实例属性覆盖BaseLabel.save()与delete()
+        label_copy.save = buffered_save
+        label_copy.delete = buffered_delete
+        return label_copy
+
+    def _install(self):
+        """
+        :raise ValueError: 有注册了触发器的标签类没有传入标签，或安装失败
+        """
+        trigger_hash_tabel = LabelTriggerManager.trigger_hash_tabel
+        missing = set(trigger_hash_tabel) - set(self.labels)
+        if missing:
+            raise ValueError(f"LABELBACKTEST: backtest needs one label for each label class with triggers, missing {sorted(missing)}")
+
+        previous = {class_name: triggers_info.get("instance") for class_name, triggers_info in trigger_hash_tabel.items()}
+        try:
+            # 表中的"instance"可能是其它用户最近安装的标签
+            for triggers_info in trigger_hash_tabel.values():
+                triggers_info["instance"] = None
+            for label in self.labels.values():
+                LabelTriggerManager.install_instance(label)
+            LabelTriggerManager.install_to_eventbus(self.eventBus)
+        finally:
+            for class_name, instance in previous.items():
+                trigger_hash_tabel[class_name]["instance"] = instance
+
+        installed = self.eventBus.installed_labels
+        if not self.eventBus.is_install or any(installed.get(class_name) is not self.labels[class_name]
+                                               for class_name in trigger_hash_tabel):
+            raise ValueError("LABELBACKTEST: failed to install the backtest labels, see LABELTRIGGER logs")
+
+    def run(self, stream: Iterable[StreamItem], drain_timers: bool = True) -> Dict:
+        """
+        按顺序处理事件流，可以多次调用以继续回测
+        :param drain_timers: 为True时在事件流结束后将虚拟时钟推进到剩余定时任务的到期时刻，直到没有定时任务
+        :return: 见report()
+        """
+        start = time.perf_counter()
+        if self.rollback:
+            with transaction.atomic():
+                self._run(stream, drain_timers)
+                transaction.set_rollback(True)
+        else:
+            self._run(stream, drain_timers)
+        self.elapsed += time.perf_counter() - start
+
+        logger.success(f"LABELBACKTEST: {self.events} events processed in {self.elapsed:.3f}s, "
+                       f"{self.eventBus.event_count} events dispatched")
+        return self.report()
+
+    def _run(self, stream: Iterable[StreamItem], drain_timers: bool):
+        eventBus = self.eventBus
+        clock = self.clock
+        publish = eventBus.publish
+        reset_cycle_budgets = eventBus.reset_cycle_budgets
+        process_steps = eventBus.process_steps
+        max_step = LabelBacktest.max_step
+        batch_size = self.batch_size
+
+        eventBus.start_processing()
+        try:
+            for item in stream:
+                if item.__class__ is str:
+                    publish(item)
+                else:
+                    if len(item) > 2 and item[2] is not None:
+                        clock.advance_to(item[2])
+                    publish(item[0], item[1])
+                self.events += 1
+
+                # 与线上每次触发请求一样，每个输入事件重新计算事件风暴预算
+                reset_cycle_budgets()
+                if not process_steps(max_step, batch_size)[0]:
+                    self.stalled += 1
+                    logger.critical(f"LABELBACKTEST: event <{item}> reach step limit {max_step}, check infinite event loop")
+
+            while drain_timers:
+                expiry = eventBus.timed_tasks.next_expiry()
+                if expiry is None:
+                    break
+                clock.advance_to(expiry)
+                reset_cycle_budgets()
+                if not process_steps(max_step, batch_size)[0]:
+                    self.stalled += 1
+        finally:
+            eventBus.finish_processing()
+
+    def report(self) -> Dict:
+        trigger_names = {f"{class_name}.{trigger_type}"
+                         for class_name, triggers_info in LabelTriggerManager.trigger_hash_tabel.items()
+                         for trigger_type in triggers_info if trigger_type in ("trigger_0", "trigger_1")}
+        trigger_counts: Dict[str, int] = {}
+        for histograms in self.metrics.listeners.values():
+            for callback, histogram in histograms.items():
+                name = getattr(callback, '__name__', None)
+                if name in trigger_names:
+                    trigger_counts[name] = trigger_counts.get(name, 0) + histogram.count
+
+        return {
+            'events': self.events,
+            'dispatched': self.eventBus.event_count,
+            'stalled': self.stalled,
+            'elapsed_s': self.elapsed,
+            'events_per_s': self.events / self.elapsed if self.elapsed else 0.0,
+            'virtual_time_ms': int(self.clock() * 1000),
+            'trigger_counts': dict(sorted(trigger_counts.items())),
+            'event_counts': {event: counters[0] for event, counters in sorted(self.metrics.events.items())},
+            'labels': {class_name: self._label_report(class_name) for class_name in sorted(self.labels)},
+        }
+
+    def _label_report(self, class_name: str) -> Dict:
+        original, label_copy = self.originals[class_name], self.labels[class_name]
+        values = {}
+        changed = {}
+        for field in self._value_fields(label_copy):
+            value = getattr(label_copy, field.attname)
+            values[field.name] = value
+            before = getattr(original, field.attname)
+            if before != value:
+                changed[field.name] = [before, value]
+        return {'saves': self.saves[class_name], 'values': values, 'changed': changed}
+
+    @staticmethod
+    def _value_fields(label: BaseLabel) -> List[models.Field]:
+        return [field for field in label._meta.concrete_fields if not field.primary_key and not field.is_relation]
+
+    def apply(self, fields: Optional[List[str]] = None) -> int:
+        """
+        将回测中被保存过的标签副本一次性写回数据库中的原标签（每个标签类一次bulk_update）
+        :param fields: 写回的字段，默认为所有非主键、非关联字段
+        :return: 写回的标签数
+        """
+        written = 0
+        with transaction.atomic():
+            for class_name, label_copy in self.labels.items():
+                if not self.saves[class_name]:
+                    continue
+                original = self.originals[class_name]
+                update_fields = fields or [field.name for field in self._value_fields(label_copy)]
+                for field in update_fields:
+                    setattr(original, field, getattr(label_copy, field))
+                written += original.__class__.objects.bulk_update([original], update_fields)
+        logger.success(f"LABELBACKTEST: {written} labels written back")
+        return written
@@ -1,9 +1,15 @@
-from typing import Callable, Union, List
+import os
+from typing import Callable, Union, List, Dict
 
 from loguru import logger
 
-from api.event.event_engine import EventBus
+from api.event.event_engine import EventBus, Subscription
+from api.event.event_logger import EventLogger
+from api.event.event_queue import EventQueue
+from api.event.event_snapshot import EventBusSnapshot, SnapshotError
+from api.models.instance_hash_table.instance_hash_table import InstanceHashTable
 from labels.models.base_label import BaseLabel
+from labels.models.trigger_graph_analyzer import TriggerGraphAnalyzer
 
 
 class LabelTriggerManager:
@@ -18,18 +24,32 @@ class LabelTriggerManager:
             "listener_args": {
                 "listener_type": <int>,
                 "listen_event": str or List[str] or None,
-                "delay": <int> or None
+                "delay": <int> or None,
+                "delay_ms": <int> or None,
+                "independent": <bool>,
+                "with_payload": <bool>,
+                "window_events": <int> or None,
+                "window_ms": <int> or None
             },
-            "publish": <str>
+            "publish": <str>,
+            "priority": <int>,
+            "coalesce": <bool>
         },
         "trigger_1": {
             "func": <callable>,
             "listener_args": {
                 "listener_type": <int>,
                 "listen_event": <str> or <List[str]> or None,
-                "delay": <int> or None
+                "delay": <int> or None,
+                "delay_ms": <int> or None,
+                "independent": <bool>,
+                "with_payload": <bool>,
+                "window_events": <int> or None,
+                "window_ms": <int> or None
             }
-            "publish": <str>
+            "publish": <str>,
+            "priority": <int>,
+            "coalesce": <bool>
         }
     },
     "<class_name 2>": {}
@@ -37,23 +57,68 @@ class LabelTriggerManager:
     """
     trigger_hash_tabel = dict()
 
+    #安装完成后是否冻结事件总线（见EventBus.freeze()），由api.apps.ApiConfig.ready()根据settings.EVENTBUS_FREEZE设置
+    freeze_installed: bool = True
+
+    event_logger = EventLogger('LABELTRIGGER')
+
     @staticmethod
-    def call(label_instance:BaseLabel,action:str):
+    def call(label_instance:BaseLabel,action:str,eventBus:EventBus=None,payload=None):
+        """
+        调用标签实例的触发器\n
+        如果提供了eventBus且该触发器需要在调用后发布事件（publish不为空），则在触发器执行后向该eventBus发布事件
+        :param payload: 只对注册时with_payload为True的触发器有效，作为触发器的第二个参数
+        :return: 触发器的返回值，async def触发器返回一个可等待对象
+        """
         if not isinstance(label_instance,BaseLabel):
             logger.critical(f'LABELTRIGGER: You seems try to call a trigger with an non BaseLabel instance <{label_instance}>')
             return None
 
-        logger.debug(LabelTriggerManager.trigger_hash_tabel)
         label_class_name = label_instance.__class__.__name__
-        LabelTriggerManager.trigger_hash_tabel[label_class_name][action]["func"](label_instance)
+        trigger = LabelTriggerManager.trigger_hash_tabel[label_class_name][action]
+        LabelTriggerManager.event_logger.debug("call <{label}.{action}>, publish: {publish}",
+                                               label=label_class_name, action=action, publish=trigger["publish"])
+
+        func = trigger["func"]
+        if eventBus is not None and trigger["publish"] is not None:
+            func = eventBus.publish_event(trigger["publish"], trigger["priority"])(func)
+        if trigger["listener_args"]["with_payload"]:
+            return func(label_instance, payload)
+        return func(label_instance)
 
     @staticmethod
     def register_trigger(
             listener_type:int = EventBus.NONE,
             listen_event:Union[str, List[str]] = None,
             publish:str=None,
-            delay:int=None
+            delay:int=None,
+            independent:bool=False,
+            delay_ms:int=None,
+            with_payload:bool=False,
+            priority:int=EventQueue.NORMAL,
+            coalesce:bool=False,
+            window_events:int=None,
+            window_ms:int=None
     ):
+        """
+        :param listen_event: 监听的事件名，JOINT为事件名列表，PATTERN为模式（可以包含'*'），
+                             TOPIC为层级主题订阅（如"fill.*.buy"、"fill.#"，见EventBus.add_topic_listener()）
+        :param delay: 只对DELAY有效，延迟的事件数
+        :param delay_ms: 只对DELAY有效，不为None时改为按时间延迟，事件发生delay_ms毫秒后触发（此时忽略delay）
+        :param independent: 只对IMMEDIATE有效，为True时该触发器与监听同一事件的其它触发器相互独立（如执行阻塞的数据库或网络操作），
+                            事件总线启用并行分发时可以并行执行
+        :param with_payload: 为True时触发器以触发它的事件的负载作为第二个参数被调用，即trigger_x(self, payload)，没有负载时为None，
+                             见EventBus.publish()
+        :param priority: 发布publish事件时使用的优先级车道，如风控事件使用EventQueue.CRITICAL，见EventQueue
+        :param coalesce: 为True时为publish事件设置合并规则，队列中至多只有一个待处理的该事件（如每个tick都发布的计数器事件），
+                         见EventBus.add_coalesce_rule()
+        :param window_events: 只对JOINT有效，每个已发生的事件只在之后的window_events个事件内有效，过期后需要重新发生
+        :param window_ms: 只对JOINT有效，每个已发生的事件只在之后的window_ms毫秒内有效，不能与window_events同时使用，
+                          见EventBus.add_joint_listener()
+        """
+        if priority not in EventQueue.PRIORITIES:
+            raise EventQueue.invalid_priority(priority)
+
         def decorator(func: Callable):
             func_class_name = func.__qualname__.split('.')[0] #<class_name>.<func name> => <class_name>
             func_name = func.__name__ #<class_name>.<func name> => <func name>
@@ -66,9 +131,16 @@ class LabelTriggerManager:
                 "listener_args": {
                     "listener_type": listener_type,
                     "listen_event": listen_event,
-                    "delay": delay
+                    "delay": delay,
+                    "delay_ms": delay_ms,
+                    "independent": independent,
+                    "with_payload": with_payload,
+                    "window_events": window_events,
+                    "window_ms": window_ms
                 },
-                "publish": publish
+                "publish": publish,
+                "priority": priority,
+                "coalesce": coalesce
             })
 
             logger.success(f"LABELTRIGGER: Registered <{func_class_name}.{func_name}>, detail: {{{func_class_name}:{LabelTriggerManager.trigger_hash_tabel[func_class_name]}}}")
@@ -98,22 +170,28 @@ class LabelTriggerManager:
 
 
     @staticmethod
-    def install_to_eventbus(eventBus:EventBus):
+    def install_to_eventbus(eventBus:EventBus, state:Dict=None):
         """
         该函数建议在install_instance()方法之后调用
         1. 遍历整个trigger_hash_tabel，提取"instance"字段中的标签实例并将其作为触发器函数的参数
         2. 将带有函数参数的触发器打包为一个lambda函数
         3. 将这个lambda函数和根据trigger_hash_tabel中的监听器信息注册到提供的eventBus实例中
-        3.1. 如果触发器需要在调用后发布事件（publish不为空），则将经过eventBus.publish_event修饰后的可调用对象写入trigger_hash_tabel中的"func”字段
+        3.1. 如果触发器需要在调用后发布事件（publish不为空），则使用eventBus.bind_callback()绑定的、结束时发布事件的可调用对象作为回调，
+             该可调用对象不会写回trigger_hash_tabel（trigger_hash_tabel是所有用户共享的，写回会使其它用户的触发器向该eventBus发布事件）
         4. （重要）不应再使用trigger_hash_tabel中的"instance"字段的值，因为该值不再有效
-        :param eventBus:
+        5. freeze_installed为True时，安装、恢复快照与重放日志都完成后冻结事件总线的监听器结构
+        :param eventBus: EventBus或AsyncEventBus实例，AsyncEventBus支持async def触发器
+        :param state: 不为None时在安装完成后恢复该快照状态（见EventBusSnapshot），再重放快照之后的事件日志
+        :raise EventStormError: 触发图中存在事件循环且TriggerGraphAnalyzer.policy为REJECT，此时事件总线不会被标记为已安装
         :return:
         """
         if eventBus.is_install:
             logger.warning('This event bus is already installed')
             return None
-        else:
-            eventBus.is_install = True
+
+        # 安装前对触发图做静态分析，找出会无限产生事件的循环
+        TriggerGraphAnalyzer.check(eventBus, LabelTriggerManager.trigger_hash_tabel)
+        eventBus.is_install = True
 
         for class_name,triggers_info in LabelTriggerManager.trigger_hash_tabel.items():
 
@@ -125,61 +203,215 @@ class LabelTriggerManager:
                     f'LABELTRIGGER: You seems try to use an non BaseLabel instance {instance} in eventBus')
                 return None
 
-            for trigger_type,trigger in triggers_info.items():
-
-                if trigger_type != "trigger_0" and trigger_type != "trigger_1":
-                    continue
-
-                #该回调是否需要在结束是发布事件
-                publish = trigger["publish"]
-
-                current_trigger = trigger  # 保存当前状态
-                if publish is not None:
-                    """
-                    publish不为空
-                    使用装饰器修饰需要在结束时发布事件的回调
-                    eventBus.publish_event(<类名>.<触发器类型>)返回一个decorator(func: Callable)函数
-                    该函数被传入一个lambda函数作为回调函数：lambda(t=current_trigger, inst=instance) : t["func"](inst)
-                    """
-                    # 装饰原始函数并更新到哈希表
-                    trigger["func"] = eventBus.publish_event(publish)(current_trigger["func"])
-                    # 将instance变量传入
-                    callback = lambda t=current_trigger, inst=instance: t["func"](inst)
-                else:
-                    """
-                    publish为空
-                    """
-                    callback = lambda t=current_trigger, inst=instance: t["func"](inst)
-
-                listener_args = trigger["listener_args"]
-                listener_type = listener_args["listener_type"]
-                listen_event = listener_args["listen_event"]
-                delay = listener_args["delay"]
-
-                if listener_type == EventBus.IMMEDIATE:
-                    eventBus.add_immediate_listener(
-                        source=listen_event,
-                        callback=callback
-                    )
-
-                if listener_type == EventBus.DELAY:
-                    eventBus.add_delayed_listener(
-                        source=listen_event,
-                        delay=delay,
-                        callback=callback,
-                    )
-
-                if listener_type == EventBus.JOINT:
-                    eventBus.add_joint_listener(
-                        sources=listen_event,
-                        callback=callback
-                    )
-
-                if listener_type == EventBus.PATTERN:
-                    eventBus.add_pattern_listener(
-                        pattern=listen_event,
-                        callback=callback
-                    )
+            eventBus.installed_labels[class_name] = instance
+            eventBus.label_subscriptions[class_name] = LabelTriggerManager._add_listeners(
+                eventBus, class_name, instance, triggers_info)
+
+        # 将所有模式监听器编译为共享自动机
+        eventBus.compile_patterns()
+
+        # 合并规则在模式监听器全部注册后设置，与模式冲突的规则会被拒绝
+        for class_name, triggers_info in LabelTriggerManager.trigger_hash_tabel.items():
+            LabelTriggerManager._add_coalesce_rules(eventBus, triggers_info)
+
+        if state is not None:
+            EventBusSnapshot.restore(eventBus, state)
+
+        # 事件总线挂载了事件日志时，重放日志以恢复重启前的联合触发、模式匹配和延迟任务状态
+        if eventBus.journal is not None:
+            if state is None:
+                eventBus.journal.replay(eventBus)
+            elif state['journal_position'] is not None:
+                # 只重放快照之后的事件
+                eventBus.journal.replay(eventBus, skip=state['journal_position'])
+
+        if LabelTriggerManager.freeze_installed:
+            eventBus.freeze()
+
+    @staticmethod
+    def _add_listeners(eventBus:EventBus, class_name:str, instance:BaseLabel, triggers_info:Dict) -> List[Subscription]:
+        """
+        将一个标签实例的触发器注册为eventBus的监听器，见install_to_eventbus()
+        :return: 注册的监听器的订阅句柄
+        """
+        subscriptions = []
+        for trigger_type,trigger in triggers_info.items():
+
+            if trigger_type != "trigger_0" and trigger_type != "trigger_1":
+                continue
+
+            listener_args = trigger["listener_args"]
+            listener_type = listener_args["listener_type"]
+            listen_event = listener_args["listen_event"]
+            delay = listener_args["delay"]
+            with_payload = listener_args["with_payload"]
+
+            """
+            将instance变量绑定为触发器的第一个参数，with_payload为True时事件总线会传入事件的负载作为第二个参数
+            publish不为空时回调在触发器执行结束后向eventBus发布事件（与eventBus.publish_event(<事件名>)修饰的效果相同），
+            见EventBus.bind_callback()
+            """
+            callback = eventBus.bind_callback(trigger["func"], instance, publish=trigger["publish"], priority=trigger["priority"])
+            #重命名该回调函数，使其在日志和指标中可见
+            callback.__name__ = f"{class_name}.{trigger_type}"
+
+            if listener_type == EventBus.IMMEDIATE:
+                subscriptions.append(eventBus.add_immediate_listener(
+                    source=listen_event,
+                    callback=callback,
+                    independent=listener_args["independent"],
+                    with_payload=with_payload
+                ))
+
+            if listener_type == EventBus.DELAY and listener_args["delay_ms"] is not None:
+                subscriptions.append(eventBus.add_timed_listener(
+                    source=listen_event,
+                    delay_ms=listener_args["delay_ms"],
+                    callback=callback,
+                    with_payload=with_payload
+                ))
+            elif listener_type == EventBus.DELAY:
+                subscriptions.append(eventBus.add_delayed_listener(
+                    source=listen_event,
+                    delay=delay,
+                    callback=callback,
+                    with_payload=with_payload
+                ))
+
+            if listener_type == EventBus.JOINT:
+                subscriptions.append(eventBus.add_joint_listener(
+                    sources=listen_event,
+                    callback=callback,
+                    with_payload=with_payload,
+                    window_events=listener_args["window_events"],
+                    window_ms=listener_args["window_ms"]
+                ))
+
+            if listener_type == EventBus.PATTERN:
+                subscriptions.append(eventBus.add_pattern_listener(
+                    pattern=listen_event,
+                    callback=callback,
+                    with_payload=with_payload
+                ))
+
+            if listener_type == EventBus.TOPIC:
+                subscriptions.append(eventBus.add_topic_listener(
+                    topic=listen_event,
+                    callback=callback,
+                    with_payload=with_payload
+                ))
+
+        return subscriptions
+
+    @staticmethod
+    def _add_coalesce_rules(eventBus:EventBus, triggers_info:Dict):
+        for trigger_type, trigger in triggers_info.items():
+            if trigger_type != "trigger_0" and trigger_type != "trigger_1":
+                continue
+            if trigger["coalesce"] and trigger["publish"] is not None:
+                eventBus.add_coalesce_rule(trigger["publish"])
+
+    @staticmethod
+    def install_label(eventBus:EventBus, instance:BaseLabel) -> bool:
+        """
+        向已安装的事件总线增量安装一个标签实例的触发器，不需要重建事件总线\n
+        1. 该标签类已有安装的实例时，先卸载原实例的触发器（即替换实例）
+        2. 新注册的模式监听器在下一次处理事件前自动编译，其它监听器的状态（联合触发、模式匹配、延迟任务）保持不变
+        3. 不会修改trigger_hash_tabel中的"instance"字段
+        :return: 是否安装成功
+        """
+        if not eventBus.is_install:
+            logger.warning('LABELTRIGGER: event bus is not installed, use install_to_eventbus() instead')
+            return False
+
+        if not isinstance(instance, BaseLabel):
+            logger.critical(f'LABELTRIGGER: You seems try to install an non BaseLabel instance {instance} in eventBus')
+            return False
+
+        class_name = instance.__class__.__name__
+        triggers_info = LabelTriggerManager.trigger_hash_tabel.get(class_name)
+        if triggers_info is None:
+            logger.warning(f"LABELTRIGGER: label class <{class_name}> has no registered trigger")
+            return False
+
+        LabelTriggerManager.uninstall_label(eventBus, class_name)
+        eventBus.installed_labels[class_name] = instance
+        eventBus.label_subscriptions[class_name] = LabelTriggerManager._add_listeners(
+            eventBus, class_name, instance, triggers_info)
+        LabelTriggerManager._add_coalesce_rules(eventBus, triggers_info)
+
+        logger.success(f"LABELTRIGGER: label <{class_name}> installed, "
+                       f"{len(eventBus.label_subscriptions[class_name])} listeners registered")
+        return True
+
+    @staticmethod
+    def uninstall_label(eventBus:EventBus, class_name:str) -> int:
+        """
+        从事件总线中移除一个标签类已安装实例的所有监听器，可以在事件总线处理事件时调用（见EventBus.remove_listener()）\n
+        该标签发布事件的合并规则不会被移除（其它标签可能也发布同名事件）
+        :return: 移除的监听器数
+        """
+        subscriptions = eventBus.label_subscriptions.pop(class_name, [])
+        eventBus.installed_labels.pop(class_name, None)
+        removed = sum(1 for subscription in subscriptions if subscription.remove())
+        if subscriptions:
+            logger.success(f"LABELTRIGGER: label <{class_name}> uninstalled, {removed} listeners removed")
+        return removed
+
+    @staticmethod
+    def snapshot_eventbus(eventBus:EventBus, path:str) -> int:
+        """
+        保存事件总线的运行时状态，安装的标签以InstanceHashTable中的UUID记录，挂载了事件日志时删除已包含在快照中的日志段
+        :return: 快照文件的字节数
+        """
+        labels = {class_name: InstanceHashTable.get_uuid_for_instance(instance)
+                  for class_name, instance in eventBus.installed_labels.items()}
+        # 保存前记录日志位置，保存过程中处理的事件不会被删除
+        position = eventBus.journal.dispatch_count if eventBus.journal is not None else None
+        size = EventBusSnapshot.save(eventBus, path, labels)
+        logger.success(f"LABELTRIGGER: snapshot of {len(labels)} labels saved to <{path}>, {size} bytes")
+        if position is not None:
+            # 快照之前的事件不再需要重放
+            eventBus.journal.retain(position)
+        return size
+
+    @staticmethod
+    def restore_eventbus(eventBus:EventBus, path:str) -> bool:
+        """
+        从快照恢复事件总线：按UUID取回快照中的标签实例并安装，不需要遍历用户的角色和容器\n
+        快照不存在、无法读取、或其中的标签已不存在（UUID找不到）时返回False，事件总线不会被修改，调用方应改为完整安装
+        :return: 是否恢复成功
+        """
+        if eventBus.is_install:
+            logger.warning('This event bus is already installed')
+            return False
+
+        if not os.path.exists(path):
+            return False
+
+        try:
+            state = EventBusSnapshot.load(path)
+        except (OSError, SnapshotError) as e:
+            logger.critical(f"LABELTRIGGER: cannot load snapshot <{path}>: {e}")
+            return False
+
+        instances = []
+        for class_name, label_uuid in state['labels'].items():
+            instance = InstanceHashTable.get_instance_by_uuid(label_uuid) if label_uuid is not None else None
+            if not isinstance(instance, BaseLabel) or instance.__class__.__name__ != class_name:
+                logger.warning(f"LABELTRIGGER: label <{class_name}:{label_uuid}> in snapshot <{path}> no longer exists")
+                return False
+            instances.append(instance)
+
+        # 快照之后新增了触发器的标签类没有记录在快照中
+        if set(state['labels']) != set(LabelTriggerManager.trigger_hash_tabel):
+            logger.warning(f"LABELTRIGGER: label classes in snapshot <{path}> do not match registered triggers")
+            return False
+
+        for instance in instances:
+            LabelTriggerManager.install_instance(instance)
+        LabelTriggerManager.install_to_eventbus(eventBus, state=state)
+        return True
 
 
 
@@ -0,0 +1,218 @@
+from typing import Dict, List, Tuple, NamedTuple, FrozenSet
+
+from loguru import logger
+
+from api.event.event_engine import EventBus
+from api.event.topic_trie import TopicTrie
+
+
+class EventStormError(Exception):
+    """触发器配置中存在会无限产生事件的循环"""
+
+
+class EventCycle(NamedTuple):
+    #循环中的事件名
+    events: FrozenSet[str]
+    #构成循环的触发器，"<class_name>.<trigger_name>"
+    triggers: Tuple[str, ...]
+    #循环内的边数多于事件数，每转一圈事件数量都会增加（指数增长）
+    amplifying: bool
+
+
+class TriggerGraphAnalyzer:
+    """
+    在LabelTriggerManager.install_to_eventbus()时对trigger_hash_tabel做静态分析，找出会无限产生事件的循环（事件风暴）\n
+    1. 触发图的节点为事件名，每个需要发布事件的触发器产生从监听事件到发布事件的边
+    2. 只有"持续"的边会使循环无限进行：IMMEDIATE、TOPIC、按事件数延迟的DELAY、只监听一个事件的JOINT、长度为1的PATTERN；
+       TOPIC触发器产生从每个匹配其订阅的事件（触发图中出现的事件名）到发布事件的边；
+       监听多个事件的JOINT和较长的PATTERN需要循环之外的事件配合才能触发，按毫秒延迟的DELAY只会在之后的process()中触发（如定时心跳），它们都不计入
+    3. 使用Tarjan算法求持续边构成的强连通分量，包含环的强连通分量即为一个事件循环；分量内的边数多于事件数时为放大循环
+    4. 根据policy处理找到的循环：
+       REJECT：抛出EventStormError，拒绝安装
+       BUDGET：为每个循环在事件总线上设置预算（EventBus.add_cycle_budget），一次process()中超出预算的循环事件被丢弃
+       IGNORE：只记录日志
+    """
+
+    #policy enum
+    REJECT = 'reject'
+    BUDGET = 'budget'
+    IGNORE = 'ignore'
+
+    POLICIES = (REJECT, BUDGET, IGNORE)
+
+    #由api.apps.ApiConfig.ready()根据settings.EVENTBUS_CYCLE_POLICY与EVENTBUS_CYCLE_BUDGET设置
+    policy: str = BUDGET
+    cycle_budget: int = 1000
+
+    @staticmethod
+    def build_graph(trigger_hash_tabel: Dict) -> Dict[str, List[Tuple[str, str]]]:
+        """
+        构建只包含持续边的触发图
+        :return: {<监听事件名>: [(<发布事件名>, "<class_name>.<trigger_name>"), ...]}
+        """
+        graph: Dict[str, List[Tuple[str, str]]] = {}
+        #监听任意事件的触发器（模式['*']），[(<发布事件名>, <触发器名>), ...]
+        wildcard_edges: List[Tuple[str, str]] = []
+        #主题触发器，订阅的值为(<发布事件名>, <触发器名>)
+        topic_edges = TopicTrie()
+
+        for class_name, triggers_info in trigger_hash_tabel.items():
+            for trigger_type, trigger in triggers_info.items():
+                if trigger_type != "trigger_0" and trigger_type != "trigger_1":
+                    continue
+
+                publish = trigger["publish"]
+                if publish is None:
+                    continue
+
+                listener_args = trigger["listener_args"]
+                listener_type = listener_args["listener_type"]
+                listen_event = listener_args["listen_event"]
+                trigger_name = f"{class_name}.{trigger_type}"
+
+                if listener_type == EventBus.IMMEDIATE:
+                    source = listen_event
+                elif listener_type == EventBus.DELAY:
+                    if listener_args.get("delay_ms") is not None:
+                        continue
+                    source = listen_event
+                elif listener_type == EventBus.JOINT:
+                    if len(set(listen_event)) != 1:
+                        continue
+                    source = listen_event[0]
+                elif listener_type == EventBus.PATTERN:
+                    if len(listen_event) != 1:
+                        continue
+                    source = listen_event[0]
+                elif listener_type == EventBus.TOPIC:
+                    topic_edges.add(listen_event, (publish, trigger_name))
+                    graph.setdefault(publish, [])
+                    continue
+                else:
+                    continue
+
+                if source == '*':
+                    wildcard_edges.append((publish, trigger_name))
+                    graph.setdefault(publish, [])
+                    continue
+
+                graph.setdefault(source, []).append((publish, trigger_name))
+                graph.setdefault(publish, [])
+
+        # 主题触发器会被任何匹配其订阅的事件触发，包括它自己发布的事件
+        if topic_edges:
+            for source in graph:
+                graph[source].extend(topic_edges.match(source))
+
+        # '*'会被任何事件触发，包括它自己发布的事件
+        for publish, trigger_name in wildcard_edges:
+            for source in graph:
+                graph[source].append((publish, trigger_name))
+
+        return graph
+
+    @staticmethod
+    def find_cycles(graph: Dict[str, List[Tuple[str, str]]]) -> List[EventCycle]:
+        """使用迭代版Tarjan算法求包含环的强连通分量"""
+        index_of: Dict[str, int] = {}
+        lowlink: Dict[str, int] = {}
+        on_stack = set()
+        stack: List[str] = []
+        components: List[List[str]] = []
+        counter = 0
+
+        for root in graph:
+            if root in index_of:
+                continue
+
+            # 调用栈：(<节点>, <下一条待访问边的下标>)
+            call_stack = [(root, 0)]
+            index_of[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+
+            while call_stack:
+                node, edge_index = call_stack[-1]
+                edges = graph[node]
+
+                if edge_index < len(edges):
+                    call_stack[-1] = (node, edge_index + 1)
+                    target = edges[edge_index][0]
+                    if target not in index_of:
+                        index_of[target] = lowlink[target] = counter
+                        counter += 1
+                        stack.append(target)
+                        on_stack.add(target)
+                        call_stack.append((target, 0))
+                    elif target in on_stack:
+                        lowlink[node] = min(lowlink[node], index_of[target])
+                    continue
+
+                call_stack.pop()
+                if call_stack:
+                    parent = call_stack[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+                if lowlink[node] == index_of[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+
+        cycles = []
+        for component in components:
+            members = frozenset(component)
+            internal_edges = [
+                (source, target, trigger_name)
+                for source in component
+                for target, trigger_name in graph[source]
+                if target in members
+            ]
+            # 单个事件且没有自环的分量不构成循环
+            if not internal_edges:
+                continue
+
+            cycles.append(EventCycle(
+                events=members,
+                triggers=tuple(sorted({trigger_name for _, _, trigger_name in internal_edges})),
+                amplifying=len(internal_edges) > len(members)
+            ))
+
+        return cycles
+
+    @staticmethod
+    def analyze(trigger_hash_tabel: Dict) -> List[EventCycle]:
+        return TriggerGraphAnalyzer.find_cycles(TriggerGraphAnalyzer.build_graph(trigger_hash_tabel))
+
+    @staticmethod
+    def check(eventBus: EventBus, trigger_hash_tabel: Dict) -> List[EventCycle]:
+        """
+        分析触发图并根据policy处理找到的循环，在事件总线被标记为已安装之前调用
+        :raise EventStormError: policy为REJECT且存在循环
+        """
+        cycles = TriggerGraphAnalyzer.analyze(trigger_hash_tabel)
+        if not cycles:
+            return cycles
+
+        policy = TriggerGraphAnalyzer.policy
+        for cycle in cycles:
+            kind = 'amplifying cycle' if cycle.amplifying else 'cycle'
+            logger.critical(f"LABELTRIGGER: event storm {kind} found, events: {sorted(cycle.events)}, "
+                            f"triggers: {list(cycle.triggers)}, policy: {policy}")
+
+        if policy == TriggerGraphAnalyzer.REJECT:
+            raise EventStormError(
+                f"trigger graph contains {len(cycles)} event cycle(s): "
+                + "; ".join(f"{sorted(cycle.events)} by {list(cycle.triggers)}" for cycle in cycles)
+            )
+
+        if policy == TriggerGraphAnalyzer.BUDGET:
+            for cycle in cycles:
+                eventBus.add_cycle_budget(cycle.events, TriggerGraphAnalyzer.cycle_budget)
+
+        return cycles
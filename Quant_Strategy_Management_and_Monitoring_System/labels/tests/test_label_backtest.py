@@ -0,0 +1,61 @@
+import pytest
+
+from api.event.event_engine import EventBus
+from labels.models.label_backtest import LabelBacktest
+from labels.models.label_trigger_manager import LabelTriggerManager
+from labels.models.labels.example_label_1 import ExampleLabel1
+from labels.models.labels.example_label_2 import ExampleLabel2
+
+
+def register(class_name: str, trigger_name: str, func, **kwargs):
+    func.__qualname__ = f"{class_name}.{trigger_name}"
+    func.__name__ = trigger_name
+    LabelTriggerManager.register_trigger(**kwargs)(func)
+
+
+def increase(self):
+    self.label_value += 1
+    self.save()
+
+
+def add_ten(self):
+    self.label_value += 10
+    self.save()
+
+
+@pytest.fixture
+def triggers(monkeypatch):
+    """在独立的trigger_hash_tabel中注册ExampleLabel1与ExampleLabel2的触发器"""
+    monkeypatch.setattr(LabelTriggerManager, 'trigger_hash_tabel', {})
+    register('ExampleLabel1', 'trigger_0', increase, listener_type=EventBus.IMMEDIATE, listen_event='tick', publish='A')
+    register('ExampleLabel2', 'trigger_0', add_ten, listener_type=EventBus.JOINT, listen_event=['A', 'B'])
+    return LabelTriggerManager.trigger_hash_tabel
+
+
+def test_backtest_does_not_use_other_users_labels(django_db, triggers):
+    # 用户1的事件引擎安装后，其标签留在trigger_hash_tabel中
+    user1_label1 = ExampleLabel1.objects.create(label_value=100)
+    user1_label2 = ExampleLabel2.objects.create(label_value=200)
+    LabelTriggerManager.install_instance(user1_label1)
+    LabelTriggerManager.install_instance(user1_label2)
+
+    # 用户2只有ExampleLabel1，不能回测，也不能借用用户1的ExampleLabel2
+    user2_label1 = ExampleLabel1.objects.create(label_value=1)
+    with pytest.raises(ValueError, match='ExampleLabel2'):
+        LabelBacktest([user2_label1])
+    assert triggers['ExampleLabel1']['instance'] is user1_label1
+    assert triggers['ExampleLabel2']['instance'] is user1_label2
+
+    user2_label2 = ExampleLabel2.objects.create(label_value=2)
+    backtest = LabelBacktest([user2_label1, user2_label2])
+    report = backtest.run(['tick', 'B', 'tick'])
+
+    assert report['labels']['ExampleLabel1']['changed'] == {'label_value': [1, 3]}
+    assert report['labels']['ExampleLabel2']['changed'] == {'label_value': [2, 12]}
+    assert backtest.eventBus.installed_labels == backtest.labels
+    # 安装后恢复原来的"instance"，两个用户的标签都没有被修改
+    assert triggers['ExampleLabel1']['instance'] is user1_label1
+    assert triggers['ExampleLabel2']['instance'] is user1_label2
+    for label, value in ((user1_label1, 100), (user1_label2, 200), (user2_label1, 1), (user2_label2, 2)):
+        label.refresh_from_db()
+        assert label.label_value == value
@@ -0,0 +1,68 @@
+import pytest
+
+from api.event.event_engine import EventBus
+from labels.models.trigger_graph_analyzer import EventStormError, TriggerGraphAnalyzer
+
+
+def trigger(listener_type: int, listen_event, publish, delay_ms=None) -> dict:
+    return {
+        "func": None,
+        "listener_args": {"listener_type": listener_type, "listen_event": listen_event, "delay_ms": delay_ms},
+        "publish": publish,
+    }
+
+
+@pytest.fixture
+def policy():
+    old_policy, old_budget = TriggerGraphAnalyzer.policy, TriggerGraphAnalyzer.cycle_budget
+    yield
+    TriggerGraphAnalyzer.policy, TriggerGraphAnalyzer.cycle_budget = old_policy, old_budget
+
+
+def test_finds_cycles_and_amplification():
+    table = {
+        'Ping': {"instance": None,
+                 "trigger_0": trigger(EventBus.IMMEDIATE, 'A', 'B'),
+                 "trigger_1": trigger(EventBus.DELAY, 'B', 'A')},
+        'Fork': {"instance": None,
+                 "trigger_0": trigger(EventBus.IMMEDIATE, 'C', 'C'),
+                 "trigger_1": trigger(EventBus.PATTERN, ['C'], 'C')},
+        # 按毫秒延迟与监听多个事件的联合触发不会使循环无限进行
+        'Heartbeat': {"instance": None,
+                      "trigger_0": trigger(EventBus.DELAY, 'D', 'D', delay_ms=1000),
+                      "trigger_1": trigger(EventBus.JOINT, ['D', 'E'], 'D')},
+    }
+    cycles = {cycle.events: cycle for cycle in TriggerGraphAnalyzer.analyze(table)}
+
+    assert set(cycles) == {frozenset({'A', 'B'}), frozenset({'C'})}
+    assert cycles[frozenset({'A', 'B'})].triggers == ('Ping.trigger_0', 'Ping.trigger_1')
+    assert not cycles[frozenset({'A', 'B'})].amplifying
+    assert cycles[frozenset({'C'})].amplifying
+
+
+def test_reject_policy_raises(policy):
+    table = {'Loop': {"instance": None, "trigger_0": trigger(EventBus.IMMEDIATE, 'A', 'A')}}
+    TriggerGraphAnalyzer.policy = TriggerGraphAnalyzer.REJECT
+    with pytest.raises(EventStormError):
+        TriggerGraphAnalyzer.check(EventBus(threaded=False), table)
+
+
+def test_budget_policy_limits_cycle(policy):
+    table = {'Ping': {"instance": None,
+                      "trigger_0": trigger(EventBus.IMMEDIATE, 'A', 'B'),
+                      "trigger_1": trigger(EventBus.IMMEDIATE, 'B', 'A')}}
+    TriggerGraphAnalyzer.policy = TriggerGraphAnalyzer.BUDGET
+    TriggerGraphAnalyzer.cycle_budget = 10
+
+    bus = EventBus(threaded=False, maxsize=0)
+    bus.add_immediate_listener('A', lambda: bus.publish('B'))
+    bus.add_immediate_listener('B', lambda: bus.publish('A'))
+    cycles = TriggerGraphAnalyzer.check(bus, table)
+    assert len(cycles) == 1 and len(bus.cycle_budgets) == 1
+
+    for _ in range(2):
+        bus.publish('A')
+        assert bus.process()
+    # 预算在每次process()开始时重置，每次只处理10个循环事件
+    assert bus.event_count == 20
+    assert bus.queue_stats()['cycle_dropped'] == 2